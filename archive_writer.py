@@ -0,0 +1,113 @@
+import collections
+import concurrent.futures
+import os
+import shutil
+import tempfile
+import zipfile
+import zlib
+
+MEDIA_SUFFIXES = ['.png', '.jpg', '.jpeg', '.car']
+CHUNK_SIZE = 1024 * 1024
+SPOOL_SIZE = 32 * 1024 * 1024
+
+
+class Compression:
+    def __init__(self, level=-1, store_media=False, workers=None):
+        if not -1 <= level <= 9:
+            raise ValueError('Compression level must be between 0 and 9, got {}'.format(level))
+        self.level = level
+        self.store_media = store_media
+        self.workers = workers or os.cpu_count() or 1
+
+    def compress_type(self, name, compress_type=zipfile.ZIP_DEFLATED):
+        if self.level == 0:
+            return zipfile.ZIP_STORED
+        if self.store_media and os.path.splitext(name)[1].lower() in MEDIA_SUFFIXES:
+            return zipfile.ZIP_STORED
+        return compress_type
+
+
+def compress_file(path, arcname, compress_type, level):
+    # Compressed output is spooled to disk past SPOOL_SIZE so large entries never sit in memory whole.
+    zinfo = zipfile.ZipInfo.from_file(path, arcname)
+    if compress_type != zipfile.ZIP_DEFLATED:
+        compress_type = zipfile.ZIP_STORED
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15) if compress_type == zipfile.ZIP_DEFLATED else None
+    data = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    crc = 0
+    file_size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+            file_size += len(chunk)
+            data.write(compressor.compress(chunk) if compressor else chunk)
+    if compressor:
+        data.write(compressor.flush())
+    zinfo.compress_type = compress_type
+    zinfo.file_size = file_size
+    zinfo.CRC = crc
+    zinfo.compress_size = data.tell()
+    data.seek(0)
+    return zinfo, data
+
+
+class ArchiveWriter:
+    # Deflates entries on a thread pool (zlib releases the GIL) and appends them to a ZipFile in submission order,
+    # so the central directory lists entries in the same order they were added.
+    def __init__(self, out, compression=None):
+        self.out = out
+        self.compression = compression or Compression()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.compression.workers)
+        self.pending = collections.deque()
+        self.window = self.compression.workers * 2
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+            for kind, value, _ in self.pending:
+                if kind == 'file' and value.done() and not value.cancelled() and value.exception() is None:
+                    value.result()[1].close()
+            self.pending.clear()
+
+    def write(self, path, arcname, compress_type=zipfile.ZIP_DEFLATED):
+        if os.path.isdir(path):
+            self.pending.append(('directory', path, arcname))
+        else:
+            compress_type = self.compression.compress_type(arcname, compress_type)
+            future = self.executor.submit(compress_file, path, arcname, compress_type, self.compression.level)
+            self.pending.append(('file', future, arcname))
+        self.drain(self.window)
+
+    def append(self, append_entry, *args):
+        # Raw entries copied from the source archive are queued too, to keep them in order with compressed ones.
+        self.pending.append(('raw', append_entry, args))
+        self.drain(self.window)
+
+    def drain(self, keep):
+        while len(self.pending) > keep or (self.pending and self.pending[0][0] != 'file'):
+            kind, value, extra = self.pending.popleft()
+            if kind == 'directory':
+                self.out.write(value, arcname=extra)
+            elif kind == 'raw':
+                value(self.out, *extra)
+            else:
+                zinfo, data = value.result()
+                self.write_compressed(zinfo, data)
+
+    def flush(self):
+        self.drain(0)
+
+    def write_compressed(self, zinfo, data):
+        zinfo.header_offset = self.out.fp.tell()
+        self.out.fp.write(zinfo.FileHeader())
+        with data:
+            shutil.copyfileobj(data, self.out.fp, CHUNK_SIZE)
+        self.out.filelist.append(zinfo)
+        self.out.NameToInfo[zinfo.filename] = zinfo
+        self.out.start_dir = self.out.fp.tell()
@@ -0,0 +1,128 @@
+import concurrent.futures
+import json
+import pathlib
+import tempfile
+import threading
+import time
+
+import runner
+import staging
+
+from ipa_rewriter import IpaRewriter
+from mobileprovision import Mobileprovision
+
+
+class BatchJob:
+    def __init__(self, input_path, profile_path, output_path, entitlements=None):
+        self.input_path = pathlib.Path(input_path)
+        self.profile_path = pathlib.Path(profile_path)
+        self.output_path = pathlib.Path(output_path)
+        self.entitlements = entitlements or {}
+
+    @staticmethod
+    def from_dict(entry, base_dir):
+        missing = [key for key in ['input', 'profile', 'output'] if key not in entry]
+        if missing:
+            raise Exception('Batch job {} is missing {}'.format(entry, ', '.join(missing)))
+        return BatchJob(base_dir.joinpath(entry['input']),
+                        base_dir.joinpath(entry['profile']),
+                        base_dir.joinpath(entry['output']),
+                        entitlements=entry.get('entitlements'))
+
+
+class BatchRunner:
+    def __init__(self, resign, workers=2, jobs=None, verify_profiles=False, cache=None, load_profile=None):
+        self.resign = resign
+        self.load_profile = load_profile
+        self.cache = cache
+        self.workers = workers
+        self.jobs = jobs
+        self.verify_profiles = verify_profiles
+        self.lock = threading.Lock()
+        self.mobileprovisions = {}
+        self.extractions = {}
+        self.staging_root = None
+
+    @staticmethod
+    def load_manifest(manifest_path):
+        manifest_path = pathlib.Path(manifest_path).resolve()
+        with open(manifest_path, 'r') as f:
+            if manifest_path.suffix in ['.yaml', '.yml']:
+                try:
+                    import yaml
+                except ImportError:
+                    raise Exception('Reading {} requires PyYAML'.format(manifest_path.name))
+                manifest = yaml.safe_load(f)
+            else:
+                manifest = json.load(f)
+
+        if isinstance(manifest, dict):
+            manifest = manifest.get('jobs', [])
+        return [BatchJob.from_dict(entry, manifest_path.parent) for entry in manifest]
+
+    def mobileprovision(self, profile_path):
+        if self.load_profile:
+            return self.load_profile(profile_path)
+        profile_path = profile_path.resolve()
+        with self.lock:
+            if profile_path not in self.mobileprovisions:
+                self.mobileprovisions[profile_path] = Mobileprovision(profile_path, verify=self.verify_profiles)
+            mobileprovision = self.mobileprovisions[profile_path]
+        mobileprovision.plist()
+        return mobileprovision
+
+    def extraction(self, app_path):
+        app_path = app_path.resolve()
+        with self.lock:
+            if app_path not in self.extractions:
+                self.extractions[app_path] = (threading.Lock(), IpaRewriter(app_path))
+            extraction_lock, rewriter = self.extractions[app_path]
+
+        with extraction_lock:
+            if rewriter.root is None:
+                destination = tempfile.mkdtemp(prefix=app_path.stem + '-', dir=self.staging_root)
+                rewriter.extract(destination)
+        return rewriter
+
+    def stage(self, app_path, temp_app_path):
+        if app_path.suffix == '.ipa':
+            return self.extraction(app_path).clone(temp_app_path)
+
+        staging.stage_tree(app_path, temp_app_path)
+        return None
+
+    def run_job(self, job):
+        started = time.monotonic()
+        result = {
+            'input': job.input_path.as_posix(),
+            'profile': job.profile_path.as_posix(),
+            'output': job.output_path.as_posix(),
+        }
+        try:
+            mobileprovision = self.mobileprovision(job.profile_path)
+            entitlements = dict(mobileprovision.entitlements())
+            entitlements.update(job.entitlements)
+            self.resign(job.input_path, mobileprovision, job.output_path,
+                        jobs=self.jobs, entitlements=entitlements, stage=self.stage, cache=self.cache)
+            result['status'] = 'succeeded'
+        except Exception as e:
+            result['status'] = 'failed'
+            result['error'] = str(e)
+        result['seconds'] = round(time.monotonic() - started, 3)
+        return result
+
+    def run(self, jobs):
+        started = time.monotonic()
+        with tempfile.TemporaryDirectory(prefix='iresign-batch-') as t:
+            self.staging_root = pathlib.Path(t)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+                results = [future.result() for future in [runner.submit(executor, self.run_job, job) for job in jobs]]
+            self.extractions = {}
+            self.staging_root = None
+
+        return {
+            'jobs': results,
+            'succeeded': sum(1 for result in results if result['status'] == 'succeeded'),
+            'failed': sum(1 for result in results if result['status'] == 'failed'),
+            'seconds': round(time.monotonic() - started, 3),
+        }
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import pathlib
+import platform
+import plistlib
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+import der
+
+from cms import OID_DATA, OID_SIGNED_DATA
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent
+FAKE_SIGNER_HASH = 'D14B0D8B333BE0451C9CF1E88F14D99087435623'
+
+FAKE_TOOL_PRELUDE = '''#!{python}
+import hashlib
+import os
+import pathlib
+import sys
+import time
+
+time.sleep(float(os.environ.get('IRESIGN_FAKE_LATENCY', '0')))
+args = sys.argv[1:]
+'''
+
+FAKE_TOOLS = {
+    'xcrun': '''
+if '--find' in args:
+    print(pathlib.Path(__file__).parent.joinpath(args[args.index('--find') + 1]))
+elif '--show-sdk-platform-path' in args:
+    print('/Applications/Xcode.app/Contents/Developer/Platforms/iPhoneOS.platform')
+else:
+    sys.exit(1)
+''',
+    'codesign': '''
+if '-d' in args or '--display' in args or '-v' in args or '--verify' in args:
+    sys.exit(0)
+target = pathlib.Path(args[-1])
+if target.is_dir():
+    digest = hashlib.sha256()
+    for path in sorted(target.rglob('*')):
+        if path.is_file() and '_CodeSignature' not in path.parts:
+            digest.update(path.relative_to(target).as_posix().encode())
+            digest.update(hashlib.sha256(path.read_bytes()).digest())
+    signature_dir = target.joinpath('_CodeSignature')
+    signature_dir.mkdir(exist_ok=True)
+    signature_dir.joinpath('CodeResources').write_text(digest.hexdigest())
+else:
+    with open(target, 'ab') as f:
+        f.write(hashlib.sha256(target.read_bytes()).digest())
+''',
+    'codesign_allocate': '''
+sys.exit(0)
+''',
+    'security': '''
+command = args[0] if args else ''
+if command == 'list-keychains':
+    if '-s' not in args:
+        print('    "{}"'.format(pathlib.Path.home().joinpath('Library', 'Keychains', 'login.keychain-db')))
+elif command == 'find-identity':
+    print('  1) {} "iPhone Distribution: Benchmark"'.format('{signer_hash}'))
+    print('     1 valid identities found')
+elif command == 'create-keychain':
+    pathlib.Path(args[-1]).touch()
+elif command == 'delete-keychain':
+    pathlib.Path(args[-1]).unlink()
+'''.replace('{signer_hash}', FAKE_SIGNER_HASH),
+}
+
+
+def install_fake_tools(bin_dir):
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    for name, body in FAKE_TOOLS.items():
+        path = bin_dir.joinpath(name)
+        path.write_text(FAKE_TOOL_PRELUDE.format(python=sys.executable) + body)
+        path.chmod(0o755)
+    return bin_dir
+
+
+def fake_mobileprovision(path, bundle_id='com.example.benchmark', team_id='ABCDE12345'):
+    plist = plistlib.dumps({
+        'AppIDName': 'Benchmark',
+        'DeveloperCertificates': [b'benchmark certificate'],
+        'Entitlements': {
+            'application-identifier': team_id + '.' + bundle_id,
+            'com.apple.developer.team-identifier': team_id,
+            'get-task-allow': False,
+        },
+        'ExpirationDate': datetime.datetime(2099, 1, 1),
+        'Name': 'Benchmark',
+        'TeamIdentifier': [team_id],
+        'UUID': '00000000-0000-0000-0000-000000000000',
+    })
+    sha256 = der.sequence(der.oid('2.16.840.1.101.3.4.2.1'))
+    encapsulated = der.sequence(der.oid(OID_DATA), der.explicit(0, der.octet_string(plist)))
+    signed_data = der.sequence(der.integer(1), der.set_of(sha256), encapsulated, der.set_of())
+    path.write_bytes(der.sequence(der.oid(OID_SIGNED_DATA), der.explicit(0, signed_data)))
+    return path
+
+
+def fake_macho(size, rng):
+    return b'\xcf\xfa\xed\xfe' + rng.randbytes(max(0, size - 4))
+
+
+def write_info_plist(bundle, identifier, executable):
+    with open(bundle.joinpath('Info.plist'), 'wb') as f:
+        plistlib.dump({'CFBundleIdentifier': identifier, 'CFBundleExecutable': executable}, f)
+
+
+def generate_app(root, frameworks=10, appex_depth=1, resources=100, resource_size=4096, seed=0):
+    rng = random.Random(seed)
+    app = root.joinpath('Payload', 'Benchmark.app')
+    app.mkdir(parents=True)
+    write_info_plist(app, 'com.example.benchmark', 'Benchmark')
+    app.joinpath('Benchmark').write_bytes(fake_macho(256 * 1024, rng))
+    app.joinpath('_CodeSignature').mkdir()
+    app.joinpath('_CodeSignature', 'CodeResources').write_bytes(b'stale seal')
+    app.joinpath('embedded.mobileprovision').write_bytes(b'stale profile')
+
+    frameworks_dir = app.joinpath('Frameworks')
+    frameworks_dir.mkdir()
+    for i in range(frameworks):
+        if i % 2:
+            frameworks_dir.joinpath('libBenchmark{}.dylib'.format(i)).write_bytes(fake_macho(64 * 1024, rng))
+            continue
+        framework = frameworks_dir.joinpath('Benchmark{}.framework'.format(i))
+        framework.mkdir()
+        write_info_plist(framework, 'com.example.benchmark.framework{}'.format(i), 'Benchmark{}'.format(i))
+        framework.joinpath('Benchmark{}'.format(i)).write_bytes(fake_macho(128 * 1024, rng))
+
+    container = app
+    for depth in range(appex_depth):
+        appex = container.joinpath('PlugIns', 'Extension{}.appex'.format(depth))
+        appex.mkdir(parents=True)
+        write_info_plist(appex, 'com.example.benchmark.extension{}'.format(depth), 'Extension{}'.format(depth))
+        appex.joinpath('Extension{}'.format(depth)).write_bytes(fake_macho(64 * 1024, rng))
+        container = appex
+
+    resources_dir = app.joinpath('Resources')
+    for i in range(resources):
+        resource_dir = resources_dir.joinpath('group{}'.format(i % 64))
+        resource_dir.mkdir(parents=True, exist_ok=True)
+        suffix = ['.png', '.nib', '.strings', '.car'][i % 4]
+        resource_dir.joinpath('resource{}{}'.format(i, suffix)).write_bytes(rng.randbytes(resource_size))
+
+    return app
+
+
+def generate_ipa(path, staging_root, **shape):
+    generate_app(staging_root, **shape)
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        for item in sorted(staging_root.rglob('*')):
+            z.write(item, arcname=item.relative_to(staging_root).as_posix())
+    return path
+
+
+def stage_seconds(trace_path):
+    with open(trace_path, 'r') as f:
+        trace = json.load(f)
+    stages = {}
+    for event in trace['traceEvents']:
+        if event['cat'] == 'stage':
+            stages[event['name']] = stages.get(event['name'], 0.0) + event['dur'] / 1e6
+    return stages
+
+
+def run_iresign(ipa_path, profile_path, output_path, jobs, env, trace_path):
+    iresign_cmd = [sys.executable, REPO_ROOT.joinpath('iresign.py').as_posix(),
+                   '--app', ipa_path.as_posix(),
+                   '-p', profile_path.as_posix(),
+                   '-o', output_path.as_posix(),
+                   '--jobs', str(jobs),
+                   '--profile-trace', trace_path.as_posix()]
+    started = time.perf_counter()
+    subprocess.run(iresign_cmd, check=True, env=env)
+    return time.perf_counter() - started
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(shapes, job_counts, repeat, latency):
+    results = []
+    with tempfile.TemporaryDirectory(prefix='iresign-benchmark-') as t:
+        work_dir = pathlib.Path(t)
+        bin_dir = install_fake_tools(work_dir.joinpath('bin'))
+        profile_path = fake_mobileprovision(work_dir.joinpath('benchmark.mobileprovision'))
+        env = dict(os.environ)
+        env['PATH'] = bin_dir.as_posix() + os.pathsep + env.get('PATH', '')
+        env['HOME'] = work_dir.as_posix()
+        env['IRESIGN_FAKE_LATENCY'] = str(latency)
+        env['IRESIGN_TOOLCHAIN_CACHE'] = ''
+
+        for shape_number, shape in enumerate(shapes):
+            shape_dir = work_dir.joinpath('shape{}'.format(shape_number))
+            ipa_path = generate_ipa(shape_dir.joinpath('Benchmark.ipa'), shape_dir.joinpath('staging'), **shape)
+            for jobs in job_counts:
+                timings = []
+                stages = []
+                for attempt in range(repeat):
+                    output_path = shape_dir.joinpath('resigned-{}-{}.ipa'.format(jobs, attempt))
+                    trace_path = shape_dir.joinpath('trace-{}-{}.json'.format(jobs, attempt))
+                    timings.append(run_iresign(ipa_path, profile_path, output_path, jobs, env, trace_path))
+                    stages.append(stage_seconds(trace_path))
+                    output_path.unlink()
+                stage_names = sorted({name for attempt in stages for name in attempt})
+                results.append({
+                    'shape': shape,
+                    'ipa_bytes': ipa_path.stat().st_size,
+                    'jobs': jobs,
+                    'seconds': statistics.median(timings),
+                    'runs': timings,
+                    'stages': {name: statistics.median(attempt.get(name, 0.0) for attempt in stages)
+                               for name in stage_names},
+                })
+                sys.stderr.write('frameworks={frameworks} appex_depth={appex_depth} resources={resources} '
+                                 'resource_size={resource_size} jobs={jobs}: {seconds:.3f}s\n'.format(
+                                     jobs=jobs, seconds=results[-1]['seconds'], **shape))
+    return results
+
+
+def result_key(result):
+    shape = result['shape']
+    return json.dumps(shape, sort_keys=True) + ':' + str(result['jobs'])
+
+
+def compare(baseline, current, threshold):
+    baseline_results = {result_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        previous = baseline_results.get(result_key(result))
+        if not previous:
+            continue
+        ratio = result['seconds'] / previous['seconds'] if previous['seconds'] else 1.0
+        sys.stderr.write('{}: {:.3f}s -> {:.3f}s ({:+.1%})\n'.format(
+            result_key(result), previous['seconds'], result['seconds'], ratio - 1))
+        if ratio > 1 + threshold:
+            regressions.append(result_key(result))
+    return regressions
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark iresign.py against synthetic bundles and stand-in tools')
+    parser.add_argument('--frameworks', type=int_list, default=[4, 40],
+                        help='comma separated numbers of embedded frameworks and dylibs')
+    parser.add_argument('--appex-depth', type=int_list, default=[1],
+                        help='comma separated depths of nested app extensions')
+    parser.add_argument('--resources', type=int_list, default=[100, 2000],
+                        help='comma separated numbers of resource files')
+    parser.add_argument('--resource-size', type=int_list, default=[4096],
+                        help='comma separated resource file sizes in bytes')
+    parser.add_argument('-j', '--jobs', type=int_list, default=[1, 4],
+                        help='comma separated signing worker counts')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per configuration, the median is reported')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='simulated seconds per stand-in tool invocation')
+    parser.add_argument('-o', '--output', dest='output',
+                        help='write results as JSON to this path')
+    parser.add_argument('--compare', dest='compare',
+                        help='baseline JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='fractional slowdown against the baseline that counts as a regression')
+    args = parser.parse_args()
+
+    shapes = [{'frameworks': frameworks, 'appex_depth': appex_depth, 'resources': resources,
+               'resource_size': resource_size}
+              for frameworks, appex_depth, resources, resource_size in itertools.product(
+                  args.frameworks, args.appex_depth, args.resources, args.resource_size)]
+
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'latency': args.latency,
+        'results': run_benchmarks(shapes, args.jobs, args.repeat, args.latency),
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            sys.stderr.write('Regressions: {}\n'.format(', '.join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
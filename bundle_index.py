@@ -0,0 +1,91 @@
+import os
+import pathlib
+
+
+class BundleIndex:
+    APP = 'app'
+    APPEX = 'appex'
+    FRAMEWORK = 'framework'
+    DYLIB = 'dylib'
+    SIGNATURE_ARTIFACT = 'signature-artifact'
+    PROFILE = 'profile'
+    RESOURCE = 'resource'
+    DIRECTORY = 'directory'
+
+    SIGNABLE_KINDS = (APPEX, FRAMEWORK, DYLIB)
+
+    def __init__(self, root):
+        self.root = pathlib.Path(root)
+        self.entries = {}
+        self.scan()
+
+    @staticmethod
+    def classify(name, is_dir):
+        if name == '_CodeSignature' or name == 'CodeResources':
+            return BundleIndex.SIGNATURE_ARTIFACT
+        if name.endswith('.mobileprovision'):
+            return BundleIndex.PROFILE
+        if name.endswith('.dylib'):
+            return BundleIndex.DYLIB
+        if is_dir:
+            if name.endswith('.app'):
+                return BundleIndex.APP
+            if name.endswith('.appex'):
+                return BundleIndex.APPEX
+            if name.endswith('.framework'):
+                return BundleIndex.FRAMEWORK
+            return BundleIndex.DIRECTORY
+        return BundleIndex.RESOURCE
+
+    def scan(self):
+        self.entries = {}
+        self.walk(self.root)
+
+    def walk(self, directory):
+        pending = [directory]
+        while pending:
+            current = pending.pop()
+            with os.scandir(current) as it:
+                for entry in it:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    path = pathlib.Path(entry.path)
+                    self.entries[path] = BundleIndex.classify(entry.name, is_dir)
+                    if is_dir:
+                        pending.append(entry.path)
+
+    def paths(self, *kinds):
+        return sorted(path for path, kind in self.entries.items() if kind in kinds)
+
+    def all_paths(self):
+        return sorted(self.entries)
+
+    def kind(self, path):
+        return self.entries.get(pathlib.Path(path))
+
+    def app_paths(self):
+        return self.paths(BundleIndex.APP)
+
+    def codesign_elements(self):
+        return self.paths(*BundleIndex.SIGNABLE_KINDS)
+
+    def codesign_artifacts(self):
+        return self.paths(BundleIndex.SIGNATURE_ARTIFACT, BundleIndex.PROFILE)
+
+    def add(self, path):
+        path = pathlib.Path(path)
+        is_dir = path.is_dir() and not path.is_symlink()
+        self.entries[path] = BundleIndex.classify(path.name, is_dir)
+        if is_dir:
+            self.walk(path)
+
+    def remove(self, *paths):
+        removed = {pathlib.Path(path) for path in paths}
+        for path in list(self.entries):
+            if path in removed or not removed.isdisjoint(path.parents):
+                del self.entries[path]
+
+    def refresh(self, *paths):
+        self.remove(*paths)
+        for path in paths:
+            if os.path.lexists(path):
+                self.add(path)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
-from keychains import Keychains
+from keychains import Keychains, KeychainSearchList
 
-Keychains.cleanup_keychain_search(only_user_keychains=False)
+with KeychainSearchList() as search:
+    Keychains.cleanup_keychain_search(only_user_keychains=False, search=search)
 
@@ -0,0 +1,198 @@
+import datetime
+import hashlib
+
+import der
+
+OID_DATA = '1.2.840.113549.1.7.1'
+OID_SIGNED_DATA = '1.2.840.113549.1.7.2'
+OID_CONTENT_TYPE = '1.2.840.113549.1.9.3'
+OID_MESSAGE_DIGEST = '1.2.840.113549.1.9.4'
+OID_SIGNING_TIME = '1.2.840.113549.1.9.5'
+
+OID_SHA256 = '2.16.840.1.101.3.4.2.1'
+OID_RSA_ENCRYPTION = '1.2.840.113549.1.1.1'
+OID_ECDSA_WITH_SHA256 = '1.2.840.10045.4.3.2'
+
+DIGEST_ALGORITHMS = {
+    '1.3.14.3.2.26': 'sha1',
+    '2.16.840.1.101.3.4.2.1': 'sha256',
+    '2.16.840.1.101.3.4.2.2': 'sha384',
+    '2.16.840.1.101.3.4.2.3': 'sha512',
+}
+
+
+class CmsError(Exception):
+    pass
+
+
+class SignerInfo:
+    def __init__(self, element, source):
+        self.issuer = None
+        self.serial_number = None
+        self.subject_key_identifier = None
+        self.signed_attributes = {}
+        self.signed_attributes_der = None
+
+        fields = list(element.children)
+        sid = fields[1]
+        if sid.is_a(der.TAG_SEQUENCE):
+            self.issuer = sid[0].encoded(source)
+            self.serial_number = sid[1].integer()
+        else:
+            self.subject_key_identifier = sid.octets()
+
+        self.digest_algorithm = fields[2][0].oid()
+        remaining = fields[3:]
+        if remaining and remaining[0].is_a(0, der.CLASS_CONTEXT):
+            attributes = remaining.pop(0)
+            # The signature covers the attributes re-tagged as a DER SET OF.
+            self.signed_attributes_der = bytes([0x31]) + bytes(attributes.encoded(source)[1:])
+            for attribute in attributes.children:
+                self.signed_attributes[attribute[0].oid()] = [value for value in attribute[1].children]
+        self.signature_algorithm = remaining[0][0].oid()
+        self.signature = remaining[1].octets()
+
+    def message_digest(self):
+        values = self.signed_attributes.get(OID_MESSAGE_DIGEST)
+        if not values:
+            return None
+        return values[0].octets()
+
+
+class SignedData:
+    def __init__(self, data):
+        self.data = data
+        self.certificates = []
+        self.signers = []
+        try:
+            content_info = der.parse(data)
+            if content_info[0].oid() != OID_SIGNED_DATA:
+                raise CmsError('Not a CMS SignedData envelope: {}'.format(content_info[0].oid()))
+            signed_data = content_info[1][0]
+
+            fields = list(signed_data.children)
+            encapsulated = fields[2]
+            self.content_type = encapsulated[0].oid()
+            self.content = encapsulated[1][0].octets() if len(encapsulated) > 1 else None
+
+            for field in fields[3:]:
+                if field.is_a(0, der.CLASS_CONTEXT):
+                    self.certificates = [bytes(cert.encoded(data)) for cert in field.children]
+                elif field.is_a(der.TAG_SET):
+                    self.signers = [SignerInfo(signer, data) for signer in field.children]
+        except (der.DerError, IndexError, TypeError) as e:
+            raise CmsError('Malformed CMS envelope: {}'.format(e))
+
+    def signer_certificate(self, signer):
+        from cryptography import x509
+
+        for certificate in self.certificates:
+            cert = x509.load_der_x509_certificate(certificate)
+            if signer.serial_number is not None:
+                if cert.serial_number == signer.serial_number and \
+                        cert.issuer.public_bytes() == bytes(signer.issuer):
+                    return cert
+            else:
+                try:
+                    ski = cert.extensions.get_extension_for_class(x509.SubjectKeyIdentifier)
+                except x509.ExtensionNotFound:
+                    continue
+                if ski.value.digest == signer.subject_key_identifier:
+                    return cert
+        raise CmsError('Signer certificate is not included in the CMS envelope')
+
+    def verify(self, detached_content=None):
+        # Integrity only: signers are checked against certificates inside the envelope, not chained to a root.
+        content = self.content if self.content is not None else detached_content
+        if content is None:
+            raise CmsError('Detached CMS signature needs the signed content to verify')
+        if not self.signers:
+            raise CmsError('CMS envelope has no signers')
+
+        try:
+            from cryptography.exceptions import InvalidSignature
+            from cryptography.hazmat.primitives import hashes
+            from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+        except ImportError:
+            raise CmsError('Verifying CMS signatures requires the cryptography package')
+
+        for signer in self.signers:
+            digest_name = DIGEST_ALGORITHMS.get(signer.digest_algorithm)
+            if digest_name is None:
+                raise CmsError('Unsupported digest algorithm {}'.format(signer.digest_algorithm))
+
+            signed_bytes = content
+            if signer.signed_attributes_der is not None:
+                content_digest = hashlib.new(digest_name, content).digest()
+                if signer.message_digest() != content_digest:
+                    raise CmsError('CMS message digest does not match the content')
+                signed_bytes = signer.signed_attributes_der
+
+            public_key = self.signer_certificate(signer).public_key()
+            algorithm = getattr(hashes, digest_name.upper())()
+            try:
+                if isinstance(public_key, rsa.RSAPublicKey):
+                    public_key.verify(signer.signature, signed_bytes, padding.PKCS1v15(), algorithm)
+                elif isinstance(public_key, ec.EllipticCurvePublicKey):
+                    public_key.verify(signer.signature, signed_bytes, ec.ECDSA(algorithm))
+                else:
+                    raise CmsError('Unsupported signer key type {}'.format(type(public_key).__name__))
+            except InvalidSignature:
+                raise CmsError('CMS signature verification failed')
+
+
+def decode(data, verify=False):
+    signed_data = SignedData(data)
+    if verify:
+        signed_data.verify()
+    if signed_data.content is None:
+        raise CmsError('CMS envelope has no embedded content')
+    return signed_data.content
+
+
+def attribute(oid, *values):
+    return der.sequence(der.oid(oid), der.set_of(*values))
+
+
+def sign_detached(content, private_key, certificate, chain=(), attributes=(), signing_time=None):
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+
+    if signing_time is None:
+        signing_time = datetime.datetime.now(datetime.timezone.utc)
+
+    signed_attributes = [
+        attribute(OID_CONTENT_TYPE, der.oid(OID_DATA)),
+        attribute(OID_SIGNING_TIME, der.utc_time(signing_time)),
+        attribute(OID_MESSAGE_DIGEST, der.octet_string(hashlib.sha256(content).digest())),
+    ]
+    signed_attributes.extend(attributes)
+    signed_attributes_der = der.set_of(*signed_attributes)
+
+    if isinstance(private_key, rsa.RSAPrivateKey):
+        signature = private_key.sign(signed_attributes_der, padding.PKCS1v15(), hashes.SHA256())
+        signature_algorithm = der.sequence(der.oid(OID_RSA_ENCRYPTION), der.null())
+    elif isinstance(private_key, ec.EllipticCurvePrivateKey):
+        signature = private_key.sign(signed_attributes_der, ec.ECDSA(hashes.SHA256()))
+        signature_algorithm = der.sequence(der.oid(OID_ECDSA_WITH_SHA256))
+    else:
+        raise CmsError('Unsupported signing key type {}'.format(type(private_key).__name__))
+
+    sha256 = der.sequence(der.oid(OID_SHA256))
+    issuer_and_serial = der.sequence(certificate.issuer.public_bytes(), der.integer(certificate.serial_number))
+    signer_info = der.sequence(
+        der.integer(1),
+        issuer_and_serial,
+        sha256,
+        b'\xa0' + signed_attributes_der[1:],
+        signature_algorithm,
+        der.octet_string(signature))
+
+    certificates = [cert.public_bytes(serialization.Encoding.DER) for cert in [certificate] + list(chain)]
+    signed_data = der.sequence(
+        der.integer(1),
+        der.set_of(sha256),
+        der.sequence(der.oid(OID_DATA)),
+        der.implicit(0, b''.join(certificates), constructed=True),
+        der.set_of(signer_info))
+    return der.sequence(der.oid(OID_SIGNED_DATA), der.explicit(0, signed_data))
@@ -0,0 +1,221 @@
+CLASS_UNIVERSAL = 0x00
+CLASS_APPLICATION = 0x40
+CLASS_CONTEXT = 0x80
+
+TAG_BOOLEAN = 0x01
+TAG_INTEGER = 0x02
+TAG_BIT_STRING = 0x03
+TAG_OCTET_STRING = 0x04
+TAG_NULL = 0x05
+TAG_OID = 0x06
+TAG_UTF8_STRING = 0x0c
+TAG_SEQUENCE = 0x10
+TAG_SET = 0x11
+TAG_PRINTABLE_STRING = 0x13
+TAG_UTC_TIME = 0x17
+
+
+class DerError(Exception):
+    pass
+
+
+class Element:
+    def __init__(self, tag_class, constructed, tag, data, start, header_length, end, children=None):
+        self.tag_class = tag_class
+        self.constructed = constructed
+        self.tag = tag
+        self.data = data
+        self.start = start
+        self.header_length = header_length
+        self.end = end
+        self.children = children
+
+    def __repr__(self):
+        return 'Element(class={:#x}, tag={}, constructed={})'.format(self.tag_class, self.tag, self.constructed)
+
+    def __getitem__(self, index):
+        if self.children is None:
+            raise DerError('Element with tag {} is primitive'.format(self.tag))
+        return self.children[index]
+
+    def __len__(self):
+        return len(self.children) if self.children is not None else 0
+
+    def is_a(self, tag, tag_class=CLASS_UNIVERSAL):
+        return self.tag == tag and self.tag_class == tag_class
+
+    def encoded(self, source):
+        return source[self.start:self.end]
+
+    def octets(self):
+        if not self.constructed:
+            return self.data
+        return b''.join(child.octets() for child in self.children)
+
+    def oid(self):
+        if not self.is_a(TAG_OID):
+            raise DerError('Expected an OBJECT IDENTIFIER, found tag {}'.format(self.tag))
+        return decode_oid(self.data)
+
+    def integer(self):
+        return int.from_bytes(self.data, 'big', signed=True)
+
+
+def decode_oid(data):
+    values = []
+    value = 0
+    for byte in data:
+        value = (value << 7) | (byte & 0x7f)
+        if not byte & 0x80:
+            values.append(value)
+            value = 0
+    if not values:
+        raise DerError('Empty OBJECT IDENTIFIER')
+    first = min(values[0] // 40, 2)
+    return '.'.join(str(v) for v in [first, values[0] - first * 40] + values[1:])
+
+
+def parse(data, offset=0, end=None):
+    if end is None:
+        end = len(data)
+    element, _ = parse_element(data, offset, end)
+    return element
+
+
+def parse_element(data, offset, end):
+    start = offset
+    if offset >= end:
+        raise DerError('Truncated element at offset {}'.format(offset))
+
+    identifier = data[offset]
+    offset += 1
+    tag_class = identifier & 0xc0
+    constructed = bool(identifier & 0x20)
+    tag = identifier & 0x1f
+    if tag == 0x1f:
+        tag = 0
+        while True:
+            if offset >= end:
+                raise DerError('Truncated tag at offset {}'.format(start))
+            byte = data[offset]
+            offset += 1
+            tag = (tag << 7) | (byte & 0x7f)
+            if not byte & 0x80:
+                break
+
+    if offset >= end:
+        raise DerError('Truncated length at offset {}'.format(start))
+    length_byte = data[offset]
+    offset += 1
+    indefinite = False
+    if length_byte == 0x80:
+        indefinite = True
+        length = None
+    elif length_byte & 0x80:
+        count = length_byte & 0x7f
+        if offset + count > end:
+            raise DerError('Truncated length at offset {}'.format(start))
+        length = int.from_bytes(data[offset:offset + count], 'big')
+        offset += count
+    else:
+        length = length_byte
+    header_length = offset - start
+
+    if indefinite:
+        if not constructed:
+            raise DerError('Indefinite length on primitive element at offset {}'.format(start))
+        children = []
+        while True:
+            # The end-of-contents marker has to sit inside the parent, not in whatever follows it.
+            if offset + 2 > end:
+                raise DerError('Indefinite length element at offset {} overruns its container'.format(start))
+            if data[offset:offset + 2] == b'\x00\x00':
+                offset += 2
+                break
+            child, offset = parse_element(data, offset, end)
+            children.append(child)
+        return Element(tag_class, constructed, tag, None, start, header_length, offset, children), offset
+
+    content_end = offset + length
+    if content_end > end:
+        raise DerError('Element at offset {} overruns its container'.format(start))
+
+    if constructed:
+        children = []
+        while offset < content_end:
+            child, offset = parse_element(data, offset, content_end)
+            children.append(child)
+        return Element(tag_class, constructed, tag, None, start, header_length, content_end, children), content_end
+
+    value = bytes(data[offset:content_end])
+    return Element(tag_class, constructed, tag, value, start, header_length, content_end), content_end
+
+
+def encode_length(length):
+    if length < 0x80:
+        return bytes([length])
+    encoded = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+    return bytes([0x80 | len(encoded)]) + encoded
+
+
+def encode(tag, content, tag_class=CLASS_UNIVERSAL, constructed=False):
+    if tag >= 0x1f:
+        raise DerError('High tag numbers are not supported: {}'.format(tag))
+    identifier = tag_class | (0x20 if constructed else 0) | tag
+    return bytes([identifier]) + encode_length(len(content)) + content
+
+
+def sequence(*elements):
+    return encode(TAG_SEQUENCE, b''.join(elements), constructed=True)
+
+
+def set_of(*elements):
+    return encode(TAG_SET, b''.join(sorted(elements)), constructed=True)
+
+
+def explicit(number, *elements):
+    return encode(number, b''.join(elements), tag_class=CLASS_CONTEXT, constructed=True)
+
+
+def implicit(number, content, constructed=False):
+    return encode(number, content, tag_class=CLASS_CONTEXT, constructed=constructed)
+
+
+def integer(value):
+    length = max(1, (value.bit_length() + 8) // 8)
+    return encode(TAG_INTEGER, value.to_bytes(length, 'big', signed=True))
+
+
+def boolean(value):
+    return encode(TAG_BOOLEAN, b'\xff' if value else b'\x00')
+
+
+def null():
+    return encode(TAG_NULL, b'')
+
+
+def octet_string(value):
+    return encode(TAG_OCTET_STRING, value)
+
+
+def utf8_string(value):
+    return encode(TAG_UTF8_STRING, value.encode('utf-8'))
+
+
+def utc_time(value):
+    return encode(TAG_UTC_TIME, value.strftime('%y%m%d%H%M%SZ').encode('ascii'))
+
+
+def oid(dotted):
+    values = [int(v) for v in dotted.split('.')]
+    if len(values) < 2:
+        raise DerError('OBJECT IDENTIFIER {} needs at least two arcs'.format(dotted))
+    encoded = bytearray()
+    for value in [values[0] * 40 + values[1]] + values[2:]:
+        chunk = [value & 0x7f]
+        value >>= 7
+        while value:
+            chunk.append(0x80 | (value & 0x7f))
+            value >>= 7
+        encoded.extend(reversed(chunk))
+    return encode(TAG_OID, bytes(encoded))
@@ -0,0 +1,269 @@
+import concurrent.futures
+import fnmatch
+import hashlib
+import json
+import mmap
+import os
+import pathlib
+import plistlib
+import struct
+import tempfile
+import threading
+
+import macho
+import runner
+
+APPLICATION_IDENTIFIER = 'application-identifier'
+TEAM_IDENTIFIER = 'com.apple.developer.team-identifier'
+
+
+class EntitlementsError(Exception):
+    pass
+
+
+def bundle_info(bundle_path):
+    info_plist_path = pathlib.Path(bundle_path).joinpath('Info.plist')
+    if not info_plist_path.is_file():
+        return {}
+    with open(info_plist_path, 'rb') as f:
+        return plistlib.load(f)
+
+
+def entitlements_from_data(data):
+    if not macho.is_macho(data):
+        return None
+    # Slices of a universal binary carry the same entitlements, so the first one that has them wins.
+    for binary in macho.slices(data):
+        signature = binary.embedded_signature()
+        if not signature:
+            continue
+        blob = macho.parse_superblob(signature).get(macho.CSSLOT_ENTITLEMENTS)
+        if blob and struct.unpack_from('>I', blob, 0)[0] == macho.CSMAGIC_EMBEDDED_ENTITLEMENTS:
+            return macho.blob_payload(blob)
+    return None
+
+
+def embedded_entitlements(path):
+    # Reads the entitlements blob from the signature already in the binary instead of asking codesign -d.
+    path = pathlib.Path(path)
+    if path.is_dir():
+        executable = bundle_info(path).get('CFBundleExecutable')
+        if not executable:
+            return None
+        path = path.joinpath(executable)
+    if not path.is_file():
+        return None
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+        try:
+            return entitlements_from_data(data)
+        except (macho.MachOError, struct.error) as e:
+            raise EntitlementsError('Cannot read the signature of {}: {}'.format(path, e))
+        finally:
+            data.close()
+
+
+def team_of(entitlements):
+    team_id = entitlements.get(TEAM_IDENTIFIER)
+    if team_id:
+        return team_id
+    app_id = entitlements.get(APPLICATION_IDENTIFIER, '')
+    return app_id.split('.', 1)[0] if '.' in app_id else None
+
+
+def retarget(value, old_team, new_team):
+    if isinstance(value, str):
+        if value == old_team:
+            return new_team
+        if value.startswith(old_team + '.'):
+            return new_team + value[len(old_team):]
+        return value
+    if isinstance(value, list):
+        return [retarget(v, old_team, new_team) for v in value]
+    return value
+
+
+def grants(allowed, value):
+    if not isinstance(allowed, str) or not isinstance(value, str):
+        return allowed == value
+    return fnmatch.fnmatchcase(value, allowed) if '*' in allowed else allowed == value
+
+
+def merged_value(allowed, value):
+    if value is None or isinstance(allowed, bool):
+        return allowed
+    patterns = allowed if isinstance(allowed, list) else [allowed]
+    if isinstance(value, list) and isinstance(allowed, list):
+        kept = [v for v in value if any(grants(pattern, v) for pattern in patterns)]
+        return kept or allowed
+    if isinstance(value, str) and any(grants(pattern, value) for pattern in patterns):
+        return value
+    return allowed
+
+
+def covers(granted, bundle_id):
+    app_id = granted.get(APPLICATION_IDENTIFIER)
+    team_id = team_of(granted)
+    return bool(app_id and bundle_id and team_id) and grants(app_id, '{}.{}'.format(team_id, bundle_id))
+
+
+def merge_entitlements(existing, granted, bundle_id=None):
+    # The profile is the authority on what may be claimed:
+    # - keys the profile does not grant are dropped,
+    # - existing values move to the profile's team and are kept where a profile pattern allows them,
+    # - booleans and anything the profile does not allow take the profile's value,
+    # - a wildcard application identifier becomes the element's own bundle identifier.
+    existing = existing or {}
+    team_id = team_of(granted)
+    old_team = team_of(existing)
+    merged = {}
+    for key, allowed in granted.items():
+        value = existing.get(key)
+        if value is not None and old_team and team_id:
+            value = retarget(value, old_team, team_id)
+        merged[key] = merged_value(allowed, value)
+
+    if covers(granted, bundle_id):
+        merged[APPLICATION_IDENTIFIER] = '{}.{}'.format(team_id, bundle_id)
+    return merged
+
+
+class EntitlementsCache:
+    def __init__(self, cache_path=None):
+        self.cache_path = pathlib.Path(cache_path) if cache_path else None
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self.load()
+
+    @staticmethod
+    def default_cache_path():
+        cache_path = os.environ.get('IRESIGN_ENTITLEMENTS_CACHE')
+        if cache_path is not None:
+            return cache_path
+        cache_home = os.environ.get('XDG_CACHE_HOME') or pathlib.Path.home().joinpath('.cache')
+        return pathlib.Path(cache_home).joinpath('iresign', 'entitlements.json')
+
+    @staticmethod
+    def key(bundle_id, profile_uuid):
+        return '{}|{}'.format(bundle_id, profile_uuid)
+
+    @staticmethod
+    def source_digest(existing):
+        return hashlib.sha256(existing or b'').hexdigest()
+
+    def load(self):
+        if not self.cache_path or not self.cache_path.is_file():
+            return
+        try:
+            with open(self.cache_path, 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(entries, dict):
+            self.entries = entries
+
+    def save(self):
+        if not self.cache_path or not self.dirty:
+            return
+        with self.lock:
+            entries = dict(self.entries)
+            self.dirty = False
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(prefix='.entitlements-', dir=self.cache_path.parent)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entries, f, indent=2, sort_keys=True)
+            os.replace(temp_path, self.cache_path)
+        except OSError:
+            pass
+
+    def get(self, bundle_id, profile_uuid, existing):
+        # An element rebuilt with different entitlements has a different source digest and is merged again.
+        with self.lock:
+            entry = self.entries.get(EntitlementsCache.key(bundle_id, profile_uuid))
+            if entry is not None and entry['source'] == EntitlementsCache.source_digest(existing):
+                self.hits += 1
+                return entry['entitlements'].encode('utf-8')
+            self.misses += 1
+            return None
+
+    def put(self, bundle_id, profile_uuid, existing, plist):
+        with self.lock:
+            self.entries[EntitlementsCache.key(bundle_id, profile_uuid)] = {
+                'source': EntitlementsCache.source_digest(existing),
+                'entitlements': plist.decode('utf-8'),
+            }
+            self.dirty = True
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)}
+
+
+def profile_uuid(mobileprovision):
+    return mobileprovision.plist().get('UUID') or mobileprovision.mobileprovision.as_posix()
+
+
+class EntitlementsResolver:
+    def __init__(self, output_dir, cache=None, workers=8):
+        self.output_dir = pathlib.Path(output_dir)
+        self.cache = cache if cache is not None else EntitlementsCache()
+        self.workers = workers
+        self.written = {}
+
+    def write(self, plist):
+        # Elements that end up with identical entitlements share one plist file.
+        digest = hashlib.sha256(plist).hexdigest()[:16]
+        if digest not in self.written:
+            entitlements_path = self.output_dir.joinpath('entitlements-{}.plist'.format(digest))
+            entitlements_path.write_bytes(plist)
+            self.written[digest] = entitlements_path
+        return self.written[digest]
+
+    def merge(self, bundle_id, mobileprovision, existing):
+        uuid = profile_uuid(mobileprovision)
+        plist = self.cache.get(bundle_id, uuid, existing)
+        if plist is None:
+            existing_entitlements = plistlib.loads(existing) if existing else {}
+            merged = merge_entitlements(existing_entitlements, mobileprovision.entitlements(), bundle_id)
+            plist = plistlib.dumps(merged, sort_keys=True)
+            self.cache.put(bundle_id, uuid, existing, plist)
+        return plist
+
+    def resolve(self, paths, profiles=None, default_profile=None):
+        # Elements with their own profile always get entitlements. The rest only keep entitlements they were
+        # already signed with, merged against the default profile, and only when that profile's application
+        # identifier covers their bundle identifier; otherwise they would claim the main app's identity.
+        profiles = profiles or {}
+        paths = list(paths)
+        if not paths:
+            return {}
+
+        def read(path):
+            try:
+                existing = embedded_entitlements(path)
+            except EntitlementsError:
+                # A signature that cannot be parsed is replaced anyway, so it is treated like no signature.
+                existing = None
+            return path, bundle_info(path).get('CFBundleIdentifier'), existing
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(paths)))) as executor:
+            results = [future.result() for future in [runner.submit(executor, read, path) for path in paths]]
+
+        entitlements_paths = {}
+        for path, bundle_id, existing in results:
+            mobileprovision = profiles.get(path)
+            if mobileprovision is None:
+                if existing is None or default_profile is None or \
+                        not covers(default_profile.entitlements(), bundle_id):
+                    continue
+                mobileprovision = default_profile
+            entitlements_paths[path] = self.write(self.merge(bundle_id or path.stem, mobileprovision, existing))
+        self.cache.save()
+        return entitlements_paths
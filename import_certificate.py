@@ -1,10 +1,30 @@
 #!/usr/bin/env python3
 
 import argparse
+import json
 import pathlib
 import sys
 
-from keychains import Keychain
+from keychains import CertificateImport, Keychain, KeychainSearchList
+
+
+def certificates_to_import(cert_paths, cert_passes, cert_dir=None, cert_passwords=None):
+    # A single --cert-pass applies to every certificate, otherwise passwords pair with --cert in order.
+    # Certificates from --cert-dir take their password from the --cert-passwords file, keyed by file name.
+    if len(cert_passes) > 1 and len(cert_passes) != len(cert_paths):
+        raise ValueError('Give one --cert-pass, or one per --cert')
+    default_pass = cert_passes[0] if len(cert_passes) == 1 else None
+    cert_passwords = cert_passwords or {}
+
+    certificates = []
+    for i, cert_path in enumerate(cert_paths):
+        cert_pass = cert_passes[i] if len(cert_passes) > 1 else default_pass
+        certificates.append((pathlib.Path(cert_path).resolve(), cert_pass))
+    if cert_dir:
+        for cert_path in sorted(pathlib.Path(cert_dir).resolve().glob('*.p12')):
+            cert_pass = cert_passwords.get(cert_path.name, cert_passwords.get(cert_path.stem, default_pass))
+            certificates.append((cert_path, cert_pass))
+    return certificates
 
 
 def main():
@@ -13,23 +33,40 @@ def main():
             help='create and use the named keychain')
     parser.add_argument('--keychain-pass', dest='keychain_pass',
             help='keychain password')
-    parser.add_argument('--cert', dest='dist_cert',
-            help='p12 certificate to import')
-    parser.add_argument('--cert-pass', dest='dist_cert_pass',
-            help='password for p12 certificate')
+    parser.add_argument('--cert', dest='dist_certs', action='append', default=[],
+            help='p12 certificate to import, may be repeated')
+    parser.add_argument('--cert-pass', dest='dist_cert_passes', action='append', default=[],
+            help='password for p12 certificate, once for all or once per --cert')
+    parser.add_argument('--cert-dir', dest='dist_cert_dir',
+            help='import every .p12 in this directory')
+    parser.add_argument('--cert-passwords', dest='dist_cert_passwords',
+            help='JSON file mapping p12 file names in --cert-dir to their passwords')
     args = parser.parse_args()
 
+    cert_passwords = None
+    if args.dist_cert_passwords:
+        with open(args.dist_cert_passwords, 'r') as f:
+            cert_passwords = json.load(f)
+    try:
+        certificates = certificates_to_import(args.dist_certs, args.dist_cert_passes, args.dist_cert_dir,
+                                              cert_passwords)
+    except ValueError as e:
+        parser.error(str(e))
+
     keychain = Keychain(args.keychain_name, args.keychain_pass)
 
     if not keychain.exists():
-        keychain.create_and_configure()
+        with KeychainSearchList() as search:
+            keychain.create_and_configure(search=search)
     else:
         keychain.unlock()
 
-    if args.dist_cert:
-        dist_cert_path = pathlib.Path(args.dist_cert).resolve()
-        if not keychain.has_signing_certificates(dist_cert_path, args.dist_cert_pass):
-            keychain.import_codesign_certificate(dist_cert_path, args.dist_cert_pass)
+    if certificates:
+        results = keychain.import_codesign_certificates(certificates)
+        for result in results:
+            print(result)
+        if any(result.status == CertificateImport.FAILED for result in results):
+            sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,119 @@
+import copy
+import os
+import pathlib
+import shutil
+import zipfile
+
+from archive_writer import ArchiveWriter
+
+
+class IpaRewriter:
+    def __init__(self, source):
+        self.source = pathlib.Path(source)
+        self.root = None
+        self.staged_paths = {}
+        self.snapshot = {}
+
+    @staticmethod
+    def stat_key(path):
+        st = os.lstat(path)
+        return st.st_size, st.st_mtime_ns, st.st_ino
+
+    def extract(self, destination):
+        destination = pathlib.Path(destination)
+        self.root = destination
+        self.staged_paths = {}
+        self.snapshot = {}
+        with zipfile.ZipFile(self.source) as z:
+            for info in z.infolist():
+                staged_path = pathlib.Path(z.extract(info, path=destination))
+                self.staged_paths[info.filename] = staged_path
+                if not info.is_dir():
+                    self.snapshot[info.filename] = IpaRewriter.stat_key(staged_path)
+
+    def clone(self, destination):
+        if self.root is None:
+            raise Exception('Cannot clone {} before it has been extracted'.format(self.source))
+        destination = pathlib.Path(destination)
+        shutil.copytree(self.root, destination, symlinks=True, dirs_exist_ok=True)
+
+        clone = IpaRewriter(self.source)
+        clone.root = destination
+        for name, staged_path in self.staged_paths.items():
+            cloned_path = destination.joinpath(staged_path.relative_to(self.root))
+            clone.staged_paths[name] = cloned_path
+            if name in self.snapshot:
+                clone.snapshot[name] = IpaRewriter.stat_key(cloned_path)
+        return clone
+
+    def is_unchanged(self, info):
+        staged_path = self.staged_paths.get(info.filename)
+        if staged_path is None or not os.path.lexists(staged_path):
+            return False
+        if info.is_dir():
+            return staged_path.is_dir()
+        return self.snapshot.get(info.filename) == IpaRewriter.stat_key(staged_path)
+
+    @staticmethod
+    def entry_spans(z):
+        infos = sorted(z.infolist(), key=lambda i: i.header_offset)
+        spans = {}
+        for info, following in zip(infos, infos[1:] + [None]):
+            end = following.header_offset if following else z.start_dir
+            spans[info.filename] = (info.header_offset, end)
+        return spans
+
+    @staticmethod
+    def append_raw(out, source_fp, info, span):
+        start, end = span
+        zinfo = copy.copy(info)
+        zinfo.header_offset = out.fp.tell()
+        source_fp.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = source_fp.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                raise Exception('Unexpected end of archive while copying {}'.format(info.filename))
+            out.fp.write(chunk)
+            remaining -= len(chunk)
+        out.filelist.append(zinfo)
+        out.NameToInfo[zinfo.filename] = zinfo
+        out.start_dir = out.fp.tell()
+
+    def rewrite(self, staged_root, output, staged_paths, compression=None):
+        staged_root = pathlib.Path(staged_root)
+        source_names = set()
+        has_directory_entries = False
+        passed_through = 0
+        rewritten = 0
+
+        with zipfile.ZipFile(self.source) as source, \
+                open(self.source, 'rb') as source_fp, \
+                zipfile.ZipFile(output, 'w') as out, \
+                ArchiveWriter(out, compression) as writer:
+            spans = IpaRewriter.entry_spans(source)
+            for info in source.infolist():
+                source_names.add(info.filename)
+                has_directory_entries = has_directory_entries or info.is_dir()
+                staged_path = self.staged_paths.get(info.filename)
+                if self.is_unchanged(info):
+                    writer.append(IpaRewriter.append_raw, source_fp, info, spans[info.filename])
+                    passed_through += 1
+                elif staged_path is not None and os.path.lexists(staged_path):
+                    compress_type = info.compress_type if not info.is_dir() else zipfile.ZIP_STORED
+                    writer.write(staged_path, info.filename, compress_type=compress_type)
+                    rewritten += 1
+
+            staged_names = {path: path.relative_to(staged_root).as_posix() for path in staged_paths}
+            for path in sorted(staged_paths):
+                name = staged_names[path]
+                if path.is_dir() and not path.is_symlink():
+                    if not has_directory_entries:
+                        continue
+                    name += '/'
+                if name in source_names:
+                    continue
+                writer.write(path, name)
+                rewritten += 1
+
+        return passed_through, rewritten
@@ -1,23 +1,25 @@
 #!/usr/bin/env python3
 
-import argparse
+import os
 import pathlib
-import plistlib
-import shutil
-import subprocess
 import sys
-import tempfile
-import zipfile
+import threading
+import time
 
-from mobileprovision import Mobileprovision
+import runner
+
+# Everything else is imported where it is used, so `import iresign` and `iresign.py --help` stay cheap for
+# services that call resign() in-process.
 
 
 def platform_sdk_path(platform):
-    return subprocess.check_output(['xcrun', '--sdk', platform, '--show-sdk-platform-path'])
+    from toolchain import Toolchain
+    return Toolchain.default().sdk_platform_path(platform)
 
 
 def find_developer_tool(developer_tool):
-    return subprocess.check_output(['xcrun', '--find', developer_tool]).decode(sys.stdout.encoding).strip()
+    from toolchain import Toolchain
+    return Toolchain.default().find(developer_tool)
 
 
 def codesign_allocate_path():
@@ -28,107 +30,476 @@ def codesign_path():
     return find_developer_tool('codesign')
 
 
-def find(path, item):
-    return list(path.glob('**/' + item))
-
-
-def find_app_paths(path):
-    return find(path, '*.app')
-
-
-def find_codesign_elements(path):
-    elements = find(path, '*.appex')
-    elements.extend(find(path, '*.framework'))
-    elements.extend(find(path, '*.dylib'))
-    return elements
-
-
-def find_codesign_artifacts(path):
-    artifacts = find(path, '_CodeSignature')
-    artifacts.extend(find(path, 'CodeResources'))
-    artifacts.extend(find(path, '*.mobileprovision'))
-    return artifacts
-
-
 def codesign(signable_path, signer_hash, entitlements_path=None):
     codesign_cmd = [codesign_path(), '--force', '--sign', signer_hash]
     if entitlements_path:
         codesign_cmd.extend(['--entitlements', entitlements_path.as_posix()])
     codesign_cmd.append('--timestamp=none')
     codesign_cmd.append(signable_path.as_posix())
-    return subprocess.run(codesign_cmd, check=True, env={'CODESIGN_ALLOCATE': codesign_allocate_path()})
-
-
-def main():
-    parser = argparse.ArgumentParser(description='Re-sign an ipa or app')
-    parser.add_argument('--app', dest='app',
-                        help='path to .app or .ipa to sign', required=True)
-    parser.add_argument('-p', '--profile', dest='profile',
-                        help='mobileprovision to use for signing', required=True)
-    parser.add_argument('-o', '--output', dest='output',
-                        help='path to resigned app or ipa')
-    args = parser.parse_args()
-
-    app_path = pathlib.Path(args.app)
-    if args.output:
-        resigned_bundle_path = pathlib.Path(args.output)
-    else:
-        resigned_bundle_path = app_path.resolve().parent
-        resigned_bundle_name = app_path.stem + '-resigned' + app_path.suffix
-        resigned_bundle_path = resigned_bundle_path.joinpath(resigned_bundle_name)
-
-    if app_path.suffix == '.app':
-        is_zipped = False
-    elif app_path.suffix == '.ipa':
-        is_zipped = True
-    else:
+    env = dict(os.environ, CODESIGN_ALLOCATE=codesign_allocate_path())
+    return runner.run(codesign_cmd, check=True, env=env)
+
+
+class CodesignBackend:
+    name = 'codesign'
+
+    def sign(self, signable_path, signer_hash, entitlements_path=None):
+        return codesign(signable_path, signer_hash, entitlements_path=entitlements_path)
+
+
+def signing_backend(name, p12_path=None, p12_password=None, jobs=None):
+    if name == 'native':
+        if not p12_path:
+            raise Exception('The native backend needs a PKCS#12 signing identity')
+        from native_signer import NativeSigner
+        return NativeSigner(p12_path, p12_password, workers=jobs)
+    if name != 'codesign':
+        raise Exception('Unknown signing backend: ' + name)
+    return CodesignBackend()
+
+
+def available_signer_hashes(signer):
+    if getattr(signer, 'signer_hash', None):
+        return {signer.signer_hash}
+    from keychains import IdentityIndex, Keychains
+    return IdentityIndex.default().available_hashes(Keychains.keychains())
+
+
+def select_profile(profile_store, app_path, signer):
+    from profile_store import ProfileStoreError, bundle_identifier
+    bundle_id = bundle_identifier(app_path)
+    if not bundle_id:
+        raise ProfileStoreError('Cannot read the bundle identifier of {}'.format(app_path))
+    return profile_store.select(bundle_id, signer_hashes=available_signer_hashes(signer))
+
+
+def embed_extension_profiles(index, profile_store, developer_certificate_hash):
+    import shutil
+    from bundle_index import BundleIndex
+    from element_entitlements import bundle_info
+    from profile_store import ProfileStoreError
+
+    # Each app extension gets the best profile for its own bundle identifier, signed by the same certificate.
+    extension_profiles = {}
+    for appex_path in index.paths(BundleIndex.APPEX):
+        bundle_id = bundle_info(appex_path).get('CFBundleIdentifier')
+        if not bundle_id:
+            continue
+        try:
+            mobileprovision = profile_store.select(bundle_id, signer_hashes={developer_certificate_hash})
+        except ProfileStoreError:
+            continue
+        embedded_mobileprovision_path = appex_path.joinpath('embedded.mobileprovision')
+        shutil.copy(mobileprovision.mobileprovision, embedded_mobileprovision_path)
+        index.add(embedded_mobileprovision_path)
+        extension_profiles[appex_path] = mobileprovision
+    return extension_profiles
+
+
+def main_app_paths(temp_app_path, index):
+    # A staged .app is its own main bundle; an extracted .ipa holds it under Payload/.
+    if temp_app_path.joinpath('Info.plist').is_file():
+        return [temp_app_path]
+    payload = temp_app_path.joinpath('Payload')
+    return [path for path in index.app_paths() if path.parent == payload]
+
+
+def stage_bundle(app_path, temp_app_path):
+    if app_path.suffix == '.ipa':
+        from ipa_rewriter import IpaRewriter
+        rewriter = IpaRewriter(app_path)
+        rewriter.extract(temp_app_path)
+        return rewriter
+
+    import staging
+    staging.stage_tree(app_path, temp_app_path)
+    return None
+
+
+def resign_bundle(app_path, mobileprovision, resigned_bundle_path, jobs=None, entitlements=None, stage=stage_bundle,
+                  cache=None, signer=None, compression=None, profile_store=None, entitlements_cache=None):
+    import shutil
+    import tempfile
+    import staging
+
+    if app_path.suffix not in ['.app', '.ipa']:
         raise Exception('Unknown app type: ' + app_path.suffix)
 
-    mobileprovision_path = pathlib.Path(args.profile).resolve()
-    mobileprovision = Mobileprovision(mobileprovision_path)
-    entitlements = mobileprovision.entitlements()
-    developer_certificate_hash = mobileprovision.signer_hash()
+    with runner.stage('decode profile'):
+        if entitlements is None:
+            entitlements = mobileprovision.entitlements()
+        developer_certificate_hash = mobileprovision.signer_hash()
+
+    if signer is None:
+        signer = CodesignBackend()
 
+    staging_root = None
     with tempfile.TemporaryDirectory(prefix='iresign-') as t:
         temp_root = pathlib.Path(t)
-        temp_app_path = temp_root.joinpath('app')
-        temp_app_path.mkdir(parents=True)
-
-        if is_zipped:
-            with zipfile.ZipFile(app_path) as z:
-                z.extractall(path=temp_app_path)
+        if app_path.suffix == '.app':
+            staging_root = staging.staging_dir_beside(resigned_bundle_path)
+            # Staged under its own name so the root is recognised and signed as the main .app bundle.
+            temp_app_path = staging_root.joinpath(app_path.name)
         else:
-            shutil.copytree(app_path, temp_app_path)
-
-        artifacts = find_codesign_artifacts(temp_app_path)
+            temp_app_path = temp_root.joinpath('app')
+        temp_app_path.mkdir(parents=True)
+        try:
+            signed_paths = sign_staged_bundle(app_path, mobileprovision, resigned_bundle_path, temp_root,
+                                              temp_app_path, developer_certificate_hash, entitlements, jobs, stage,
+                                              cache, signer, compression, profile_store, entitlements_cache)
+            signed_root = temp_app_path.parent if app_path.suffix == '.app' else temp_app_path
+            return [path.relative_to(signed_root).as_posix() for path in signed_paths]
+        finally:
+            if staging_root:
+                shutil.rmtree(staging_root, ignore_errors=True)
+
+
+def sign_staged_bundle(app_path, mobileprovision, resigned_bundle_path, temp_root, temp_app_path,
+                       developer_certificate_hash, entitlements, jobs, stage, cache, signer, compression,
+                       profile_store, entitlements_cache=None):
+    import plistlib
+    import shutil
+    import resource_seal
+    import staging
+    from bundle_index import BundleIndex
+    from element_entitlements import EntitlementsResolver
+    from signing_cache import SigningCache
+    from signing_scheduler import SigningScheduler
+
+    with runner.stage('extract'):
+        rewriter = stage(app_path, temp_app_path)
+
+    with runner.stage('strip artifacts'):
+        index = BundleIndex(temp_app_path)
+        artifacts = index.codesign_artifacts()
         for artifact in artifacts:
+            if not os.path.lexists(artifact):
+                continue
             if artifact.is_dir():
                 shutil.rmtree(artifact)
             else:
                 artifact.unlink()
+        index.remove(*artifacts)
+
+        for main_app_path in main_app_paths(temp_app_path, index):
+            embedded_mobileprovision_path = main_app_path.joinpath('embedded.mobileprovision')
+            shutil.copy(mobileprovision.mobileprovision, embedded_mobileprovision_path)
+            index.add(embedded_mobileprovision_path)
+
+        extension_profiles = {}
+        if profile_store:
+            extension_profiles = embed_extension_profiles(index, profile_store, developer_certificate_hash)
+
+    with runner.stage('resolve entitlements'):
+        resolver = EntitlementsResolver(temp_root, cache=entitlements_cache, workers=jobs or os.cpu_count() or 1)
+        extension_entitlements = resolver.resolve(index.paths(BundleIndex.APPEX), extension_profiles, mobileprovision)
+
+    entitlements_path = temp_root.joinpath('entitlements.plist')
+    with open(entitlements_path, 'wb') as f:
+        plist = plistlib.dumps(entitlements)
+        f.write(plist)
+
+    def sign(signable_path):
+        if signable_path.suffix == '.app':
+            with runner.stage('sign app'):
+                signer.sign(signable_path, developer_certificate_hash, entitlements_path=entitlements_path)
+        elif signable_path in extension_entitlements:
+            with runner.stage('sign element'):
+                signer.sign(signable_path, developer_certificate_hash,
+                            entitlements_path=extension_entitlements[signable_path])
+        elif cache and SigningCache.is_cacheable(signable_path):
+            with runner.stage('sign element'):
+                key = SigningCache.key(signable_path, developer_certificate_hash, variant=signer.name)
+                if not cache.restore(key, signable_path):
+                    signer.sign(signable_path, developer_certificate_hash)
+                    cache.store(key, signable_path)
+        else:
+            with runner.stage('sign element'):
+                signer.sign(signable_path, developer_certificate_hash)
+
+    scheduler = SigningScheduler(jobs=jobs)
+    scheduler.extend(index.codesign_elements())
+    scheduler.extend(index.app_paths())
+    scheduler.extend(main_app_paths(temp_app_path, index))
+    with resource_seal.digest_scope():
+        signed_paths = scheduler.run(sign)
+    index.refresh(*[path.joinpath('_CodeSignature') for path in signed_paths if path.is_dir()])
+
+    with runner.stage('repack'):
+        if rewriter:
+            rewriter.rewrite(temp_app_path, resigned_bundle_path, index.all_paths(), compression=compression)
+        else:
+            staging.commit(temp_app_path, resigned_bundle_path)
+    return signed_paths
+
+
+def print_cache_stats(cache):
+    stats = cache.stats()
+    print('Signing cache: {} hits, {} misses'.format(stats['hits'], stats['misses']))
+
+
+def default_output_path(app_path):
+    resigned_bundle_name = app_path.stem + '-resigned' + app_path.suffix
+    return app_path.resolve().parent.joinpath(resigned_bundle_name)
+
+
+class ResignResult:
+    def __init__(self, input_path, output_path, profile_path, signer_hash, backend, signed, seconds,
+                 profile_selected=False, cache=None):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.profile_path = profile_path
+        self.signer_hash = signer_hash
+        self.backend = backend
+        self.signed = signed
+        self.seconds = seconds
+        self.profile_selected = profile_selected
+        self.cache = cache
+
+    def __repr__(self):
+        return 'ResignResult(output={}, profile={}, signed={})'.format(self.output_path, self.profile_path,
+                                                                       len(self.signed))
+
+    def to_dict(self):
+        result = {
+            'input': self.input_path.as_posix(),
+            'output': self.output_path.as_posix(),
+            'profile': self.profile_path.as_posix(),
+            'signer_hash': self.signer_hash,
+            'backend': self.backend,
+            'signed': self.signed,
+            'seconds': self.seconds,
+        }
+        if self.cache is not None:
+            result['cache'] = self.cache
+        return result
+
+
+class Session:
+    # Keeps decoded profiles, the profile store, signing caches and signing backends warm between resign() calls.
+    # Tool paths and keychain identities are already cached process-wide by Toolchain and IdentityIndex.
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, tools=(), profile_dir=None, verify_profiles=False):
+        self.profile_dir = profile_dir
+        self.verify_profiles = verify_profiles
+        self.lock = threading.Lock()
+        self.mobileprovisions = {}
+        self.profile_stores = {}
+        self.caches = {}
+        self.signers = {}
+        self._entitlements_cache = None
+        for tool_spec in tools:
+            self.override_tool(tool_spec)
+
+    @staticmethod
+    def default():
+        with Session._default_lock:
+            if Session._default is None:
+                Session._default = Session()
+            return Session._default
+
+    @staticmethod
+    def override_tool(tool_spec):
+        from toolchain import Toolchain
+        Toolchain.default().override_from_spec(tool_spec)
+
+    def mobileprovision(self, profile_path, verify=None):
+        from mobileprovision import Mobileprovision
+        verify = self.verify_profiles if verify is None else verify
+        profile_path = pathlib.Path(profile_path).resolve()
+        st = profile_path.stat()
+        key = (profile_path, verify)
+        with self.lock:
+            cached = self.mobileprovisions.get(key)
+            if cached is None or cached[0] != (st.st_mtime_ns, st.st_size):
+                cached = ((st.st_mtime_ns, st.st_size), Mobileprovision(profile_path, verify=verify))
+                self.mobileprovisions[key] = cached
+        mobileprovision = cached[1]
+        mobileprovision.plist()
+        return mobileprovision
+
+    def profile_store(self, profile_dir=None):
+        from profile_store import ProfileStore
+        profile_dir = profile_dir or self.profile_dir
+        with self.lock:
+            if profile_dir not in self.profile_stores:
+                self.profile_stores[profile_dir] = ProfileStore(profile_dir, verify=self.verify_profiles)
+            profile_store = self.profile_stores[profile_dir]
+        profile_store.scan()
+        return profile_store
+
+    def signing_cache(self, cache_dir, cache_size=2048):
+        if not cache_dir:
+            return None
+        from signing_cache import SigningCache
+        key = pathlib.Path(cache_dir).resolve()
+        with self.lock:
+            if key not in self.caches:
+                self.caches[key] = SigningCache(key, max_bytes=cache_size * 1024 * 1024)
+            return self.caches[key]
+
+    def signer(self, backend='codesign', p12=None, p12_password=None, jobs=None):
+        key = (backend, p12 and pathlib.Path(p12).resolve(), p12_password, jobs)
+        with self.lock:
+            if key not in self.signers:
+                self.signers[key] = signing_backend(backend, p12, p12_password, jobs=jobs)
+            return self.signers[key]
+
+    def entitlements_cache(self):
+        from element_entitlements import EntitlementsCache
+        with self.lock:
+            if self._entitlements_cache is None:
+                self._entitlements_cache = EntitlementsCache(EntitlementsCache.default_cache_path())
+            return self._entitlements_cache
+
+    @staticmethod
+    def compression(compression_level=-1, store_media=False, jobs=None):
+        from archive_writer import Compression
+        return Compression(compression_level, store_media=store_media, workers=jobs)
+
+    def resign(self, input_path, profile=None, output=None, *, jobs=None, backend='codesign', p12=None,
+               p12_password=None, cache=None, cache_size=2048, entitlements=None, compression_level=-1,
+               store_media=False, profile_dir=None):
+        started = time.monotonic()
+        input_path = pathlib.Path(input_path)
+        output_path = pathlib.Path(output) if output else default_output_path(input_path)
+        jobs = jobs or os.cpu_count() or 1
+        signer = self.signer(backend, p12, p12_password, jobs=jobs)
+        signing_cache = self.signing_cache(cache, cache_size)
+
+        profile_store = None
+        if profile_dir or self.profile_dir or not profile:
+            profile_store = self.profile_store(profile_dir)
+        if profile:
+            mobileprovision = self.mobileprovision(profile)
+        else:
+            with runner.stage('select profile'):
+                mobileprovision = select_profile(profile_store, input_path, signer)
+
+        signed = resign_bundle(input_path, mobileprovision, output_path, jobs=jobs, entitlements=entitlements,
+                               cache=signing_cache, signer=signer,
+                               compression=Session.compression(compression_level, store_media, jobs),
+                               profile_store=profile_store, entitlements_cache=self.entitlements_cache())
+        return ResignResult(input_path, output_path, mobileprovision.mobileprovision, mobileprovision.signer_hash(),
+                            signer.name, signed, round(time.monotonic() - started, 3), profile_selected=not profile,
+                            cache=signing_cache.stats() if signing_cache else None)
+
+    def run_batch(self, manifest, *, workers=2, jobs=None, backend='codesign', p12=None, p12_password=None,
+                  cache=None, cache_size=2048, compression_level=-1, store_media=False):
+        import functools
+        from batch import BatchRunner
+
+        jobs = jobs or os.cpu_count() or 1
+        signing_cache = self.signing_cache(cache, cache_size)
+        resign = functools.partial(resign_bundle, signer=self.signer(backend, p12, p12_password, jobs=jobs),
+                                   compression=Session.compression(compression_level, store_media, jobs),
+                                   entitlements_cache=self.entitlements_cache())
+        batch_runner = BatchRunner(resign, workers=workers, jobs=jobs, cache=signing_cache,
+                                   load_profile=self.mobileprovision)
+        report = batch_runner.run(BatchRunner.load_manifest(manifest))
+        if signing_cache:
+            report['cache'] = signing_cache.stats()
+        return report
+
+
+def resign(input_path, profile=None, output=None, **kwargs):
+    # Calls share the default Session, so decoded profiles, caches and signing identities are reused.
+    return Session.default().resign(input_path, profile, output, **kwargs)
 
-        shutil.copy(mobileprovision_path, temp_app_path.joinpath('embedded.mobileprovision'))
 
-        for codesign_element in find_codesign_elements(temp_app_path):
-            codesign(codesign_element, developer_certificate_hash)
+def main():
+    import argparse
 
-        entitlements_path = temp_root.joinpath('entitlements.plist')
-        with open(entitlements_path, 'wb') as f:
-            plist = plistlib.dumps(entitlements)
-            f.write(plist)
+    if len(sys.argv) > 1 and sys.argv[1] in ('serve', 'submit'):
+        import resign_server
+        command = resign_server.serve_main if sys.argv[1] == 'serve' else resign_server.submit_main
+        return command(sys.argv[2:])
 
-        app_paths = find_app_paths(temp_app_path)
-        for app_path in app_paths:
-            codesign(app_path, developer_certificate_hash, entitlements_path=entitlements_path)
+    parser = argparse.ArgumentParser(description='Re-sign an ipa or app')
+    parser.add_argument('--app', dest='app',
+                        help='path to .app or .ipa to sign')
+    parser.add_argument('-p', '--profile', dest='profile',
+                        help='mobileprovision to use for signing, picked from --profile-dir by bundle ID if omitted')
+    parser.add_argument('--profile-dir', dest='profile_dir',
+                        help='directory of provisioning profiles to choose from, '
+                             'defaults to ~/Library/MobileDevice/Provisioning Profiles')
+    parser.add_argument('--verify-profile', dest='verify_profile', action='store_true',
+                        help='check that the mobileprovision content matches the CMS signature of its embedded '
+                             'certificate before using it, the chain to Apple\'s root is not validated')
+    parser.add_argument('-o', '--output', dest='output',
+                        help='path to resigned app or ipa')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=os.cpu_count() or 1,
+                        help='number of elements to sign in parallel')
+    parser.add_argument('--tool', dest='tools', action='append', default=[], metavar='NAME=PATH',
+                        help='use PATH for developer tool NAME instead of asking xcrun')
+    parser.add_argument('--manifest', dest='manifest',
+                        help='JSON or YAML manifest of re-sign jobs to run as a batch')
+    parser.add_argument('--workers', dest='workers', type=int, default=2,
+                        help='number of batch jobs to run at the same time')
+    parser.add_argument('--report', dest='report',
+                        help='write a JSON report of batch results to this path')
+    parser.add_argument('--profile-report', dest='profile_report', action='store_true',
+                        help='print a per-stage timing breakdown of external commands')
+    parser.add_argument('--profile-trace', dest='profile_trace',
+                        help='write a Chrome trace of stages and external commands to this path')
+    parser.add_argument('--cache', dest='cache',
+                        help='directory of previously signed frameworks and dylibs to reuse')
+    parser.add_argument('--cache-size', dest='cache_size', type=int, default=2048,
+                        help='size cap of the signing cache in MiB')
+    parser.add_argument('--backend', dest='backend', choices=['codesign', 'native'], default='codesign',
+                        help='sign with Apple codesign or the built-in Mach-O signer')
+    parser.add_argument('--p12', dest='p12',
+                        help='PKCS#12 signing identity for the native backend')
+    parser.add_argument('--p12-pass', dest='p12_password',
+                        help='password of the --p12 identity')
+    parser.add_argument('--compression-level', dest='compression_level', type=int, default=-1, choices=range(-1, 10),
+                        metavar='0-9', help='deflate level for rewritten .ipa entries, 0 stores them')
+    parser.add_argument('--store-media', dest='store_media', action='store_true',
+                        help='fast mode: store already compressed png, jpg and car files without deflating them')
+    args = parser.parse_args()
 
-        if is_zipped:
-            with zipfile.ZipFile(resigned_bundle_path, 'w') as z:
-                for item in temp_app_path.glob('**/*'):
-                    z.write(item, arcname=item.relative_to(temp_app_path))
-        else:
-            shutil.copytree(temp_app_path, resigned_bundle_path)
+    profiler = runner.Profiler()
+    try:
+        with profiler.activate():
+            run_command_line(parser, args)
+    finally:
+        if args.profile_report:
+            sys.stderr.write(profiler.format_report() + '\n')
+        if args.profile_trace:
+            profiler.write_trace(args.profile_trace)
+
+
+def run_command_line(parser, args):
+    if args.backend == 'native' and not args.p12:
+        parser.error('--p12 is required with --backend native')
+    if not args.manifest and not args.app:
+        parser.error('--app is required unless --manifest is given')
+
+    session = Session(tools=args.tools, profile_dir=args.profile_dir, verify_profiles=args.verify_profile)
+    options = dict(jobs=args.jobs, backend=args.backend, p12=args.p12, p12_password=args.p12_password,
+                   cache=args.cache, cache_size=args.cache_size, compression_level=args.compression_level,
+                   store_media=args.store_media)
+
+    if args.manifest:
+        import json
+        report = session.run_batch(args.manifest, workers=args.workers, **options)
+        if 'cache' in report:
+            print_cache_stats(session.signing_cache(args.cache))
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(report, f, indent=2)
+        if report['failed']:
+            sys.exit(1)
+        return
+
+    result = session.resign(args.app, args.profile, args.output, **options)
+    if result.profile_selected:
+        print('Using provisioning profile {}'.format(result.profile_path))
+    if result.cache is not None:
+        print_cache_stats(session.signing_cache(args.cache))
 
 
 if __name__ == '__main__':
     main()
-
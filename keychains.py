@@ -1,45 +1,47 @@
+import atexit
+import concurrent.futures
+import contextlib
+import fcntl
+import importlib.util
+import itertools
+import json
 import os
 import pathlib
 import random
 import re
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 
 from collections import OrderedDict
-from misc import paths_from_lines, remove_ends, signer_hash
+
+import runner
+from misc import paths_from_lines, pkcs12_signer_hashes, remove_ends, signer_hash
 
 
 class Keychains:
     @staticmethod
-    def cleanup_keychain_search(only_user_keychains=True):
-        valid_keychains = []
+    def cleanup_keychain_search(only_user_keychains=True, search=None):
         user_home_dir = pathlib.Path.home().as_posix()
-        keychains = list(OrderedDict.fromkeys(Keychains.keychains()))
-        for keychain in keychains:
-            is_user_keychain = keychain.path.as_posix().startswith(user_home_dir)
-            if only_user_keychains and not is_user_keychain:
-                valid_keychains.append(keychain)
-                continue
 
-            if keychain.path.is_file():
-                valid_keychains.append(keychain)
+        def is_valid(keychain_path):
+            is_user_keychain = keychain_path.as_posix().startswith(user_home_dir)
+            if only_user_keychains and not is_user_keychain:
+                return True
+            return keychain_path.is_file()
 
-        if Keychains.keychains() != valid_keychains:
-            Keychains.rewrite_keychain_search(valid_keychains)
+        if search is not None:
+            search.retain(is_valid)
+            return
+        with KeychainSearchList() as search:
+            search.retain(is_valid)
 
     @staticmethod
     def find_keychains_with_certificate(certificate):
-        keychains = []
-
         certificate_hash = signer_hash(certificate)
-        for keychain in Keychains.keychains():
-            identities = keychain.get_codesign_identities()
-            for identity in identities:
-                identity_hash = identity[1].upper()
-                if identity_hash == certificate_hash:
-                    keychains.append(keychain.path)
-
-        return keychains
+        return IdentityIndex.default().keychains_with_hash(certificate_hash, Keychains.keychains())
 
     @staticmethod
     def is_valid_signing_certificate_available(certificate):
@@ -62,15 +64,15 @@ class Keychains:
 
     @staticmethod
     def list_keychain_paths():
-        paths = subprocess.check_output(['security', 'list-keychains']).decode(sys.stdout.encoding)
+        paths = runner.check_output(['security', 'list-keychains']).decode(sys.stdout.encoding)
         return paths_from_lines(paths)
 
     @staticmethod
     def rewrite_keychain_search(keychains):
-        keychain_paths = [keychain.path.as_posix() for keychain in keychains]
+        keychain_paths = [KeychainSearchList.keychain_path(keychain).as_posix() for keychain in keychains]
         list_keychains_cmd = ['security', 'list-keychains', '-s']
         list_keychains_cmd.extend(keychain_paths)
-        subprocess.run(list_keychains_cmd, check=True)
+        runner.run(list_keychains_cmd, check=True)
 
 
 class Keychain:
@@ -110,14 +112,14 @@ class Keychain:
             if self.password:
                 create_keychain_cmd.extend(['-p', self.password])
             create_keychain_cmd.append(self.path.as_posix())
-            subprocess.run(create_keychain_cmd, check=True)
+            runner.run(create_keychain_cmd, secrets=[self.password], check=True)
         else:
             raise Exception('Keychain creation failed. Keychain {} already exists'.format(self.name))
 
     def lock(self):
         if self.exists():
             lock_keychain_cmd = ['security', 'lock-keychain', self.path.as_posix()]
-            subprocess.run(lock_keychain_cmd, check=True)
+            runner.run(lock_keychain_cmd, check=True)
         else:
             raise Exception('Keychain lock failed. Keychain {} does not exist'.format(self.name))
 
@@ -127,14 +129,14 @@ class Keychain:
             if self.password:
                 unlock_keychain_cmd.extend(['-p', self.password])
             unlock_keychain_cmd.append(self.path.as_posix())
-            subprocess.run(unlock_keychain_cmd, check=True)
+            runner.run(unlock_keychain_cmd, secrets=[self.password], check=True)
         else:
             raise Exception('Keychain unlock failed. Keychain {} does not exist'.format(self.name))
 
     def set_unlock_no_timeout(self):
         if self.exists():
             set_keychain_settings_cmd = ['security', 'set-keychain-settings', self.path.as_posix()]
-            subprocess.run(set_keychain_settings_cmd, check=True)
+            runner.run(set_keychain_settings_cmd, check=True)
         else:
             raise Exception('Keychain setting defaults failed. Keychain {} does not exist'.format(self.name))
 
@@ -146,28 +148,81 @@ class Keychain:
             if self.password:
                 key_partition_list_cmd.extend(['-k', self.password])
             key_partition_list_cmd.append(self.path.as_posix())
-            subprocess.run(key_partition_list_cmd, check=True, stdout=subprocess.DEVNULL)
+            runner.run(key_partition_list_cmd, secrets=[self.password], check=True, stdout=subprocess.DEVNULL)
         else:
             raise Exception('Keychain set partition list failed. Keychain {} does not exist'.format(self.name))
 
     def set_apple_tool_partition_list(self):
         self.set_partition_list('apple-tool:,apple:')
 
-    def create_and_configure(self):
+    def create_and_configure(self, search=None):
         self.create()
-        self.add_to_keychain_search()
+        self.add_to_keychain_search(search)
         self.unlock()
         self.set_unlock_no_timeout()
 
+    @staticmethod
+    def p12_hashes(dist_cert, dist_cert_pass):
+        p12_hashes = pkcs12_signer_hashes(dist_cert, dist_cert_pass)
+        if p12_hashes is None:
+            with KeychainPool.default().lease() as tk:
+                tk.import_codesign_certificate(dist_cert, dist_cert_pass)
+                codesign_identities = tk.get_codesign_identities()
+                p12_hashes = {codesign_identity[1].upper() for codesign_identity in codesign_identities}
+        return p12_hashes
+
+    @staticmethod
+    def p12_hashes_many(certificates):
+        # Returns the identity hashes, or the error reading them, for each (path, password) in order. Without
+        # cryptography every p12 goes through a scratch keychain, so the pool is warmed and the p12s are read
+        # in parallel, one leased keychain each.
+        def read(certificate):
+            try:
+                return Keychain.p12_hashes(*certificate)
+            except (OSError, ValueError, subprocess.CalledProcessError) as e:
+                return e
+
+        certificates = list(certificates)
+        if len(certificates) < 2 or importlib.util.find_spec('cryptography') is not None:
+            return [read(certificate) for certificate in certificates]
+
+        pool = KeychainPool.default()
+        workers = min(pool.size, len(certificates))
+        pool.warm_in_background(workers)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [runner.submit(executor, read, certificate) for certificate in certificates]
+            return [future.result() for future in futures]
+
     def has_signing_certificates(self, dist_cert, dist_cert_pass):
-        existing_hashes = {codesign_identity[1] for codesign_identity in self.get_codesign_identities()}
-        with TemporaryKeychain() as tk:
-            tk.import_codesign_certificate(dist_cert, dist_cert_pass)
-            codesign_identities = tk.get_codesign_identities()
-            p12_hashes = {codesign_identity[1] for codesign_identity in codesign_identities}
-            return p12_hashes.issubset(existing_hashes)
-
-    def import_codesign_certificate(self, dist_cer_path, dist_cer_pass=None):
+        existing_hashes = IdentityIndex.default().identity_hashes(self)
+        return Keychain.p12_hashes(dist_cert, dist_cert_pass).issubset(existing_hashes)
+
+    def import_codesign_certificates(self, certificates):
+        # set-key-partition-list walks every key in the keychain, so it runs once after all imports
+        # instead of once per certificate.
+        certificates = [(pathlib.Path(path), password) for path, password in certificates]
+        existing_hashes = IdentityIndex.default().identity_hashes(self)
+        results = []
+        for (dist_cert_path, dist_cert_pass), p12_hashes in zip(certificates, Keychain.p12_hashes_many(certificates)):
+            try:
+                if isinstance(p12_hashes, Exception):
+                    raise p12_hashes
+                if p12_hashes and p12_hashes.issubset(existing_hashes):
+                    results.append(CertificateImport(dist_cert_path, CertificateImport.PRESENT, p12_hashes))
+                    continue
+                self.import_codesign_certificate(dist_cert_path, dist_cert_pass, set_partition_list=False)
+            except (OSError, ValueError, subprocess.CalledProcessError) as e:
+                results.append(CertificateImport(dist_cert_path, CertificateImport.FAILED, error=e))
+                continue
+            existing_hashes |= p12_hashes
+            results.append(CertificateImport(dist_cert_path, CertificateImport.IMPORTED, p12_hashes))
+
+        if any(result.status == CertificateImport.IMPORTED for result in results):
+            self.set_apple_tool_partition_list()
+            IdentityIndex.default().invalidate(self)
+        return results
+
+    def import_codesign_certificate(self, dist_cer_path, dist_cer_pass=None, set_partition_list=True):
         if isinstance(dist_cer_path, str):
             dist_cer_path = pathlib.Path(dist_cer_path)
 
@@ -178,29 +233,29 @@ class Keychain:
 
         import_keychain_cmd.extend(['-k', self.path.as_posix()])
         import_keychain_cmd.extend(['-T', '/usr/bin/codesign'])
-        subprocess.run(import_keychain_cmd, check=True, stdout=subprocess.DEVNULL)
-        self.set_apple_tool_partition_list()
+        runner.run(import_keychain_cmd, secrets=[dist_cer_pass], check=True, stdout=subprocess.DEVNULL)
+        if set_partition_list:
+            self.set_apple_tool_partition_list()
 
     def delete(self):
         if self.exists():
             delete_keychain_cmd = ['security', 'delete-keychain', self.path.as_posix()]
-            subprocess.run(delete_keychain_cmd, check=True)
+            runner.run(delete_keychain_cmd, check=True)
         else:
             raise Exception('Keychain deletion failed. Keychain {} does not exist'.format(self.name))
 
-    def add_to_keychain_search(self):
-        if not self.searchable():
-            existing_search_paths = [path.as_posix() for path in Keychains.list_keychain_paths()]
-            list_keychains_cmd = ['security', 'list-keychains']
-            list_keychains_cmd.extend(['-s', self.path.as_posix()])
-            list_keychains_cmd.extend(existing_search_paths)
-            subprocess.run(list_keychains_cmd, check=True)
+    def add_to_keychain_search(self, search=None):
+        if search is not None:
+            search.add(self)
+            return
+        with KeychainSearchList() as search:
+            search.add(self)
 
     def get_codesign_identities(self):
         identity_re = re.compile(r'^\s+(?P<number>\d+)\) (?P<hash>[0-9A-F]+) "(?P<name>.+)"$')
 
         find_identity_cmd = ['security', 'find-identity', '-p', 'codesigning', '-v', self.path.as_posix()]
-        identities = subprocess.check_output(find_identity_cmd).decode(sys.stdout.encoding).split('\n')
+        identities = runner.check_output(find_identity_cmd).decode(sys.stdout.encoding).split('\n')
         valid_identities = []
         for identity in identities:
             matches = identity_re.match(identity)
@@ -210,6 +265,88 @@ class Keychain:
         return valid_identities
 
 
+class CertificateImport:
+    IMPORTED = 'imported'
+    PRESENT = 'present'
+    FAILED = 'failed'
+
+    def __init__(self, path, status, hashes=None, error=None):
+        self.path = path
+        self.status = status
+        self.hashes = sorted(hashes or [])
+        self.error = error
+
+    def __str__(self):
+        detail = str(self.error) if self.error else ', '.join(self.hashes)
+        return '{:<8} {} {}'.format(self.status, self.path.name, detail)
+
+
+class KeychainSearchList:
+    # Reads the user's keychain search list once, applies queued changes in memory and writes them back with a
+    # single `security list-keychains -s`. An advisory lock is held from the read to the write so concurrent
+    # processes cannot lose each other's updates.
+    def __init__(self, lock_path=None):
+        if lock_path is None:
+            lock_path = KeychainSearchList.default_lock_path()
+        self.lock_path = pathlib.Path(lock_path)
+        self.lock_file = None
+        self.original = None
+        self.keychain_paths = None
+
+    @staticmethod
+    def default_lock_path():
+        lock_path = os.environ.get('IRESIGN_SEARCH_LIST_LOCK')
+        if lock_path:
+            return lock_path
+        return pathlib.Path(tempfile.gettempdir()).joinpath('iresign-keychain-search-{}.lock'.format(os.getuid()))
+
+    def __enter__(self):
+        self.lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX)
+            self.original = Keychains.list_keychain_paths()
+        except BaseException:
+            self.lock_file.close()
+            self.lock_file = None
+            raise
+        self.keychain_paths = list(OrderedDict.fromkeys(self.original))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                self.commit()
+        finally:
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.lock_file = None
+
+    @staticmethod
+    def keychain_path(keychain):
+        return keychain.path if isinstance(keychain, Keychain) else pathlib.Path(keychain)
+
+    def contains(self, keychain):
+        keychain_path = KeychainSearchList.keychain_path(keychain)
+        return keychain_path in self.keychain_paths or keychain_path.resolve() in self.keychain_paths
+
+    def add(self, keychain):
+        if not self.contains(keychain):
+            self.keychain_paths.insert(0, KeychainSearchList.keychain_path(keychain))
+
+    def remove(self, keychain):
+        keychain_path = KeychainSearchList.keychain_path(keychain)
+        removed = {keychain_path, keychain_path.resolve()}
+        self.keychain_paths = [path for path in self.keychain_paths if path not in removed]
+
+    def retain(self, predicate):
+        self.keychain_paths = [path for path in self.keychain_paths if predicate(path)]
+
+    def commit(self):
+        if self.keychain_paths != self.original:
+            Keychains.rewrite_keychain_search(self.keychain_paths)
+            self.original = list(self.keychain_paths)
+
+
 class TemporaryKeychain(Keychain):
     def __init__(self):
         name = 'TemporaryKeychain-' + str(random.randrange(0x1000000000))
@@ -221,3 +358,298 @@ class TemporaryKeychain(Keychain):
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.delete()
 
+
+class KeychainPool:
+    PREFIX = 'TemporaryKeychain-pool-'
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, size=4, idle_timeout=300):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.condition = threading.Condition()
+        self.idle = []
+        self.leased = 0
+        self.counter = itertools.count()
+        self.eviction_timer = None
+        self.cleanup_leaked()
+
+    @staticmethod
+    def default():
+        with KeychainPool._default_lock:
+            if KeychainPool._default is None:
+                KeychainPool._default = KeychainPool(size=int(os.environ.get('IRESIGN_KEYCHAIN_POOL_SIZE', '4')))
+                atexit.register(KeychainPool._default.close)
+            return KeychainPool._default
+
+    @staticmethod
+    def keychain_dir():
+        return pathlib.Path.home().joinpath('Library', 'Keychains')
+
+    @staticmethod
+    def owner_pid(path):
+        name = Keychains.clean_keychain_name(path.name)
+        if not name.startswith(KeychainPool.PREFIX):
+            return None
+        pid = name[len(KeychainPool.PREFIX):].split('-')[0]
+        return int(pid) if pid.isdigit() else None
+
+    @staticmethod
+    def is_process_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    @staticmethod
+    def cleanup_leaked():
+        keychain_dir = KeychainPool.keychain_dir()
+        if not keychain_dir.is_dir():
+            return
+        for path in keychain_dir.glob(KeychainPool.PREFIX + '*'):
+            pid = KeychainPool.owner_pid(path)
+            if pid is None or pid == os.getpid() or KeychainPool.is_process_alive(pid):
+                continue
+            try:
+                Keychain(path).delete()
+            except Exception:
+                path.unlink(missing_ok=True)
+
+    def create_keychain(self):
+        name = '{}{}-{}-{}'.format(KeychainPool.PREFIX, os.getpid(), next(self.counter), random.randrange(0x1000000))
+        keychain = Keychain(name, password=name)
+        keychain.create()
+        keychain.unlock()
+        keychain.set_unlock_no_timeout()
+        return keychain
+
+    def warm(self, count=None):
+        count = min(count or self.size, self.size)
+        while True:
+            with self.condition:
+                if len(self.idle) + self.leased >= count:
+                    return
+                self.leased += 1
+            try:
+                keychain = self.create_keychain()
+            except Exception:
+                self.release(None)
+                raise
+            self.release(keychain, dirty=False)
+
+    def warm_in_background(self, count=None):
+        # Callers that are about to lease several keychains at once start creating them while they do other work.
+        thread = threading.Thread(target=self.warm, args=(count,), name='iresign-keychain-pool', daemon=True)
+        thread.start()
+        return thread
+
+    def evict_idle(self):
+        now = time.monotonic()
+        expired = [entry for entry in self.idle if now - entry[1] > self.idle_timeout]
+        self.idle = [entry for entry in self.idle if entry not in expired]
+        return [keychain for keychain, _, _ in expired]
+
+    def schedule_eviction(self):
+        # A long running process that stops leasing must not keep unlocked keychains on the search list, so the
+        # oldest idle keychain is evicted on a timer as well as when keychains are leased and returned.
+        if self.eviction_timer is not None or not self.idle:
+            return
+        oldest = min(idle_time for _, idle_time, _ in self.idle)
+        delay = max(0, oldest + self.idle_timeout - time.monotonic())
+        self.eviction_timer = threading.Timer(delay, self.evict_expired)
+        self.eviction_timer.daemon = True
+        self.eviction_timer.start()
+
+    def evict_expired(self):
+        with self.condition:
+            self.eviction_timer = None
+            expired = self.evict_idle()
+            self.schedule_eviction()
+        for keychain in expired:
+            keychain.delete()
+
+    def acquire(self):
+        with self.condition:
+            expired = self.evict_idle()
+            while not self.idle and self.leased >= self.size:
+                self.condition.wait()
+            keychain, _, dirty = self.idle.pop() if self.idle else (None, None, False)
+            self.leased += 1
+
+        for expired_keychain in expired:
+            expired_keychain.delete()
+
+        try:
+            if keychain is not None and dirty:
+                # Keychains are wiped when they are reused rather than when they are returned, so a keychain
+                # that is only ever leased once is deleted at exit without paying for a wipe first.
+                try:
+                    KeychainPool.wipe(keychain)
+                except Exception:
+                    keychain.delete()
+                    keychain = None
+            if keychain is None:
+                keychain = self.create_keychain()
+        except Exception:
+            self.release(None)
+            raise
+        return keychain
+
+    def release(self, keychain, dirty=True):
+        with self.condition:
+            self.leased -= 1
+            expired = self.evict_idle()
+            if keychain is not None:
+                self.idle.append((keychain, time.monotonic(), dirty))
+            self.schedule_eviction()
+            self.condition.notify()
+
+        for expired_keychain in expired:
+            expired_keychain.delete()
+
+    @contextlib.contextmanager
+    def lease(self):
+        keychain = self.acquire()
+        try:
+            yield keychain
+        finally:
+            self.release(keychain)
+
+    @staticmethod
+    def wipe(keychain):
+        for identity in keychain.get_codesign_identities():
+            delete_identity_cmd = ['security', 'delete-identity', '-Z', identity[1], keychain.path.as_posix()]
+            runner.run(delete_identity_cmd, check=True, stdout=subprocess.DEVNULL)
+
+        find_certificate_cmd = ['security', 'find-certificate', '-a', '-Z', keychain.path.as_posix()]
+        certificates = runner.check_output(find_certificate_cmd).decode(sys.stdout.encoding)
+        for line in certificates.split('\n'):
+            if line.startswith('SHA-1 hash:'):
+                certificate_hash = line.split(':', 1)[1].strip()
+                delete_certificate_cmd = ['security', 'delete-certificate', '-Z', certificate_hash,
+                                          keychain.path.as_posix()]
+                runner.run(delete_certificate_cmd, check=True, stdout=subprocess.DEVNULL)
+
+    def close(self):
+        with self.condition:
+            if self.eviction_timer is not None:
+                self.eviction_timer.cancel()
+                self.eviction_timer = None
+            idle = self.idle
+            self.idle = []
+        for keychain, _, _ in idle:
+            if keychain.exists():
+                keychain.delete()
+
+
+class IdentityIndex:
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, cache_path=None, workers=8):
+        self.cache_path = pathlib.Path(cache_path) if cache_path else None
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.hashes = {}
+        self.load()
+
+    @staticmethod
+    def default():
+        with IdentityIndex._default_lock:
+            if IdentityIndex._default is None:
+                IdentityIndex._default = IdentityIndex(cache_path=os.environ.get('IRESIGN_IDENTITY_INDEX'))
+            return IdentityIndex._default
+
+    @staticmethod
+    def fingerprint(keychain):
+        try:
+            st = keychain.path.stat()
+        except OSError:
+            return None
+        return [st.st_mtime_ns, st.st_size]
+
+    def load(self):
+        if not self.cache_path or not self.cache_path.is_file():
+            return
+        try:
+            with open(self.cache_path, 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(entries, dict):
+            self.entries = entries
+            self.rebuild()
+
+    def rebuild(self):
+        hashes = {}
+        for keychain_path, entry in self.entries.items():
+            for identity_hash in entry['hashes']:
+                hashes.setdefault(identity_hash, set()).add(keychain_path)
+        self.hashes = hashes
+
+    def save(self):
+        if not self.cache_path:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(prefix='.identities-', dir=self.cache_path.parent)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
+            os.replace(temp_path, self.cache_path)
+        except OSError:
+            pass
+
+    def is_fresh(self, keychain):
+        entry = self.entries.get(keychain.path.as_posix())
+        return entry is not None and entry['fingerprint'] == IdentityIndex.fingerprint(keychain)
+
+    def invalidate(self, keychain):
+        with self.lock:
+            self.entries.pop(keychain.path.as_posix(), None)
+            self.rebuild()
+
+    def refresh(self, keychains):
+        stale = [keychain for keychain in keychains if not self.is_fresh(keychain)]
+        if not stale:
+            return
+
+        def read(keychain):
+            fingerprint = IdentityIndex.fingerprint(keychain)
+            if fingerprint is None:
+                return keychain, fingerprint, []
+            identities = keychain.get_codesign_identities()
+            return keychain, fingerprint, sorted({identity[1].upper() for identity in identities})
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(stale)))) as executor:
+            results = [future.result() for future in [runner.submit(executor, read, keychain) for keychain in stale]]
+
+        with self.lock:
+            for keychain, fingerprint, hashes in results:
+                self.entries[keychain.path.as_posix()] = {'fingerprint': fingerprint, 'hashes': hashes}
+            self.rebuild()
+        self.save()
+
+    def identity_hashes(self, keychain):
+        self.refresh([keychain])
+        return set(self.entries[keychain.path.as_posix()]['hashes'])
+
+    def available_hashes(self, keychains):
+        # Only the given keychains count; the index may still hold entries for keychains that have since gone.
+        self.refresh(keychains)
+        with self.lock:
+            hashes = set()
+            for keychain in keychains:
+                entry = self.entries.get(keychain.path.as_posix())
+                if entry:
+                    hashes.update(entry['hashes'])
+            return hashes
+
+    def keychains_with_hash(self, certificate_hash, keychains):
+        self.refresh(keychains)
+        keychain_paths = self.hashes.get(certificate_hash.upper(), set())
+        return [keychain.path for keychain in keychains if keychain.path.as_posix() in keychain_paths]
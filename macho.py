@@ -0,0 +1,198 @@
+import hashlib
+import struct
+
+MH_MAGIC = 0xfeedface
+MH_MAGIC_64 = 0xfeedfacf
+FAT_MAGIC = 0xcafebabe
+FAT_MAGIC_64 = 0xcafebabf
+
+MH_EXECUTE = 0x2
+
+LC_SEGMENT = 0x1
+LC_SEGMENT_64 = 0x19
+LC_CODE_SIGNATURE = 0x1d
+
+CSMAGIC_REQUIREMENT = 0xfade0c00
+CSMAGIC_REQUIREMENTS = 0xfade0c01
+CSMAGIC_CODEDIRECTORY = 0xfade0c02
+CSMAGIC_EMBEDDED_SIGNATURE = 0xfade0cc0
+CSMAGIC_EMBEDDED_ENTITLEMENTS = 0xfade7171
+CSMAGIC_EMBEDDED_DER_ENTITLEMENTS = 0xfade7172
+CSMAGIC_BLOBWRAPPER = 0xfade0b01
+
+CSSLOT_CODEDIRECTORY = 0
+CSSLOT_INFOSLOT = 1
+CSSLOT_REQUIREMENTS = 2
+CSSLOT_RESOURCEDIR = 3
+CSSLOT_APPLICATION = 4
+CSSLOT_ENTITLEMENTS = 5
+CSSLOT_DER_ENTITLEMENTS = 7
+CSSLOT_ALTERNATE_CODEDIRECTORIES = 0x1000
+CSSLOT_SIGNATURESLOT = 0x10000
+
+CS_HASHTYPE_SHA1 = 1
+CS_HASHTYPE_SHA256 = 2
+
+HASH_NAMES = {
+    CS_HASHTYPE_SHA1: 'sha1',
+    CS_HASHTYPE_SHA256: 'sha256',
+}
+
+
+class MachOError(Exception):
+    pass
+
+
+class Segment:
+    def __init__(self, name, command_offset, is_64, vmaddr, vmsize, fileoff, filesize):
+        self.name = name
+        self.command_offset = command_offset
+        self.is_64 = is_64
+        self.vmaddr = vmaddr
+        self.vmsize = vmsize
+        self.fileoff = fileoff
+        self.filesize = filesize
+
+
+class CodeSignatureCommand:
+    def __init__(self, command_offset, dataoff, datasize):
+        self.command_offset = command_offset
+        self.dataoff = dataoff
+        self.datasize = datasize
+
+
+class MachO:
+    def __init__(self, data):
+        self.data = data
+        if len(data) < 28:
+            raise MachOError('File is too small to be a Mach-O binary')
+        magic = struct.unpack_from('<I', data, 0)[0]
+        if magic == MH_MAGIC_64:
+            self.is_64 = True
+            self.header_size = 32
+        elif magic == MH_MAGIC:
+            self.is_64 = False
+            self.header_size = 28
+        else:
+            raise MachOError('Unsupported Mach-O magic {:#x}'.format(magic))
+
+        (_, self.cputype, self.cpusubtype, self.filetype,
+         self.ncmds, self.sizeofcmds, self.flags) = struct.unpack_from('<7I', data, 0)
+
+        self.segments = {}
+        self.code_signature = None
+        self.first_section_offset = None
+        offset = self.header_size
+        for _ in range(self.ncmds):
+            cmd, cmdsize = struct.unpack_from('<2I', data, offset)
+            if cmdsize < 8:
+                raise MachOError('Corrupt load command at offset {}'.format(offset))
+            if cmd in (LC_SEGMENT, LC_SEGMENT_64):
+                self.parse_segment(cmd, offset)
+            elif cmd == LC_CODE_SIGNATURE:
+                dataoff, datasize = struct.unpack_from('<2I', data, offset + 8)
+                self.code_signature = CodeSignatureCommand(offset, dataoff, datasize)
+            offset += cmdsize
+        self.load_commands_end = offset
+
+    def parse_segment(self, cmd, offset):
+        name = bytes(self.data[offset + 8:offset + 24]).rstrip(b'\0').decode('ascii', 'replace')
+        if cmd == LC_SEGMENT_64:
+            vmaddr, vmsize, fileoff, filesize = struct.unpack_from('<4Q', self.data, offset + 24)
+            nsects = struct.unpack_from('<I', self.data, offset + 64)[0]
+            section_offset, section_size, section_fileoff = offset + 72, 80, 48
+        else:
+            vmaddr, vmsize, fileoff, filesize = struct.unpack_from('<4I', self.data, offset + 24)
+            nsects = struct.unpack_from('<I', self.data, offset + 48)[0]
+            section_offset, section_size, section_fileoff = offset + 56, 68, 40
+        self.segments[name] = Segment(name, offset, cmd == LC_SEGMENT_64, vmaddr, vmsize, fileoff, filesize)
+
+        for i in range(nsects):
+            fileoff = struct.unpack_from('<I', self.data, section_offset + i * section_size + section_fileoff)[0]
+            if fileoff and (self.first_section_offset is None or fileoff < self.first_section_offset):
+                self.first_section_offset = fileoff
+
+    def embedded_signature(self):
+        if not self.code_signature:
+            return None
+        start = self.code_signature.dataoff
+        return bytes(self.data[start:start + self.code_signature.datasize])
+
+
+class FatArch:
+    def __init__(self, cputype, cpusubtype, offset, size, align):
+        self.cputype = cputype
+        self.cpusubtype = cpusubtype
+        self.offset = offset
+        self.size = size
+        self.align = align
+
+
+def fat_arches(data):
+    magic = struct.unpack_from('>I', data, 0)[0]
+    if magic not in (FAT_MAGIC, FAT_MAGIC_64):
+        return None
+    count = struct.unpack_from('>I', data, 4)[0]
+    arches = []
+    offset = 8
+    for _ in range(count):
+        if magic == FAT_MAGIC:
+            cputype, cpusubtype, arch_offset, size, align = struct.unpack_from('>5I', data, offset)
+            offset += 20
+        else:
+            cputype, cpusubtype, arch_offset, size, align, _ = struct.unpack_from('>2I2Q2I', data, offset)
+            offset += 32
+        arches.append(FatArch(cputype, cpusubtype, arch_offset, size, align))
+    return arches
+
+
+def slices(data):
+    arches = fat_arches(data)
+    if arches is None:
+        return [MachO(data)]
+    return [MachO(memoryview(data)[arch.offset:arch.offset + arch.size]) for arch in arches]
+
+
+def is_macho(data):
+    if len(data) < 4:
+        return False
+    return struct.unpack_from('<I', data, 0)[0] in (MH_MAGIC, MH_MAGIC_64) or \
+        struct.unpack_from('>I', data, 0)[0] in (FAT_MAGIC, FAT_MAGIC_64)
+
+
+def parse_superblob(blob):
+    if len(blob) < 12:
+        return {}
+    magic, length, count = struct.unpack_from('>3I', blob, 0)
+    if magic != CSMAGIC_EMBEDDED_SIGNATURE:
+        raise MachOError('Unexpected code signature magic {:#x}'.format(magic))
+    blobs = {}
+    for i in range(count):
+        slot, offset = struct.unpack_from('>2I', blob, 12 + i * 8)
+        _, blob_length = struct.unpack_from('>2I', blob, offset)
+        blobs[slot] = bytes(blob[offset:offset + blob_length])
+    return blobs
+
+
+def blob_payload(blob):
+    return blob[8:]
+
+
+def code_directory_hash_type(code_directory):
+    return code_directory[37]
+
+
+def cdhash(code_directory):
+    name = HASH_NAMES.get(code_directory_hash_type(code_directory))
+    if name is None:
+        raise MachOError('Unsupported code directory hash type {}'.format(code_directory_hash_type(code_directory)))
+    return hashlib.new(name, code_directory).digest()[:20]
+
+
+def best_code_directory(blobs):
+    code_directories = [blobs[slot] for slot in sorted(blobs)
+                        if slot == CSSLOT_CODEDIRECTORY or
+                        CSSLOT_ALTERNATE_CODEDIRECTORIES <= slot < CSSLOT_ALTERNATE_CODEDIRECTORIES + 5]
+    if not code_directories:
+        return None
+    return max(code_directories, key=code_directory_hash_type)
@@ -1,5 +1,6 @@
 import hashlib
 import pathlib
+import warnings
 
 
 def paths_from_lines(string):
@@ -20,3 +21,21 @@ def remove_end(text, suffix):
 def signer_hash(certificate):
     return hashlib.sha1(certificate).hexdigest().upper()
 
+
+def pkcs12_signer_hashes(p12_path, password=None):
+    try:
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.serialization import pkcs12
+    except ImportError:
+        return None
+
+    with open(p12_path, 'rb') as f:
+        p12_data = f.read()
+    password = password.encode('utf-8') if password else None
+    with warnings.catch_warnings():
+        # Keychain Access exports BER encoded bundles, which cryptography warns about.
+        warnings.simplefilter('ignore', UserWarning)
+        key, certificate, _ = pkcs12.load_key_and_certificates(p12_data, password)
+    if key is None or certificate is None:
+        return set()
+    return {signer_hash(certificate.public_bytes(serialization.Encoding.DER))}
@@ -1,22 +1,22 @@
 import pathlib
 import plistlib
-import subprocess
 
-from keychains import TemporaryKeychain
+import cms
 from misc import signer_hash
 
 
 class Mobileprovision:
-    def __init__(self, mobileprovision):
+    def __init__(self, mobileprovision, verify=False):
         self.mobileprovision = pathlib.Path(mobileprovision).resolve()
+        self.verify = verify
+        self._plist = None
 
     def plist(self):
-        with TemporaryKeychain() as tk:
-            cms_cmd = ['security', 'cms', '-D']
-            cms_cmd.extend(['-k', tk.path.as_posix()])
-            cms_cmd.extend(['-i', self.mobileprovision.as_posix()])
-            plist_string = subprocess.check_output(cms_cmd)
-            return plistlib.loads(plist_string)
+        if self._plist is None:
+            with open(self.mobileprovision, 'rb') as f:
+                plist_string = cms.decode(f.read(), verify=self.verify)
+            self._plist = plistlib.loads(plist_string)
+        return self._plist
 
     def developer_certificates(self):
         return self.plist()['DeveloperCertificates']
@@ -30,4 +30,3 @@ class Mobileprovision:
             return signer_hash(certs[-1])
 
         return None
-
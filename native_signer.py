@@ -0,0 +1,416 @@
+import concurrent.futures
+import hashlib
+import mmap
+import os
+import pathlib
+import plistlib
+import shutil
+import struct
+import tempfile
+import threading
+import warnings
+
+import cms
+import der
+import macho
+import runner
+from misc import signer_hash
+from resource_seal import ResourceSealer
+
+PAGE_SIZE_LOG2 = 12
+PAGE_SIZE = 1 << PAGE_SIZE_LOG2
+PAGES_PER_TASK = 256
+
+CODEDIRECTORY_VERSION = 0x20400
+CODEDIRECTORY_HEADER_SIZE = 88
+
+CS_EXECSEG_MAIN_BINARY = 0x1
+CS_EXECSEG_ALLOW_UNSIGNED = 0x10
+
+REQUIREMENT_DESIGNATED = 3
+OP_IDENT = 2
+OP_AND = 6
+OP_CERT_FIELD = 11
+OP_CERT_GENERIC = 14
+OP_APPLE_GENERIC_ANCHOR = 15
+MATCH_EXISTS = 0
+MATCH_EQUAL = 1
+
+OID_APPLE_CDHASHES = '1.2.840.113635.100.9.1'
+OID_APPLE_CDHASHES2 = '1.2.840.113635.100.9.2'
+OID_APPLE_WWDR_INTERMEDIATE = '1.2.840.113635.100.6.2.1'
+
+
+class NativeSigningError(Exception):
+    pass
+
+
+def align(value, alignment):
+    return (value + alignment - 1) // alignment * alignment
+
+
+def blob(magic, payload):
+    return struct.pack('>2I', magic, len(payload) + 8) + payload
+
+
+def requirement_data(value):
+    return struct.pack('>I', len(value)) + value + b'\0' * (align(len(value), 4) - len(value))
+
+
+def designated_requirement(identifier, common_name):
+    oid_content = der.parse(der.oid(OID_APPLE_WWDR_INTERMEDIATE)).data
+    expression = b''.join([
+        struct.pack('>I', OP_AND),
+        struct.pack('>I', OP_AND),
+        struct.pack('>I', OP_AND),
+        struct.pack('>I', OP_IDENT), requirement_data(identifier.encode('utf-8')),
+        struct.pack('>I', OP_APPLE_GENERIC_ANCHOR),
+        struct.pack('>Ii', OP_CERT_FIELD, 0), requirement_data(b'subject.CN'),
+        struct.pack('>I', MATCH_EQUAL), requirement_data(common_name.encode('utf-8')),
+        struct.pack('>Ii', OP_CERT_GENERIC, 1), requirement_data(oid_content),
+        struct.pack('>I', MATCH_EXISTS),
+    ])
+    requirement = blob(macho.CSMAGIC_REQUIREMENT, struct.pack('>I', 1) + expression)
+    return blob(macho.CSMAGIC_REQUIREMENTS, struct.pack('>3I', 1, REQUIREMENT_DESIGNATED, 20) + requirement)
+
+
+def der_entitlement_value(value):
+    if isinstance(value, bool):
+        return der.boolean(value)
+    if isinstance(value, int):
+        return der.integer(value)
+    if isinstance(value, str):
+        return der.utf8_string(value)
+    if isinstance(value, (list, tuple)):
+        return der.sequence(*[der_entitlement_value(item) for item in value])
+    if isinstance(value, dict):
+        entries = [der.sequence(der.utf8_string(key), der_entitlement_value(value[key])) for key in sorted(value)]
+        return der.implicit(der.TAG_SEQUENCE, b''.join(entries), constructed=True)
+    raise NativeSigningError('Entitlement values of type {} cannot be DER encoded'.format(type(value).__name__))
+
+
+def der_entitlements(entitlements):
+    content = der.integer(1) + der_entitlement_value(entitlements)
+    return der.encode(der.TAG_SEQUENCE, content, tag_class=der.CLASS_APPLICATION, constructed=True)
+
+
+def hash_pages(view, start_page, end_page, code_limit, hash_names):
+    hashes = {name: [] for name in hash_names}
+    for page in range(start_page, end_page):
+        start = page * PAGE_SIZE
+        chunk = view[start:min(start + PAGE_SIZE, code_limit)]
+        for name in hash_names:
+            hashes[name].append(hashlib.new(name, chunk).digest())
+    return hashes
+
+
+class SpecialSlots:
+    def __init__(self, info_plist=None, requirements=None, code_resources=None, entitlements=None,
+                 der_entitlements=None):
+        self.slots = {
+            macho.CSSLOT_INFOSLOT: info_plist,
+            macho.CSSLOT_REQUIREMENTS: requirements,
+            macho.CSSLOT_RESOURCEDIR: code_resources,
+            macho.CSSLOT_ENTITLEMENTS: entitlements,
+            macho.CSSLOT_DER_ENTITLEMENTS: der_entitlements,
+        }
+
+    def count(self):
+        used = [slot for slot, data in self.slots.items() if data is not None]
+        return max(used) if used else 0
+
+    def hashes(self, hash_name, hash_size):
+        hashes = []
+        for slot in range(self.count(), 0, -1):
+            data = self.slots.get(slot)
+            hashes.append(hashlib.new(hash_name, data).digest() if data is not None else b'\0' * hash_size)
+        return b''.join(hashes)
+
+
+def code_directory_size(identifier, team_id, special_count, page_count, hash_size):
+    size = CODEDIRECTORY_HEADER_SIZE + len(identifier.encode('utf-8')) + 1
+    if team_id:
+        size += len(team_id.encode('utf-8')) + 1
+    return size + (special_count + page_count) * hash_size
+
+
+def code_directory(identifier, team_id, special_slots, page_hashes, code_limit, hash_type, exec_segment):
+    hash_name = macho.HASH_NAMES[hash_type]
+    hash_size = hashlib.new(hash_name).digest_size
+    ident = identifier.encode('utf-8') + b'\0'
+    team = team_id.encode('utf-8') + b'\0' if team_id else b''
+    special_count = special_slots.count()
+
+    ident_offset = CODEDIRECTORY_HEADER_SIZE
+    team_offset = ident_offset + len(ident) if team else 0
+    hash_offset = ident_offset + len(ident) + len(team) + special_count * hash_size
+    length = hash_offset + len(page_hashes) * hash_size
+    exec_base, exec_limit, exec_flags = exec_segment
+
+    header = struct.pack('>9I4B4IQ3Q',
+                         macho.CSMAGIC_CODEDIRECTORY, length, CODEDIRECTORY_VERSION, 0,
+                         hash_offset, ident_offset, special_count, len(page_hashes),
+                         code_limit if code_limit < 1 << 32 else 0,
+                         hash_size, hash_type, 0, PAGE_SIZE_LOG2,
+                         0, 0, team_offset, 0,
+                         code_limit if code_limit >= 1 << 32 else 0,
+                         exec_base, exec_limit, exec_flags)
+    return header + ident + team + special_slots.hashes(hash_name, hash_size) + b''.join(page_hashes)
+
+
+def superblob(blobs):
+    header_size = 12 + 8 * len(blobs)
+    index = b''
+    payload = b''
+    for slot, data in blobs:
+        index += struct.pack('>2I', slot, header_size + len(payload))
+        payload += data
+    return struct.pack('>3I', macho.CSMAGIC_EMBEDDED_SIGNATURE, header_size + len(payload), len(blobs)) + index + \
+        payload
+
+
+class NativeSigner:
+    name = 'native'
+
+    def __init__(self, p12_path, password=None, workers=None):
+        try:
+            from cryptography import x509
+            from cryptography.hazmat.primitives import serialization
+            from cryptography.hazmat.primitives.serialization import pkcs12
+        except ImportError:
+            raise NativeSigningError('The native signing backend requires the cryptography package')
+
+        with open(p12_path, 'rb') as f:
+            p12_data = f.read()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            key, certificate, chain = pkcs12.load_key_and_certificates(
+                p12_data, password.encode('utf-8') if password else None)
+        if key is None or certificate is None:
+            raise NativeSigningError('{} does not contain a signing identity'.format(p12_path))
+
+        self.key = key
+        self.certificate = certificate
+        self.chain = chain or []
+        self.certificates_size = sum(len(c.public_bytes(serialization.Encoding.DER))
+                                     for c in [certificate] + self.chain)
+        self.signer_hash = signer_hash(certificate.public_bytes(serialization.Encoding.DER))
+        self.common_name = NativeSigner.name_attribute(certificate, x509.NameOID.COMMON_NAME)
+        self.team_id = NativeSigner.name_attribute(certificate, x509.NameOID.ORGANIZATIONAL_UNIT_NAME)
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = None
+        self.executor_lock = threading.Lock()
+        self.sealer = ResourceSealer(self.workers)
+
+    @staticmethod
+    def name_attribute(certificate, oid):
+        attributes = certificate.subject.get_attributes_for_oid(oid)
+        return attributes[0].value if attributes else ''
+
+    def pool(self):
+        with self.executor_lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+            return self.executor
+
+    def close(self):
+        self.sealer.close()
+        with self.executor_lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+    def sign(self, signable_path, signer_hash=None, entitlements_path=None):
+        if signer_hash and signer_hash.upper() != self.signer_hash:
+            raise NativeSigningError('Signing identity {} does not match the profile certificate {}'.format(
+                self.signer_hash, signer_hash))
+
+        signable_path = pathlib.Path(signable_path)
+        entitlements = None
+        if entitlements_path:
+            with open(entitlements_path, 'rb') as f:
+                entitlements = f.read()
+
+        if signable_path.is_dir():
+            info_plist_path = signable_path.joinpath('Info.plist')
+            info_plist = info_plist_path.read_bytes()
+            info = plistlib.loads(info_plist)
+            if 'CFBundleExecutable' not in info:
+                raise NativeSigningError('{} has no CFBundleExecutable in its Info.plist'.format(signable_path))
+            executable = signable_path.joinpath(info['CFBundleExecutable'])
+            identifier = info.get('CFBundleIdentifier', executable.name)
+            with runner.stage('seal resources'):
+                code_resources = self.sealer.seal(signable_path, executable.name)
+            self.sign_binary(executable, identifier, SpecialSlots(info_plist=info_plist,
+                                                                  code_resources=code_resources),
+                             entitlements)
+        else:
+            identifier = signable_path.name
+            if identifier.endswith('.dylib'):
+                identifier = identifier[:-len('.dylib')]
+            self.sign_binary(signable_path, identifier, SpecialSlots(), entitlements)
+
+    def sign_binary(self, path, identifier, special_slots, entitlements):
+        special_slots.slots[macho.CSSLOT_REQUIREMENTS] = designated_requirement(identifier, self.common_name)
+        entitlement_blobs = []
+        if entitlements is not None:
+            entitlement_values = plistlib.loads(entitlements)
+            entitlements_blob = blob(macho.CSMAGIC_EMBEDDED_ENTITLEMENTS, entitlements)
+            der_entitlements_blob = blob(macho.CSMAGIC_EMBEDDED_DER_ENTITLEMENTS, der_entitlements(entitlement_values))
+            special_slots.slots[macho.CSSLOT_ENTITLEMENTS] = entitlements_blob
+            special_slots.slots[macho.CSSLOT_DER_ENTITLEMENTS] = der_entitlements_blob
+            entitlement_blobs = [(macho.CSSLOT_ENTITLEMENTS, entitlements_blob),
+                                 (macho.CSSLOT_DER_ENTITLEMENTS, der_entitlements_blob)]
+        else:
+            entitlement_values = {}
+
+        with open(path, 'rb') as f:
+            head = f.read(8)
+        if len(head) >= 4 and struct.unpack_from('>I', head)[0] in (macho.FAT_MAGIC, macho.FAT_MAGIC_64):
+            self.sign_fat(path, identifier, special_slots, entitlement_blobs, entitlement_values)
+        else:
+            self.sign_thin(path, identifier, special_slots, entitlement_blobs, entitlement_values)
+
+    def sign_fat(self, path, identifier, special_slots, entitlement_blobs, entitlement_values):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic = struct.unpack_from('>I', data, 0)[0]
+        arches = macho.fat_arches(data)
+
+        signed_slices = []
+        with tempfile.TemporaryDirectory(prefix='.native-sign-', dir=path.parent) as t:
+            for i, arch in enumerate(arches):
+                slice_path = pathlib.Path(t).joinpath('slice{}'.format(i))
+                slice_path.write_bytes(data[arch.offset:arch.offset + arch.size])
+                self.sign_thin(slice_path, identifier, special_slots, entitlement_blobs, entitlement_values)
+                signed_slices.append(slice_path.read_bytes())
+
+            entry_size = 20 if magic == macho.FAT_MAGIC else 32
+            offset = 8 + entry_size * len(arches)
+            header = struct.pack('>2I', magic, len(arches))
+            layout = []
+            for arch, signed in zip(arches, signed_slices):
+                offset = align(offset, 1 << arch.align)
+                if magic == macho.FAT_MAGIC:
+                    header += struct.pack('>5I', arch.cputype, arch.cpusubtype, offset, len(signed), arch.align)
+                else:
+                    header += struct.pack('>2I2Q2I', arch.cputype, arch.cpusubtype, offset, len(signed),
+                                          arch.align, 0)
+                layout.append((offset, signed))
+                offset += len(signed)
+
+            output_path = pathlib.Path(t).joinpath('fat')
+            with open(output_path, 'wb') as out:
+                out.write(header)
+                for slice_offset, signed in layout:
+                    out.write(b'\0' * (slice_offset - out.tell()))
+                    out.write(signed)
+            shutil.copymode(path, output_path)
+            os.replace(output_path, path)
+
+    def sign_thin(self, path, identifier, special_slots, entitlement_blobs, entitlement_values):
+        with open(path, 'r+b') as f:
+            head = f.read(32)
+            sizeofcmds = struct.unpack_from('<I', head, 20)[0]
+            f.seek(0)
+            header = bytearray(f.read(32 + sizeofcmds + 16))
+            image = macho.MachO(header)
+
+            linkedit = image.segments.get('__LINKEDIT')
+            if linkedit is None:
+                raise NativeSigningError('{} has no __LINKEDIT segment'.format(path))
+
+            if image.code_signature:
+                code_limit = image.code_signature.dataoff
+                command_offset = image.code_signature.command_offset
+            else:
+                code_limit = align(linkedit.fileoff + linkedit.filesize, 16)
+                command_offset = image.load_commands_end
+                first_content = image.first_section_offset or code_limit
+                if command_offset + 16 > first_content:
+                    raise NativeSigningError('{} has no room for a code signature load command'.format(path))
+                struct.pack_into('<4I', header, command_offset, macho.LC_CODE_SIGNATURE, 16, 0, 0)
+                struct.pack_into('<2I', header, 16, image.ncmds + 1, image.sizeofcmds + 16)
+
+            page_count = (code_limit + PAGE_SIZE - 1) // PAGE_SIZE
+            special_count = max(special_slots.count(), macho.CSSLOT_REQUIREMENTS)
+            team_id = self.team_id
+            cd_sizes = [code_directory_size(identifier, team_id, special_count, page_count, size) for size in (20, 32)]
+            fixed_blobs = [special_slots.slots[macho.CSSLOT_REQUIREMENTS]] + [b for _, b in entitlement_blobs]
+            cms_reserve = 4096 + self.certificates_size
+            signature_size = 12 + 8 * (3 + len(fixed_blobs)) + sum(cd_sizes) + sum(len(b) for b in fixed_blobs) + \
+                8 + cms_reserve
+            datasize = align(signature_size, 16)
+
+            struct.pack_into('<2I', header, command_offset + 8, code_limit, datasize)
+            linkedit_filesize = code_limit + datasize - linkedit.fileoff
+            linkedit_vmsize = max(linkedit.vmsize, align(linkedit_filesize, 0x4000))
+            if linkedit.is_64:
+                struct.pack_into('<Q', header, linkedit.command_offset + 32, linkedit_vmsize)
+                struct.pack_into('<Q', header, linkedit.command_offset + 48, linkedit_filesize)
+            else:
+                struct.pack_into('<I', header, linkedit.command_offset + 28, linkedit_vmsize)
+                struct.pack_into('<I', header, linkedit.command_offset + 36, linkedit_filesize)
+
+            f.seek(0)
+            f.write(header)
+            f.truncate(code_limit)
+            f.truncate(code_limit + datasize)
+            f.flush()
+
+            text = image.segments.get('__TEXT')
+            exec_flags = 0
+            if image.filetype == macho.MH_EXECUTE:
+                exec_flags |= CS_EXECSEG_MAIN_BINARY
+                if entitlement_values.get('get-task-allow'):
+                    exec_flags |= CS_EXECSEG_ALLOW_UNSIGNED
+            exec_segment = (text.fileoff, text.filesize, exec_flags) if text else (0, 0, 0)
+
+            with mmap.mmap(f.fileno(), code_limit, access=mmap.ACCESS_READ) as view:
+                page_hashes = self.hash_pages(view, page_count, code_limit)
+
+            code_directories = [
+                code_directory(identifier, team_id, special_slots, page_hashes['sha1'], code_limit,
+                               macho.CS_HASHTYPE_SHA1, exec_segment),
+                code_directory(identifier, team_id, special_slots, page_hashes['sha256'], code_limit,
+                               macho.CS_HASHTYPE_SHA256, exec_segment),
+            ]
+            signature = blob(macho.CSMAGIC_BLOBWRAPPER, self.cms_signature(code_directories))
+
+            blobs = [(macho.CSSLOT_CODEDIRECTORY, code_directories[0]),
+                     (macho.CSSLOT_REQUIREMENTS, special_slots.slots[macho.CSSLOT_REQUIREMENTS])]
+            blobs.extend(entitlement_blobs)
+            blobs.append((macho.CSSLOT_ALTERNATE_CODEDIRECTORIES, code_directories[1]))
+            blobs.append((macho.CSSLOT_SIGNATURESLOT, signature))
+            embedded = superblob(blobs)
+            if len(embedded) > datasize:
+                raise NativeSigningError('Code signature for {} outgrew its reserved space'.format(path))
+
+            f.seek(code_limit)
+            f.write(embedded + b'\0' * (datasize - len(embedded)))
+
+    def hash_pages(self, view, page_count, code_limit):
+        hash_names = ['sha1', 'sha256']
+        tasks = [(start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK)]
+        if len(tasks) <= 1:
+            results = [hash_pages(view, start, end, code_limit, hash_names) for start, end in tasks]
+        else:
+            executor = self.pool()
+            futures = [executor.submit(hash_pages, view, start, end, code_limit, hash_names) for start, end in tasks]
+            results = [future.result() for future in futures]
+
+        page_hashes = {name: [] for name in hash_names}
+        for result in results:
+            for name in hash_names:
+                page_hashes[name].extend(result[name])
+        return page_hashes
+
+    def cms_signature(self, code_directories):
+        cdhashes = plistlib.dumps({'cdhashes': [macho.cdhash(cd) for cd in code_directories]})
+        sha256_cdhash = hashlib.sha256(code_directories[1]).digest()
+        attributes = [
+            cms.attribute(OID_APPLE_CDHASHES, der.octet_string(cdhashes)),
+            cms.attribute(OID_APPLE_CDHASHES2, der.sequence(der.oid(cms.OID_SHA256), der.octet_string(sha256_cdhash))),
+        ]
+        return cms.sign_detached(code_directories[0], self.key, self.certificate, self.chain, attributes)
+
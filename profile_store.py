@@ -0,0 +1,209 @@
+import calendar
+import concurrent.futures
+import datetime
+import json
+import os
+import pathlib
+import plistlib
+import tempfile
+import threading
+import time
+import zipfile
+
+import runner
+from cms import CmsError
+from misc import signer_hash
+from mobileprovision import Mobileprovision
+
+
+class ProfileStoreError(Exception):
+    pass
+
+
+def bundle_identifier(app_path):
+    app_path = pathlib.Path(app_path)
+    if app_path.suffix == '.ipa':
+        with zipfile.ZipFile(app_path) as z:
+            for name in z.namelist():
+                parts = name.split('/')
+                if len(parts) == 3 and parts[0] == 'Payload' and parts[1].endswith('.app') and \
+                        parts[2] == 'Info.plist':
+                    return plistlib.loads(z.read(name)).get('CFBundleIdentifier')
+        return None
+    info_plist_path = app_path.joinpath('Info.plist')
+    if not info_plist_path.is_file():
+        return None
+    with open(info_plist_path, 'rb') as f:
+        return plistlib.load(f).get('CFBundleIdentifier')
+
+
+def app_id_matches(app_id, team_id, bundle_id):
+    if team_id and app_id.startswith(team_id + '.'):
+        app_id = app_id[len(team_id) + 1:]
+    if app_id.endswith('*'):
+        return bundle_id.startswith(app_id[:-1])
+    return app_id == bundle_id
+
+
+def expiration_timestamp(expires):
+    if not expires:
+        return None
+    if isinstance(expires, str):
+        # Hand-written profiles sometimes carry the date as an ISO 8601 string rather than a plist date.
+        expires = datetime.datetime.fromisoformat(expires.replace('Z', '+00:00'))
+    if not isinstance(expires, datetime.datetime):
+        raise ValueError('ExpirationDate is not a date: {!r}'.format(expires))
+    return calendar.timegm(expires.utctimetuple())
+
+
+def specificity(app_id):
+    # Exact application identifiers beat wildcards, and longer wildcard prefixes beat shorter ones.
+    return (0 if app_id.endswith('*') else 1), len(app_id)
+
+
+class ProfileStore:
+    def __init__(self, directory=None, cache_path=None, verify=False, workers=8):
+        self.directory = pathlib.Path(directory) if directory else ProfileStore.default_directory()
+        if cache_path is None:
+            cache_path = ProfileStore.default_cache_path()
+        self.cache_path = pathlib.Path(cache_path) if cache_path else None
+        self.verify = verify
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.mobileprovisions = {}
+        self.skipped = {}
+        self.scanned = False
+        self.load()
+
+    @staticmethod
+    def default_directory():
+        return pathlib.Path.home().joinpath('Library', 'MobileDevice', 'Provisioning Profiles')
+
+    @staticmethod
+    def default_cache_path():
+        cache_path = os.environ.get('IRESIGN_PROFILE_INDEX')
+        if cache_path is not None:
+            return cache_path
+        cache_home = os.environ.get('XDG_CACHE_HOME') or pathlib.Path.home().joinpath('.cache')
+        return pathlib.Path(cache_home).joinpath('iresign', 'profiles.json')
+
+    def load(self):
+        if not self.cache_path or not self.cache_path.is_file():
+            return
+        try:
+            with open(self.cache_path, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(index, dict) and index.get('directory') == self.directory.as_posix():
+            self.entries = index.get('profiles', {})
+
+    def save(self):
+        if not self.cache_path:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(prefix='.profiles-', dir=self.cache_path.parent)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'directory': self.directory.as_posix(), 'profiles': self.entries}, f, indent=2,
+                          sort_keys=True)
+            os.replace(temp_path, self.cache_path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def fingerprint(stat):
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def describe(self, path):
+        plist = Mobileprovision(path, verify=self.verify).plist()
+        entitlements = plist.get('Entitlements', {})
+        team_ids = plist.get('TeamIdentifier') or []
+        expires = plist.get('ExpirationDate')
+        return {
+            'uuid': plist.get('UUID'),
+            'name': plist.get('Name'),
+            'team_id': team_ids[0] if team_ids else entitlements.get('com.apple.developer.team-identifier'),
+            'app_id': entitlements.get('application-identifier', ''),
+            'expires': expiration_timestamp(expires),
+            'certificates': [signer_hash(certificate) for certificate in plist.get('DeveloperCertificates', [])],
+        }
+
+    def scan(self):
+        current = {}
+        if self.directory.is_dir():
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith('.mobileprovision') and entry.is_file():
+                        current[entry.path] = ProfileStore.fingerprint(entry.stat())
+
+        with self.lock:
+            stale = [path for path, fingerprint in current.items()
+                     if self.entries.get(path, {}).get('fingerprint') != fingerprint]
+            removed = [path for path in self.entries if path not in current]
+
+        def read(path):
+            try:
+                return path, self.describe(path), None
+            except (OSError, ValueError, CmsError) as e:
+                return path, None, '{}: {}'.format(type(e).__name__, e)
+
+        results = []
+        if stale:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(stale)))) as executor:
+                results = [future.result() for future in [runner.submit(executor, read, path) for path in stale]]
+
+        with self.lock:
+            for path in removed:
+                del self.entries[path]
+            self.skipped = {path: reason for path, reason in self.skipped.items() if path in current}
+            for path, description, reason in results:
+                if description is None:
+                    self.entries.pop(path, None)
+                    self.skipped[path] = reason
+                    continue
+                self.skipped.pop(path, None)
+                description['fingerprint'] = current[path]
+                self.entries[path] = description
+            self.scanned = True
+        if stale or removed:
+            self.save()
+
+    def profiles(self):
+        if not self.scanned:
+            self.scan()
+        return dict(self.entries)
+
+    def candidates(self, bundle_id, signer_hashes=None, now=None):
+        now = time.time() if now is None else now
+        candidates = []
+        for path, entry in self.profiles().items():
+            if entry['expires'] is not None and entry['expires'] <= now:
+                continue
+            if not app_id_matches(entry['app_id'], entry['team_id'], bundle_id):
+                continue
+            # Mobileprovision signs with the last developer certificate, so that is the one that must be available.
+            if signer_hashes is not None and not set(entry['certificates'][-1:]) & signer_hashes:
+                continue
+            candidates.append((path, entry))
+        candidates.sort(key=lambda c: (specificity(c[1]['app_id']), c[1]['expires'] or 0), reverse=True)
+        return candidates
+
+    def select(self, bundle_id, signer_hashes=None, now=None):
+        if signer_hashes is not None:
+            signer_hashes = {h.upper() for h in signer_hashes}
+        candidates = self.candidates(bundle_id, signer_hashes=signer_hashes, now=now)
+        if not candidates:
+            message = 'No unexpired provisioning profile in {} matches {}'.format(self.directory, bundle_id)
+            with self.lock:
+                skipped = sorted(self.skipped.items())
+            if skipped:
+                message += ', skipped unreadable profiles: ' + ', '.join(
+                    '{} ({})'.format(pathlib.Path(path).name, reason) for path, reason in skipped)
+            raise ProfileStoreError(message)
+        path = candidates[0][0]
+        with self.lock:
+            if path not in self.mobileprovisions:
+                self.mobileprovisions[path] = Mobileprovision(path, verify=self.verify)
+            return self.mobileprovisions[path]
@@ -0,0 +1,357 @@
+import itertools
+import json
+import os
+import pathlib
+import queue
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import traceback
+
+import runner
+
+JOB_OPTIONS = ('jobs', 'backend', 'p12', 'p12_password', 'cache', 'cache_size', 'entitlements', 'compression_level',
+               'store_media', 'profile_dir')
+PATH_OPTIONS = ('input', 'profile', 'output', 'p12', 'cache', 'entitlements', 'profile_dir')
+
+
+class ResignServerError(Exception):
+    pass
+
+
+def default_socket_path():
+    socket_path = os.environ.get('IRESIGN_SOCKET')
+    if socket_path:
+        return pathlib.Path(socket_path)
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return pathlib.Path(runtime_dir).joinpath('iresign-{}.sock'.format(os.getuid()))
+
+
+def send_event(f, event):
+    f.write(json.dumps(event).encode('utf-8') + b'\n')
+    f.flush()
+
+
+class ResignJob:
+    def __init__(self, job_id, request):
+        self.id = job_id
+        self.request = request
+        self.priority = int(request.get('priority', 0))
+        self.events = queue.Queue()
+
+    def emit(self, event, **fields):
+        fields['event'] = event
+        fields['id'] = self.id
+        self.events.put(fields)
+
+
+class ResignServer:
+    # One Session is shared by every job, so decoded profiles, the profile index, signing caches and signing
+    # identities stay warm for the life of the server instead of being rebuilt per invocation.
+    def __init__(self, socket_path=None, workers=2, max_jobs=None, session=None, defaults=None):
+        self.socket_path = pathlib.Path(socket_path) if socket_path else default_socket_path()
+        self.workers = max(1, workers)
+        self.max_jobs = max_jobs or os.cpu_count() or 1
+        if session is None:
+            from iresign import Session
+            session = Session()
+        self.session = session
+        self.defaults = defaults or {}
+        self.pending = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.threads = []
+        self.server = None
+
+    def submit(self, request):
+        if not request.get('input'):
+            raise ResignServerError('Job has no input')
+        job = ResignJob(next(self.ids), request)
+        # Higher priorities run first, jobs of equal priority run in submission order.
+        self.pending.put((-job.priority, next(self.sequence), job))
+        job.emit('queued', position=self.pending.qsize())
+        return job
+
+    def status(self):
+        with self.lock:
+            return {'queued': self.pending.qsize(), 'active': self.active, 'completed': self.completed,
+                    'failed': self.failed, 'workers': self.workers, 'max_jobs': self.max_jobs}
+
+    def options(self, request):
+        options = dict(self.defaults)
+        options.update((key, request[key]) for key in JOB_OPTIONS if request.get(key) is not None)
+        # Every job gets its own signing threads, so cap them to keep concurrent jobs from oversubscribing the host.
+        options['jobs'] = max(1, min(int(options.get('jobs') or self.max_jobs), self.max_jobs))
+        # Entitlements arrive either inline as a dictionary or as the path of a plist on the server's filesystem.
+        if isinstance(options.get('entitlements'), str):
+            import plistlib
+            with open(options['entitlements'], 'rb') as f:
+                options['entitlements'] = plistlib.load(f)
+        return options
+
+    def run_job(self, job):
+        request = job.request
+        job.emit('started')
+        profiler = runner.Profiler(listener=lambda record: job.emit('stage', name=record.name,
+                                                                    seconds=round(record.duration, 3)))
+        with self.lock:
+            self.active += 1
+        try:
+            with profiler.activate():
+                result = self.session.resign(request['input'], request.get('profile'), request.get('output'),
+                                             **self.options(request))
+        except Exception as e:
+            with self.lock:
+                self.failed += 1
+            job.emit('failed', error='{}: {}'.format(type(e).__name__, e), traceback=traceback.format_exc())
+        else:
+            with self.lock:
+                self.completed += 1
+            job.emit('done', result=result.to_dict(), summary=profiler.summary())
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def work(self):
+        while True:
+            _, _, job = self.pending.get()
+            try:
+                if job is None:
+                    return
+                self.run_job(job)
+            finally:
+                self.pending.task_done()
+
+    def start(self):
+        if self.socket_path.exists():
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                    s.connect(str(self.socket_path))
+            except OSError:
+                self.socket_path.unlink()
+            else:
+                raise ResignServerError('A server is already listening on {}'.format(self.socket_path))
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+
+        resign_server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                resign_server.handle(self.rfile, self.wfile)
+
+        # Jobs may carry p12 passwords, so the socket is only reachable by the owning user.
+        umask = os.umask(0o177)
+        try:
+            self.server = socketserver.ThreadingUnixStreamServer(str(self.socket_path), Handler)
+        finally:
+            os.umask(umask)
+        self.server.daemon_threads = True
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self.work, name='iresign-worker', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def serve_forever(self):
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def shutdown(self):
+        if self.server:
+            self.server.shutdown()
+
+    def close(self):
+        # Sentinels sort after every real job, so queued work is finished before the workers exit.
+        for _ in self.threads:
+            self.pending.put((float('inf'), next(self.sequence), None))
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        if self.server:
+            self.server.server_close()
+            self.server = None
+            try:
+                self.socket_path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def handle(self, rfile, wfile):
+        line = rfile.readline()
+        try:
+            request = json.loads(line)
+            op = request.get('op')
+            if op == 'status':
+                send_event(wfile, dict(self.status(), event='status'))
+                return
+            if op == 'shutdown':
+                send_event(wfile, {'event': 'shutdown'})
+                threading.Thread(target=self.shutdown, daemon=True).start()
+                return
+            if op != 'submit':
+                raise ResignServerError('Unknown operation {!r}'.format(op))
+            job = self.submit(request.get('job') or {})
+        except (ValueError, AttributeError, ResignServerError) as e:
+            send_event(wfile, {'event': 'error', 'error': str(e)})
+            return
+
+        # The job keeps running if the client goes away; only the progress stream is dropped.
+        while True:
+            event = job.events.get()
+            try:
+                send_event(wfile, event)
+            except OSError:
+                return
+            if event['event'] in ('done', 'failed'):
+                return
+
+
+def request(socket_path, message, on_event=None):
+    socket_path = pathlib.Path(socket_path) if socket_path else default_socket_path()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(str(socket_path))
+        except OSError as e:
+            raise ResignServerError('Cannot connect to iresign server at {}: {}'.format(socket_path, e))
+        with s.makefile('rwb') as f:
+            send_event(f, message)
+            event = None
+            for line in f:
+                event = json.loads(line)
+                if on_event:
+                    on_event(event)
+                if event['event'] not in ('queued', 'started', 'stage'):
+                    break
+    if event is None:
+        raise ResignServerError('iresign server at {} closed the connection'.format(socket_path))
+    if event['event'] == 'error':
+        raise ResignServerError(event['error'])
+    return event
+
+
+def submit_job(socket_path, job, on_event=None):
+    # The server resolves paths against its own working directory, so send absolute ones.
+    job = dict(job)
+    for key in PATH_OPTIONS:
+        if isinstance(job.get(key), (str, os.PathLike)):
+            job[key] = os.path.abspath(job[key])
+    return request(socket_path, {'op': 'submit', 'job': job}, on_event)
+
+
+def print_event(event):
+    if event['event'] == 'queued':
+        sys.stderr.write('Job {} queued at position {}\n'.format(event['id'], event['position']))
+    elif event['event'] == 'started':
+        sys.stderr.write('Job {} started\n'.format(event['id']))
+    elif event['event'] == 'stage':
+        sys.stderr.write('  {:<24} {:8.3f}s\n'.format(event['name'], event['seconds']))
+    elif event['event'] == 'failed':
+        sys.stderr.write('Job {} failed: {}\n'.format(event['id'], event['error']))
+
+
+def serve_main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='iresign serve', description='Run re-sign jobs submitted over a Unix socket')
+    parser.add_argument('--socket', dest='socket',
+                        help='Unix socket to listen on, defaults to $IRESIGN_SOCKET or a per-user temporary path')
+    parser.add_argument('--workers', dest='workers', type=int, default=2,
+                        help='number of jobs to run at the same time')
+    parser.add_argument('--max-jobs', dest='max_jobs', type=int, default=os.cpu_count() or 1,
+                        help='most elements a single job may sign in parallel')
+    parser.add_argument('--tool', dest='tools', action='append', default=[], metavar='NAME=PATH',
+                        help='use PATH for developer tool NAME instead of asking xcrun')
+    parser.add_argument('--profile-dir', dest='profile_dir',
+                        help='directory of provisioning profiles to choose from when a job names none')
+    parser.add_argument('--verify-profile', dest='verify_profile', action='store_true',
+                        help='check that every mobileprovision content matches the CMS signature of its embedded '
+                             'certificate before using it, the chain to Apple\'s root is not validated')
+    parser.add_argument('--cache', dest='cache',
+                        help='default signing cache directory for jobs that do not name one')
+    parser.add_argument('--cache-size', dest='cache_size', type=int, default=2048,
+                        help='size cap of the signing cache in MiB')
+    args = parser.parse_args(argv)
+
+    from iresign import Session
+    session = Session(tools=args.tools, profile_dir=args.profile_dir, verify_profiles=args.verify_profile)
+    defaults = {'cache_size': args.cache_size}
+    if args.cache:
+        defaults['cache'] = os.path.abspath(args.cache)
+    server = ResignServer(args.socket, workers=args.workers, max_jobs=args.max_jobs, session=session,
+                          defaults=defaults)
+    try:
+        server.start()
+    except ResignServerError as e:
+        parser.error(str(e))
+    sys.stderr.write('Listening on {}\n'.format(server.socket_path))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def submit_main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='iresign submit', description='Send a re-sign job to an iresign server')
+    parser.add_argument('--socket', dest='socket',
+                        help='Unix socket of the server, defaults to $IRESIGN_SOCKET or a per-user temporary path')
+    parser.add_argument('--app', dest='app',
+                        help='path to .app or .ipa to sign')
+    parser.add_argument('-p', '--profile', dest='profile',
+                        help='mobileprovision to use for signing, picked by bundle ID if omitted')
+    parser.add_argument('-o', '--output', dest='output',
+                        help='path to resigned app or ipa')
+    parser.add_argument('--priority', dest='priority', type=int, default=0,
+                        help='jobs with a higher priority run first')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+                        help='number of elements to sign in parallel, capped by the server')
+    parser.add_argument('--backend', dest='backend', choices=['codesign', 'native'],
+                        help='sign with Apple codesign or the built-in Mach-O signer')
+    parser.add_argument('--p12', dest='p12',
+                        help='PKCS#12 signing identity for the native backend')
+    parser.add_argument('--p12-pass', dest='p12_password',
+                        help='password of the --p12 identity')
+    parser.add_argument('--cache', dest='cache',
+                        help='directory of previously signed frameworks and dylibs to reuse')
+    parser.add_argument('--entitlements', dest='entitlements',
+                        help='entitlements plist to sign the app with instead of the profile entitlements')
+    parser.add_argument('--compression-level', dest='compression_level', type=int, choices=range(-1, 10),
+                        metavar='0-9', help='deflate level for rewritten .ipa entries, 0 stores them')
+    parser.add_argument('--store-media', dest='store_media', action='store_true', default=None,
+                        help='store already compressed png, jpg and car files without deflating them')
+    parser.add_argument('--status', dest='status', action='store_true',
+                        help='print the server queue instead of submitting a job')
+    parser.add_argument('--shutdown', dest='shutdown', action='store_true',
+                        help='stop the server once queued jobs finish')
+    parser.add_argument('--quiet', dest='quiet', action='store_true',
+                        help='do not print progress while waiting')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.status or args.shutdown:
+            event = request(args.socket, {'op': 'status' if args.status else 'shutdown'})
+            event.pop('event')
+            if event:
+                print(json.dumps(event, indent=2))
+            return
+        if not args.app:
+            parser.error('--app is required')
+        job = {'input': args.app, 'profile': args.profile, 'output': args.output, 'priority': args.priority,
+               'jobs': args.jobs, 'backend': args.backend, 'p12': args.p12, 'p12_password': args.p12_password,
+               'cache': args.cache, 'entitlements': args.entitlements, 'compression_level': args.compression_level,
+               'store_media': args.store_media}
+        event = submit_job(args.socket, job, on_event=None if args.quiet else print_event)
+    except ResignServerError as e:
+        sys.stderr.write('{}\n'.format(e))
+        sys.exit(1)
+    if event['event'] != 'done':
+        sys.exit(1)
+    print(json.dumps(event['result'], indent=2))
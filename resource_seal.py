@@ -0,0 +1,209 @@
+import concurrent.futures
+import contextlib
+import contextvars
+import hashlib
+import mmap
+import os
+import pathlib
+import plistlib
+import re
+import threading
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+RULES = {
+    '^.*': True,
+    '^.*\\.lproj/': {'optional': True, 'weight': 1000.0},
+    '^.*\\.lproj/locversion.plist$': {'omit': True, 'weight': 1100.0},
+    '^Base\\.lproj/': {'weight': 1010.0},
+    '^version.plist$': True,
+}
+
+# The iOS defaults codesign writes. Unlike the macOS rules there is no nested rule, so frameworks, plug-ins and
+# dylibs are sealed file by file like any other resource rather than by cdhash.
+RULES2 = {
+    '.*\\.dSYM($|/)': {'weight': 11.0},
+    '^(.*/)?\\.DS_Store$': {'omit': True, 'weight': 2000.0},
+    '^.*': True,
+    '^.*\\.lproj/': {'optional': True, 'weight': 1000.0},
+    '^.*\\.lproj/locversion.plist$': {'omit': True, 'weight': 1100.0},
+    '^Base\\.lproj/': {'weight': 1010.0},
+    '^Info\\.plist$': {'omit': True, 'weight': 20.0},
+    '^PkgInfo$': {'omit': True, 'weight': 20.0},
+    '^embedded\\.provisionprofile$': {'weight': 20.0},
+    '^version\\.plist$': {'weight': 20.0},
+}
+
+
+class Rule:
+    def __init__(self, pattern, value):
+        self.pattern = re.compile(pattern)
+        options = value if isinstance(value, dict) else {}
+        self.weight = options.get('weight', 1.0)
+        self.optional = options.get('optional', False)
+        self.omit = options.get('omit', False)
+
+
+def compile_rules(rules):
+    return [Rule(pattern, value) for pattern, value in rules.items()]
+
+
+def matching_rule(rules, relative_path):
+    best = None
+    for rule in rules:
+        if rule.pattern.search(relative_path) and (best is None or rule.weight > best.weight):
+            best = rule
+    return best
+
+
+def file_digests(path):
+    sha1 = hashlib.sha1()
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                for start in range(0, size, CHUNK_SIZE):
+                    chunk = view[start:start + CHUNK_SIZE]
+                    sha1.update(chunk)
+                    sha256.update(chunk)
+    return sha1.digest(), sha256.digest()
+
+
+class DigestCache:
+    def __init__(self):
+        self.digests = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+
+    @staticmethod
+    def identity(path):
+        stat = os.stat(path)
+        return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def digests_for(self, path):
+        # Files shared between nested bundles or hard linked during staging are hashed once, even when two
+        # workers ask for them at the same time.
+        identity = DigestCache.identity(path)
+        with self.lock:
+            pending = self.digests.get(identity)
+            if pending is None:
+                pending = self.digests[identity] = concurrent.futures.Future()
+                owner = True
+            else:
+                self.hits += 1
+                owner = False
+        if not owner:
+            return pending.result()
+        try:
+            pending.set_result(file_digests(path))
+        except BaseException as e:
+            with self.lock:
+                del self.digests[identity]
+            pending.set_exception(e)
+        return pending.result()
+
+
+_digest_cache = contextvars.ContextVar('iresign_digest_cache', default=None)
+
+
+@contextlib.contextmanager
+def digest_scope():
+    # Shares one DigestCache between every seal() in the scope, normally one resign call. Outside a scope each
+    # seal() pass gets its own cache, so digests never outlive the staged tree whose inodes they are keyed by.
+    cache = DigestCache()
+    token = _digest_cache.set(cache)
+    try:
+        yield cache
+    finally:
+        _digest_cache.reset(token)
+
+
+class ResourceSealer:
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.rules = compile_rules(RULES)
+        self.rules2 = compile_rules(RULES2)
+        self.executor = None
+        self.executor_lock = threading.Lock()
+
+    def pool(self):
+        with self.executor_lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+            return self.executor
+
+    def close(self):
+        with self.executor_lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+    def walk(self, bundle_path, executable_name):
+        # Yields (relative path, path) for every file or symlink below the bundle except its own signature and
+        # main executable. Nested bundles are walked too because both rule sets seal their contents file by file.
+        pending = [bundle_path]
+        while pending:
+            directory = pending.pop()
+            with os.scandir(directory) as it:
+                entries = list(it)
+            for entry in entries:
+                path = pathlib.Path(entry.path)
+                relative = path.relative_to(bundle_path).as_posix()
+                if relative in ('_CodeSignature', executable_name):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(path)
+                else:
+                    yield relative, path
+
+    def seal(self, bundle_path, executable_name):
+        bundle_path = pathlib.Path(bundle_path)
+        files = list(self.walk(bundle_path, executable_name))
+
+        sealed = []
+        for relative, path in files:
+            rule = matching_rule(self.rules, relative)
+            if rule and rule.omit:
+                rule = None
+            rule2 = matching_rule(self.rules2, relative)
+            if rule2 and rule2.omit:
+                rule2 = None
+            if rule or rule2:
+                sealed.append((relative, path, rule, rule2))
+
+        cache = _digest_cache.get() or DigestCache()
+        executor = self.pool()
+        futures = {relative: executor.submit(cache.digests_for, path)
+                   for relative, path, _, _ in sealed if not path.is_symlink()}
+
+        seal_files = {}
+        seal_files2 = {}
+        for relative, path, rule, rule2 in sealed:
+            if path.is_symlink():
+                target = os.readlink(path)
+                if rule:
+                    seal_files[relative] = hashlib.sha1(target.encode('utf-8')).digest()
+                if rule2:
+                    seal_files2[relative] = {'symlink': target}
+                continue
+
+            sha1, sha256 = futures[relative].result()
+            if rule:
+                seal_files[relative] = {'hash': sha1, 'optional': True} if rule.optional else sha1
+            if rule2:
+                entry = {'hash': sha1, 'hash2': sha256}
+                if rule2.optional:
+                    entry['optional'] = True
+                seal_files2[relative] = entry
+
+        code_resources = plistlib.dumps({
+            'files': seal_files,
+            'files2': seal_files2,
+            'rules': RULES,
+            'rules2': RULES2,
+        })
+        signature_dir = bundle_path.joinpath('_CodeSignature')
+        signature_dir.mkdir(exist_ok=True)
+        signature_dir.joinpath('CodeResources').write_bytes(code_resources)
+        return code_resources
@@ -0,0 +1,174 @@
+import contextlib
+import contextvars
+import json
+import os
+import subprocess
+import threading
+import time
+
+REDACTED = '******'
+
+_profiler = contextvars.ContextVar('iresign_profiler', default=None)
+_stage = contextvars.ContextVar('iresign_stage', default=None)
+
+
+class CommandRecord:
+    def __init__(self, argv, stage, start, duration, returncode, output_bytes):
+        self.tool = os.path.basename(argv[0]) if argv else ''
+        self.argv = argv
+        self.stage = stage
+        self.start = start
+        self.duration = duration
+        self.returncode = returncode
+        self.output_bytes = output_bytes
+        self.thread_id = threading.get_ident()
+
+    def as_dict(self):
+        return {
+            'tool': self.tool,
+            'argv': self.argv,
+            'stage': self.stage,
+            'start': self.start,
+            'duration': self.duration,
+            'returncode': self.returncode,
+            'output_bytes': self.output_bytes,
+        }
+
+
+class StageRecord:
+    def __init__(self, name, start, duration):
+        self.name = name
+        self.start = start
+        self.duration = duration
+        self.thread_id = threading.get_ident()
+
+
+class Profiler:
+    def __init__(self, listener=None):
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+        self.commands = []
+        self.stages = []
+        self.listener = listener
+
+    def now(self):
+        return time.perf_counter() - self.origin
+
+    @contextlib.contextmanager
+    def activate(self):
+        token = _profiler.set(self)
+        try:
+            yield self
+        finally:
+            _profiler.reset(token)
+
+    def record_command(self, record):
+        with self.lock:
+            self.commands.append(record)
+
+    def record_stage(self, record):
+        with self.lock:
+            self.stages.append(record)
+        if self.listener:
+            self.listener(record)
+
+    def summary(self):
+        stages = {}
+        for record in self.stages:
+            entry = stages.setdefault(record.name, {'count': 0, 'seconds': 0.0, 'commands': 0, 'command_seconds': 0.0})
+            entry['count'] += 1
+            entry['seconds'] += record.duration
+        for record in self.commands:
+            entry = stages.setdefault(record.stage or 'unattributed',
+                                      {'count': 0, 'seconds': 0.0, 'commands': 0, 'command_seconds': 0.0})
+            entry['commands'] += 1
+            entry['command_seconds'] += record.duration
+        return stages
+
+    def format_report(self):
+        lines = ['{:<20} {:>6} {:>10} {:>9} {:>12}'.format('stage', 'count', 'seconds', 'commands', 'cmd seconds')]
+        for name, entry in sorted(self.summary().items(), key=lambda item: -item[1]['seconds']):
+            lines.append('{:<20} {:>6} {:>10.3f} {:>9} {:>12.3f}'.format(
+                name, entry['count'], entry['seconds'], entry['commands'], entry['command_seconds']))
+        return '\n'.join(lines)
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        events = []
+        for record in self.stages:
+            events.append({'name': record.name, 'cat': 'stage', 'ph': 'X', 'pid': pid, 'tid': record.thread_id,
+                           'ts': record.start * 1e6, 'dur': record.duration * 1e6})
+        for record in self.commands:
+            events.append({'name': record.tool, 'cat': 'command', 'ph': 'X', 'pid': pid, 'tid': record.thread_id,
+                           'ts': record.start * 1e6, 'dur': record.duration * 1e6,
+                           'args': {'argv': record.argv, 'stage': record.stage, 'returncode': record.returncode,
+                                    'output_bytes': record.output_bytes}})
+        events.sort(key=lambda event: event['ts'])
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+def current_profiler():
+    return _profiler.get()
+
+
+def current_stage():
+    return _stage.get()
+
+
+@contextlib.contextmanager
+def stage(name):
+    token = _stage.set(name)
+    profiler = _profiler.get()
+    start = profiler.now() if profiler else None
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+        if profiler:
+            profiler.record_stage(StageRecord(name, start, profiler.now() - start))
+
+
+def redact(argv, secrets):
+    secrets = {secret for secret in secrets if secret}
+    return [REDACTED if arg in secrets else arg for arg in argv]
+
+
+def output_size(output):
+    if isinstance(output, (bytes, str)):
+        return len(output)
+    return 0
+
+
+def run(cmd, secrets=(), **kwargs):
+    argv = [str(arg) for arg in cmd]
+    profiler = _profiler.get()
+    if not profiler:
+        return subprocess.run(argv, **kwargs)
+
+    start = profiler.now()
+    returncode = None
+    output_bytes = 0
+    try:
+        result = subprocess.run(argv, **kwargs)
+        returncode = result.returncode
+        output_bytes = output_size(result.stdout) + output_size(result.stderr)
+        return result
+    except subprocess.CalledProcessError as e:
+        returncode = e.returncode
+        output_bytes = output_size(e.stdout) + output_size(e.stderr)
+        raise
+    finally:
+        profiler.record_command(CommandRecord(redact(argv, secrets), _stage.get(), start,
+                                              profiler.now() - start, returncode, output_bytes))
+
+
+def check_output(cmd, secrets=(), **kwargs):
+    return run(cmd, secrets=secrets, check=True, stdout=subprocess.PIPE, **kwargs).stdout
+
+
+def submit(executor, fn, *args):
+    return executor.submit(contextvars.copy_context().run, fn, *args)
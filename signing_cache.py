@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+
+
+class SigningCache:
+    def __init__(self, root, max_bytes=2 * 1024 ** 3):
+        self.root = pathlib.Path(root)
+        self.max_bytes = max_bytes
+        self.objects_dir = self.root.joinpath('objects')
+        self.temp_dir = self.root.joinpath('tmp')
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        # Keys being restored, eviction leaves their entries alone until the copy is done.
+        self.pinned = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def is_cacheable(path):
+        return path.suffix in ['.framework', '.dylib']
+
+    @staticmethod
+    def update_digest(digest, path, relative_name):
+        digest.update(relative_name.encode('utf-8') + b'\0')
+        if path.is_symlink():
+            digest.update(b'l' + os.readlink(path).encode('utf-8') + b'\0')
+            return
+        if path.is_dir():
+            digest.update(b'd\0')
+            return
+        mode = b'x' if os.access(path, os.X_OK) else b'f'
+        digest.update(mode + str(path.stat().st_size).encode('ascii') + b'\0')
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+
+    @staticmethod
+    def content_digest(path):
+        path = pathlib.Path(path)
+        digest = hashlib.sha256()
+        if path.is_dir() and not path.is_symlink():
+            for item in sorted(path.rglob('*')):
+                SigningCache.update_digest(digest, item, item.relative_to(path).as_posix())
+        else:
+            SigningCache.update_digest(digest, path, path.name)
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(path, signer_hash, entitlements=None, variant=None):
+        digest = hashlib.sha256()
+        digest.update(SigningCache.content_digest(path).encode('ascii') + b'\0')
+        digest.update((signer_hash or '').encode('ascii') + b'\0')
+        if variant:
+            digest.update(b'variant\0' + variant.encode('utf-8') + b'\0')
+        digest.update(entitlements or b'')
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        return self.objects_dir.joinpath(key[:2], key)
+
+    def restore(self, key, destination):
+        with self.lock:
+            self.pinned[key] = self.pinned.get(key, 0) + 1
+        try:
+            restored = self.restore_pinned(key, destination)
+        finally:
+            with self.lock:
+                self.pinned[key] -= 1
+                if not self.pinned[key]:
+                    del self.pinned[key]
+
+        with self.lock:
+            if restored:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return restored
+
+    def restore_pinned(self, key, destination):
+        entry = self.entry_path(key)
+        payload = entry.joinpath('payload')
+        if not payload.exists():
+            return False
+
+        destination = pathlib.Path(destination)
+        staging = pathlib.Path(tempfile.mkdtemp(prefix='.restore-', dir=destination.parent))
+        try:
+            restored = staging.joinpath(destination.name)
+            # Another process sharing the cache directory may evict the entry mid-copy, treat that as a miss.
+            try:
+                if payload.is_dir():
+                    shutil.copytree(payload, restored, symlinks=True)
+                else:
+                    shutil.copy2(payload, restored)
+            except (shutil.Error, OSError):
+                return False
+            if payload.is_dir():
+                shutil.rmtree(destination)
+            os.replace(restored, destination)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return True
+
+    @staticmethod
+    def tree_size(path):
+        if path.is_file():
+            return path.stat().st_size
+        return sum(item.lstat().st_size for item in path.rglob('*') if item.is_file())
+
+    def store(self, key, source):
+        source = pathlib.Path(source)
+        entry = self.entry_path(key)
+        if entry.exists():
+            return
+
+        staging = pathlib.Path(tempfile.mkdtemp(prefix=key[:8] + '-', dir=self.temp_dir))
+        try:
+            payload = staging.joinpath('payload')
+            if source.is_dir():
+                shutil.copytree(source, payload, symlinks=True)
+            else:
+                shutil.copy2(source, payload)
+            with open(staging.joinpath('entry.json'), 'w') as f:
+                json.dump({'name': source.name, 'size': SigningCache.tree_size(payload)}, f)
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            os.rename(staging, entry)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            if not entry.exists():
+                raise
+            return
+
+        self.evict()
+
+    def entries(self):
+        entries = []
+        for entry in self.objects_dir.glob('*/*'):
+            try:
+                with open(entry.joinpath('entry.json'), 'r') as f:
+                    size = json.load(f)['size']
+                entries.append((entry.stat().st_mtime, size, entry))
+            except (OSError, ValueError, KeyError):
+                continue
+        return entries
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            trash = pathlib.Path(tempfile.mkdtemp(prefix='evict-', dir=self.temp_dir))
+            try:
+                with self.lock:
+                    if entry.name in self.pinned:
+                        continue
+                    os.rename(entry, trash.joinpath(entry.name))
+            except OSError:
+                continue
+            finally:
+                shutil.rmtree(trash, ignore_errors=True)
+            total -= size
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
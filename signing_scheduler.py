@@ -0,0 +1,129 @@
+import concurrent.futures
+import os
+import pathlib
+
+import runner
+
+
+class SigningNode:
+    def __init__(self, path):
+        self.path = path
+        self.parent = None
+        self.children = []
+
+    def __repr__(self):
+        return 'SigningNode({})'.format(self.path.as_posix())
+
+    def is_top_level_app(self):
+        return self.parent is None and self.path.suffix == '.app'
+
+
+class SigningScheduler:
+    def __init__(self, jobs=None):
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        if jobs < 1:
+            raise Exception('Signing scheduler needs at least one worker, got {}'.format(jobs))
+        self.jobs = jobs
+        self.nodes = {}
+
+    def add(self, path):
+        path = pathlib.Path(path)
+        if path not in self.nodes:
+            self.nodes[path] = SigningNode(path)
+
+    def extend(self, paths):
+        for path in paths:
+            self.add(path)
+
+    def build_tree(self):
+        for node in self.nodes.values():
+            node.parent = None
+            node.children = []
+
+        for path, node in self.nodes.items():
+            for ancestor in path.parents:
+                parent = self.nodes.get(ancestor)
+                if parent:
+                    node.parent = parent
+                    parent.children.append(node)
+                    break
+
+        return [node for node in self.nodes.values() if node.parent is None]
+
+    def order(self):
+        roots = self.build_tree()
+        ordered = []
+
+        def visit(node):
+            for child in sorted(node.children, key=lambda n: n.path):
+                visit(child)
+            ordered.append(node.path)
+
+        deferred = []
+        for root in sorted(roots, key=lambda n: n.path):
+            if root.is_top_level_app():
+                deferred.append(root)
+            else:
+                visit(root)
+        for root in deferred:
+            visit(root)
+
+        return ordered
+
+    def run(self, sign):
+        roots = self.build_tree()
+        if not roots:
+            return []
+
+        if self.jobs == 1:
+            ordered = self.order()
+            for path in ordered:
+                sign(path)
+            return ordered
+
+        remaining = {node: len(node.children) for node in self.nodes.values()}
+        deferred_apps = [node for node in roots if node.is_top_level_app()]
+        outstanding_non_apps = sum(1 for node in self.nodes.values() if not self.is_under_top_level_app(node))
+        signed = []
+
+        def is_ready(node):
+            if remaining[node] != 0:
+                return False
+            if node.is_top_level_app() and outstanding_non_apps > 0:
+                return False
+            return True
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            running = {}
+            queued = set()
+
+            def submit_ready(candidates):
+                for node in sorted(candidates, key=lambda n: n.path):
+                    if node not in queued and is_ready(node):
+                        queued.add(node)
+                        running[runner.submit(executor, sign, node.path)] = node
+
+            submit_ready(self.nodes.values())
+            while running:
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                ready = []
+                for future in done:
+                    node = running.pop(future)
+                    future.result()
+                    signed.append(node.path)
+                    if not self.is_under_top_level_app(node):
+                        outstanding_non_apps -= 1
+                    if node.parent:
+                        remaining[node.parent] -= 1
+                        ready.append(node.parent)
+                if outstanding_non_apps == 0:
+                    ready.extend(deferred_apps)
+                submit_ready(ready)
+
+        return signed
+
+    def is_under_top_level_app(self, node):
+        while node.parent:
+            node = node.parent
+        return node.is_top_level_app()
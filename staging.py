@@ -0,0 +1,146 @@
+import ctypes
+import errno
+import os
+import pathlib
+import shutil
+import tempfile
+
+FICLONE = 0x40049409
+
+MACHO_MAGICS = {
+    b'\xfe\xed\xfa\xce', b'\xce\xfa\xed\xfe',
+    b'\xfe\xed\xfa\xcf', b'\xcf\xfa\xed\xfe',
+    b'\xca\xfe\xba\xbe', b'\xbe\xba\xfe\xca',
+    b'\xca\xfe\xba\xbf', b'\xbf\xba\xfe\xca',
+}
+
+_clonefile = None
+
+
+def is_macho(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(4) in MACHO_MAGICS
+    except OSError:
+        return False
+
+
+def is_bundle_executable(path):
+    parent = os.path.basename(os.path.dirname(path))
+    return os.path.splitext(parent)[0] == os.path.basename(path)
+
+
+def is_rewritable(path):
+    if path.endswith('.dylib') or is_bundle_executable(path) or os.access(path, os.X_OK):
+        return True
+    return is_macho(path)
+
+
+def macos_clonefile():
+    global _clonefile
+    if _clonefile is None:
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            _clonefile = libc.clonefile
+            _clonefile.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int]
+        except (OSError, AttributeError):
+            _clonefile = False
+    return _clonefile
+
+
+def reflink(src, dst):
+    clonefile = macos_clonefile()
+    if clonefile:
+        if clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0:
+            return True
+        return False
+
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            return True
+        except OSError:
+            pass
+    os.unlink(dst)
+    return False
+
+
+def copy_range(src, dst):
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        remaining = os.fstat(s.fileno()).st_size
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(s.fileno(), d.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL):
+                raise
+            remaining = -1
+    if remaining != 0:
+        os.unlink(dst)
+        return False
+    return True
+
+
+def clone_file(src, dst):
+    if reflink(src, dst):
+        method = 'reflink'
+    elif copy_range(src, dst):
+        method = 'copy_file_range'
+    else:
+        shutil.copyfile(src, dst)
+        method = 'copy'
+    shutil.copystat(src, dst)
+    return method
+
+
+def link_or_clone(src, dst):
+    try:
+        os.link(src, dst)
+        return 'link'
+    except OSError:
+        return clone_file(src, dst)
+
+
+def stage_tree(src, dst, rewritable=is_rewritable):
+    src = pathlib.Path(src)
+    dst = pathlib.Path(dst)
+    methods = {}
+    pending = [(src, dst)]
+    while pending:
+        source_dir, destination_dir = pending.pop()
+        destination_dir.mkdir(parents=True, exist_ok=True)
+        with os.scandir(source_dir) as it:
+            for entry in it:
+                target = destination_dir.joinpath(entry.name)
+                if entry.is_symlink():
+                    os.symlink(os.readlink(entry.path), target)
+                    method = 'symlink'
+                elif entry.is_dir():
+                    pending.append((pathlib.Path(entry.path), target))
+                    continue
+                elif rewritable(entry.path):
+                    method = clone_file(entry.path, target)
+                else:
+                    method = link_or_clone(entry.path, target)
+                methods[method] = methods.get(method, 0) + 1
+        shutil.copystat(source_dir, destination_dir)
+    return methods
+
+
+def staging_dir_beside(destination):
+    destination = pathlib.Path(destination).resolve()
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    return pathlib.Path(tempfile.mkdtemp(prefix='.' + destination.name + '-', dir=destination.parent))
+
+
+def commit(staged, destination):
+    os.rename(staged, destination)
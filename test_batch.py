@@ -0,0 +1,93 @@
+import json
+import pathlib
+import plistlib
+import tempfile
+import threading
+import unittest
+import zipfile
+from unittest import mock
+
+from batch import BatchRunner
+from ipa_rewriter import IpaRewriter
+from test_cms import signed_data
+
+
+class StubResign:
+    def __init__(self, fail=()):
+        self.fail = fail
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def __call__(self, input_path, mobileprovision, output_path, jobs=None, entitlements=None, stage=None,
+                 cache=None):
+        with tempfile.TemporaryDirectory() as t:
+            staged = pathlib.Path(t).joinpath('app')
+            stage(input_path, staged)
+            executable = staged.joinpath('Payload', 'Example.app', 'Example')
+            contents = executable.read_bytes()
+            # Jobs write into their own staged tree, so a clone must never show another job's changes.
+            executable.write_bytes(output_path.name.encode('utf-8'))
+        with self.lock:
+            self.calls.append({'output': output_path.name, 'mobileprovision': mobileprovision, 'jobs': jobs,
+                               'entitlements': entitlements, 'contents': contents})
+        if output_path.name in self.fail:
+            raise RuntimeError('cannot sign ' + output_path.name)
+
+
+class TestBatchRunner (unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmpdir.name)
+        self.root.joinpath('Example.mobileprovision').write_bytes(signed_data(plistlib.dumps({
+            'UUID': 'example',
+            'Entitlements': {'application-identifier': 'ABCDE12345.com.example.app', 'get-task-allow': False},
+        })))
+        for name in ['Example.ipa', 'Other.ipa']:
+            with zipfile.ZipFile(self.root.joinpath(name), 'w') as z:
+                z.writestr('Payload/Example.app/Example', name.encode('utf-8'))
+                z.writestr('Payload/Example.app/Info.plist', plistlib.dumps({'CFBundleExecutable': 'Example'}))
+
+        self.manifest = self.root.joinpath('manifest.json')
+        self.manifest.write_text(json.dumps({'jobs': [
+            {'input': 'Example.ipa', 'profile': 'Example.mobileprovision', 'output': 'out/A.ipa'},
+            {'input': 'Example.ipa', 'profile': 'Example.mobileprovision', 'output': 'out/B.ipa',
+             'entitlements': {'get-task-allow': True}},
+            {'input': 'Other.ipa', 'profile': 'Example.mobileprovision', 'output': 'out/C.ipa'},
+        ]}))
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_loads_manifest_relative_to_its_directory(self):
+        jobs = BatchRunner.load_manifest(self.manifest)
+        self.assertEqual([job.input_path.name for job in jobs], ['Example.ipa', 'Example.ipa', 'Other.ipa'])
+        self.assertEqual(jobs[1].output_path, self.root.resolve().joinpath('out', 'B.ipa'))
+        self.assertEqual(jobs[1].entitlements, {'get-task-allow': True})
+
+        self.manifest.write_text(json.dumps([{'input': 'Example.ipa', 'output': 'out/A.ipa'}]))
+        with self.assertRaises(Exception):
+            BatchRunner.load_manifest(self.manifest)
+
+    def test_runs_jobs_with_shared_profiles_and_extractions(self):
+        resign = StubResign(fail=('C.ipa',))
+        batch_runner = BatchRunner(resign, workers=3, jobs=2)
+        with mock.patch.object(IpaRewriter, 'extract', autospec=True, side_effect=IpaRewriter.extract) as extract:
+            report = batch_runner.run(BatchRunner.load_manifest(self.manifest))
+
+        self.assertEqual(sorted(call.args[0].source.name for call in extract.call_args_list),
+                         ['Example.ipa', 'Other.ipa'])
+        calls = {call['output']: call for call in resign.calls}
+        self.assertEqual(calls['A.ipa']['contents'], b'Example.ipa')
+        self.assertEqual(calls['B.ipa']['contents'], b'Example.ipa')
+        self.assertEqual(calls['C.ipa']['contents'], b'Other.ipa')
+        self.assertEqual(len({id(call['mobileprovision']) for call in resign.calls}), 1)
+        self.assertEqual(calls['A.ipa']['entitlements']['get-task-allow'], False)
+        self.assertEqual(calls['B.ipa']['entitlements'], {'application-identifier': 'ABCDE12345.com.example.app',
+                                                          'get-task-allow': True})
+        self.assertEqual({call['jobs'] for call in resign.calls}, {2})
+
+        self.assertEqual(sorted(report), ['failed', 'jobs', 'seconds', 'succeeded'])
+        self.assertEqual((report['succeeded'], report['failed']), (2, 1))
+        self.assertEqual([job['status'] for job in report['jobs']], ['succeeded', 'succeeded', 'failed'])
+        self.assertEqual(report['jobs'][2]['error'], 'cannot sign C.ipa')
+        self.assertEqual(sorted(report['jobs'][0]), ['input', 'output', 'profile', 'seconds', 'status'])
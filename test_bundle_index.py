@@ -0,0 +1,48 @@
+import pathlib
+import tempfile
+import unittest
+
+from bundle_index import BundleIndex
+
+
+class TestBundleIndex (unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmpdir.name)
+        self.app = self.root.joinpath('Payload', 'Example.app')
+        self.framework = self.app.joinpath('Frameworks', 'Example.framework')
+        self.appex = self.app.joinpath('PlugIns', 'Widget.appex')
+        for bundle in [self.app, self.framework, self.appex]:
+            bundle.joinpath('_CodeSignature').mkdir(parents=True)
+            bundle.joinpath('_CodeSignature', 'CodeResources').write_bytes(b'')
+            bundle.joinpath('Info.plist').write_bytes(b'')
+        self.dylib = self.app.joinpath('Frameworks', 'libswiftCore.dylib')
+        self.dylib.write_bytes(b'')
+        self.profile = self.app.joinpath('embedded.mobileprovision')
+        self.profile.write_bytes(b'')
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_classifies_bundle_contents(self):
+        index = BundleIndex(self.root)
+        self.assertEqual(index.app_paths(), [self.app])
+        self.assertEqual(index.codesign_elements(), sorted([self.framework, self.appex, self.dylib]))
+        self.assertIn(self.profile, index.codesign_artifacts())
+        self.assertEqual(index.kind(self.app.joinpath('Info.plist')), BundleIndex.RESOURCE)
+
+    def test_remove_drops_descendants(self):
+        index = BundleIndex(self.root)
+        signature_dir = self.framework.joinpath('_CodeSignature')
+        index.remove(signature_dir, self.profile)
+        self.assertIsNone(index.kind(signature_dir))
+        self.assertIsNone(index.kind(signature_dir.joinpath('CodeResources')))
+        self.assertIsNone(index.kind(self.profile))
+        self.assertEqual(index.kind(self.app.joinpath('_CodeSignature')), BundleIndex.SIGNATURE_ARTIFACT)
+
+    def test_refresh_picks_up_new_files(self):
+        index = BundleIndex(self.root)
+        signature_dir = self.appex.joinpath('_CodeSignature')
+        signature_dir.joinpath('CodeDirectory').write_bytes(b'')
+        index.refresh(signature_dir)
+        self.assertIn(signature_dir.joinpath('CodeDirectory'), index.all_paths())
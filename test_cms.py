@@ -0,0 +1,104 @@
+import datetime
+import hashlib
+import pathlib
+import plistlib
+import tempfile
+import unittest
+
+import cms
+import der
+from mobileprovision import Mobileprovision
+
+try:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+except ImportError:
+    x509 = None
+
+
+def indefinite(identifier, *elements):
+    return bytes([identifier, 0x80]) + b''.join(elements) + b'\x00\x00'
+
+
+def signed_data(content):
+    # Profiles are BER encoded with indefinite lengths, like the ones Apple ships.
+    sha256 = der.sequence(der.oid('2.16.840.1.101.3.4.2.1'))
+    attributes = der.implicit(0, b''.join([
+        der.sequence(der.oid(cms.OID_CONTENT_TYPE), der.set_of(der.oid(cms.OID_DATA))),
+        der.sequence(der.oid(cms.OID_MESSAGE_DIGEST), der.set_of(der.octet_string(hashlib.sha256(content).digest()))),
+    ]), constructed=True)
+    signer = der.sequence(
+        der.integer(1),
+        der.sequence(der.sequence(), der.integer(42)),
+        sha256,
+        attributes,
+        der.sequence(der.oid('1.2.840.113549.1.1.1'), der.null()),
+        der.octet_string(b'\x00' * 16))
+    encapsulated = indefinite(0x30, der.oid(cms.OID_DATA),
+                              indefinite(0xa0, indefinite(0x24, der.octet_string(content[:10]),
+                                                          der.octet_string(content[10:]))))
+    return indefinite(0x30, der.oid(cms.OID_SIGNED_DATA),
+                      indefinite(0xa0, indefinite(0x30, der.integer(1), der.set_of(sha256), encapsulated,
+                                                  der.set_of(signer))))
+
+
+class TestCms (unittest.TestCase):
+    def setUp(self) -> None:
+        self.plist = {
+            'DeveloperCertificates': [b'first certificate', b'signing certificate'],
+            'Entitlements': {'application-identifier': 'ABCDE12345.com.example.app'},
+            'UUID': '00000000-0000-0000-0000-000000000000',
+        }
+        self.content = plistlib.dumps(self.plist)
+
+    def test_decode_extracts_embedded_content(self):
+        envelope = cms.SignedData(signed_data(self.content))
+        self.assertEqual(envelope.content, self.content)
+        self.assertEqual(envelope.content_type, cms.OID_DATA)
+        self.assertEqual(len(envelope.signers), 1)
+        self.assertEqual(envelope.signers[0].serial_number, 42)
+        self.assertEqual(envelope.signers[0].message_digest(), hashlib.sha256(self.content).digest())
+
+    def test_decode_rejects_other_content_types(self):
+        with self.assertRaises(cms.CmsError):
+            cms.decode(der.sequence(der.oid(cms.OID_DATA), der.explicit(0, der.octet_string(b''))))
+
+    def test_mobileprovision_parses_once(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = pathlib.Path(tmpdir).joinpath('test.mobileprovision')
+            path.write_bytes(signed_data(self.content))
+            mobileprovision = Mobileprovision(path)
+            self.assertEqual(mobileprovision.entitlements(), self.plist['Entitlements'])
+            path.unlink()
+            self.assertEqual(mobileprovision.signer_hash(), '222BF44D602F5EBE37D1B2DAE59535EF876256E4')
+
+    def test_indefinite_element_must_end_inside_its_container(self):
+        truncated = bytes([0x30, 0x80]) + der.integer(1)
+        data = bytes([0x30, len(truncated)]) + truncated + b'\x00\x00'
+        with self.assertRaises(der.DerError):
+            der.parse(data)
+        with self.assertRaises(cms.CmsError):
+            cms.SignedData(data)
+
+    @unittest.skipIf(x509 is None, 'cryptography is not installed')
+    def test_signer_lookup_skips_certificates_without_subject_key_identifier(self):
+        key = ec.generate_private_key(ec.SECP256R1())
+        name = x509.Name([x509.NameAttribute(x509.NameOID.COMMON_NAME, 'Example')])
+        builder = x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key()) \
+            .serial_number(1).not_valid_before(datetime.datetime(2026, 1, 1)) \
+            .not_valid_after(datetime.datetime(2027, 1, 1))
+        without_ski = builder.sign(key, hashes.SHA256())
+        ski = x509.SubjectKeyIdentifier.from_public_key(key.public_key())
+        with_ski = builder.add_extension(ski, critical=False).sign(key, hashes.SHA256())
+
+        envelope = cms.SignedData(signed_data(self.content))
+        envelope.certificates = [c.public_bytes(serialization.Encoding.DER) for c in (without_ski, with_ski)]
+        signer = envelope.signers[0]
+        signer.serial_number = None
+        signer.subject_key_identifier = ski.digest
+        self.assertEqual(envelope.signer_certificate(signer), with_ski)
+
+        envelope.certificates = envelope.certificates[:1]
+        with self.assertRaises(cms.CmsError):
+            envelope.signer_certificate(signer)
@@ -0,0 +1,127 @@
+import pathlib
+import plistlib
+import tempfile
+import unittest
+from unittest import mock
+
+from element_entitlements import EntitlementsCache, EntitlementsResolver, embedded_entitlements, merge_entitlements
+from native_signer import NativeSigner
+from test_native_signer import identity, unsigned_macho, x509
+
+
+class FakeProfile:
+    def __init__(self, uuid, entitlements):
+        self.uuid = uuid
+        self._entitlements = entitlements
+
+    def plist(self):
+        return {'UUID': self.uuid}
+
+    def entitlements(self):
+        return self._entitlements
+
+
+class TestMergeEntitlements (unittest.TestCase):
+    def setUp(self) -> None:
+        self.granted = {
+            'application-identifier': 'NEWTEAM123.*',
+            'com.apple.developer.team-identifier': 'NEWTEAM123',
+            'keychain-access-groups': ['NEWTEAM123.*'],
+            'com.apple.security.application-groups': ['group.com.example.shared', 'group.com.example.other'],
+            'get-task-allow': True,
+        }
+
+    def test_keeps_granted_existing_values_on_the_new_team(self):
+        existing = {
+            'application-identifier': 'OLDTEAM456.com.example.app.widget',
+            'com.apple.developer.team-identifier': 'OLDTEAM456',
+            'keychain-access-groups': ['OLDTEAM456.com.example.shared'],
+            'com.apple.security.application-groups': ['group.com.example.shared', 'group.com.example.private'],
+            'get-task-allow': False,
+            'com.apple.developer.healthkit': True,
+        }
+        self.assertEqual(merge_entitlements(existing, self.granted, 'com.example.app.widget'), {
+            'application-identifier': 'NEWTEAM123.com.example.app.widget',
+            'com.apple.developer.team-identifier': 'NEWTEAM123',
+            'keychain-access-groups': ['NEWTEAM123.com.example.shared'],
+            'com.apple.security.application-groups': ['group.com.example.shared'],
+            'get-task-allow': True,
+        })
+
+    def test_falls_back_to_profile_values(self):
+        merged = merge_entitlements({}, self.granted, 'com.example.app')
+        self.assertEqual(merged['application-identifier'], 'NEWTEAM123.com.example.app')
+        self.assertEqual(merged['keychain-access-groups'], ['NEWTEAM123.*'])
+
+        exact = dict(self.granted, **{'application-identifier': 'NEWTEAM123.com.example.app'})
+        merged = merge_entitlements({}, exact, 'org.example.other')
+        self.assertEqual(merged['application-identifier'], 'NEWTEAM123.com.example.app')
+
+
+class TestEntitlementsResolver (unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmpdir.name)
+        self.profile = FakeProfile('profile-uuid', {'application-identifier': 'NEWTEAM123.*',
+                                                    'get-task-allow': True})
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def appex(self, name, bundle_id, executable=b''):
+        path = self.root.joinpath('Payload', 'Example.app', 'PlugIns', name + '.appex')
+        path.mkdir(parents=True)
+        path.joinpath('Info.plist').write_bytes(plistlib.dumps({'CFBundleIdentifier': bundle_id,
+                                                                'CFBundleExecutable': name}))
+        path.joinpath(name).write_bytes(executable)
+        return path
+
+    def test_writes_distinct_plists_once_and_caches_merges(self):
+        first = self.appex('First', 'com.example.app.first')
+        second = self.appex('Second', 'com.example.app.second')
+        unsigned = self.appex('Unsigned', 'com.example.app.unsigned', unsigned_macho())
+        existing = plistlib.dumps({'application-identifier': 'OLDTEAM456.com.example.app.shared'})
+        cache_path = self.root.joinpath('entitlements.json')
+
+        with mock.patch('element_entitlements.embedded_entitlements',
+                        side_effect=lambda path: existing if path != unsigned else None):
+            resolver = EntitlementsResolver(self.root, cache=EntitlementsCache(cache_path))
+            paths = resolver.resolve([first, second, unsigned], {second: self.profile}, self.profile)
+            self.assertEqual(sorted(paths), [first, second])
+            self.assertEqual(plistlib.loads(paths[first].read_bytes())['application-identifier'],
+                             'NEWTEAM123.com.example.app.first')
+            self.assertEqual(len(list(self.root.glob('entitlements-*.plist'))), 2)
+
+            resolver = EntitlementsResolver(self.root.joinpath('Payload'), cache=EntitlementsCache(cache_path))
+            resolver.resolve([first, second, unsigned], {unsigned: self.profile}, self.profile)
+            self.assertEqual(resolver.cache.stats()['hits'], 2)
+            self.assertEqual(resolver.cache.stats()['misses'], 1)
+
+    def test_skips_elements_the_default_profile_does_not_cover(self):
+        widget = self.appex('Widget', 'com.example.app.widget')
+        own = self.appex('Own', 'com.example.app.own')
+        existing = plistlib.dumps({'application-identifier': 'OLDTEAM456.com.example.app.widget'})
+        main_profile = FakeProfile('main-uuid', {'application-identifier': 'NEWTEAM123.com.example.app'})
+
+        with mock.patch('element_entitlements.embedded_entitlements', return_value=existing):
+            resolver = EntitlementsResolver(self.root, cache=EntitlementsCache())
+            paths = resolver.resolve([widget, own], {own: self.profile}, main_profile)
+        self.assertEqual(list(paths), [own])
+        self.assertEqual(plistlib.loads(paths[own].read_bytes())['application-identifier'],
+                         'NEWTEAM123.com.example.app.own')
+
+    @unittest.skipIf(x509 is None, 'cryptography is not installed')
+    def test_reads_entitlements_from_embedded_signature(self):
+        appex = self.appex('Widget', 'com.example.app.widget', unsigned_macho())
+        entitlements_path = self.root.joinpath('entitlements.plist')
+        entitlements = {'application-identifier': 'OLDTEAM456.com.example.app.widget', 'get-task-allow': False}
+        entitlements_path.write_bytes(plistlib.dumps(entitlements))
+        self.assertIsNone(embedded_entitlements(appex))
+
+        signer = NativeSigner(identity(self.root), 'secret', workers=1)
+        try:
+            signer.sign(appex, entitlements_path=entitlements_path)
+        finally:
+            signer.close()
+        self.assertEqual(plistlib.loads(embedded_entitlements(appex)), entitlements)
+        self.assertEqual(plistlib.loads(embedded_entitlements(appex.joinpath('Widget'))), entitlements)
@@ -0,0 +1,79 @@
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+from keychains import IdentityIndex, Keychain
+
+
+class TestIdentityIndex (unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmpdir.name)
+        self.cache_path = self.root.joinpath('identities.json')
+        self.identities = {}
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def keychain(self, name, *hashes):
+        path = self.root.joinpath(name + '.keychain-db')
+        path.write_bytes(name.encode('utf-8'))
+        self.identities[path] = [(str(i + 1), h, 'Identity {}'.format(h)) for i, h in enumerate(hashes)]
+        return Keychain(path)
+
+    def find_identities(self):
+        identities = self.identities
+        return mock.patch.object(Keychain, 'get_codesign_identities', autospec=True,
+                                 side_effect=lambda keychain: identities[keychain.path])
+
+    def test_available_hashes_only_cover_given_keychains(self):
+        login = self.keychain('login', 'AAAA')
+        build = self.keychain('build', 'BBBB')
+        with self.find_identities():
+            index = IdentityIndex(cache_path=self.cache_path)
+            index.refresh([login, build])
+            index = IdentityIndex(cache_path=self.cache_path)
+            self.assertEqual(index.available_hashes([login]), {'AAAA'})
+
+            gone = Keychain(self.root.joinpath('gone.keychain-db'))
+            self.assertEqual(index.available_hashes([login, gone]), {'AAAA'})
+
+    def test_entries_are_refreshed_when_keychain_changes(self):
+        login = self.keychain('login', 'AAAA')
+        with self.find_identities() as find:
+            index = IdentityIndex(cache_path=self.cache_path)
+            self.assertEqual(index.identity_hashes(login), {'AAAA'})
+            self.assertEqual(index.identity_hashes(login), {'AAAA'})
+            self.assertEqual(find.call_count, 1)
+
+            self.identities[login.path].append(('2', 'BBBB', 'Identity BBBB'))
+            login.path.write_bytes(b'login keychain with a second identity')
+            self.assertEqual(index.identity_hashes(login), {'AAAA', 'BBBB'})
+            self.assertEqual(find.call_count, 2)
+
+            index.invalidate(login)
+            index.identity_hashes(login)
+            self.assertEqual(find.call_count, 3)
+
+    def test_index_persists_through_environment_path(self):
+        login = self.keychain('login', 'AAAA')
+        with mock.patch.dict('os.environ', {'IRESIGN_IDENTITY_INDEX': self.cache_path.as_posix()}), \
+                mock.patch.object(IdentityIndex, '_default', None):
+            with self.find_identities() as find:
+                IdentityIndex.default().identity_hashes(login)
+            self.assertTrue(self.cache_path.is_file())
+
+            IdentityIndex._default = None
+            with mock.patch.object(Keychain, 'get_codesign_identities', side_effect=AssertionError('listed again')):
+                self.assertEqual(IdentityIndex.default().identity_hashes(login), {'AAAA'})
+        self.assertEqual(find.call_count, 1)
+
+    def test_keychains_with_hash(self):
+        login = self.keychain('login', 'AAAA', 'BBBB')
+        build = self.keychain('build', 'BBBB')
+        with self.find_identities():
+            index = IdentityIndex(cache_path=self.cache_path)
+            self.assertEqual(index.keychains_with_hash('bbbb', [login, build]), [login.path, build.path])
+            self.assertEqual(index.keychains_with_hash('AAAA', [build]), [])
+            self.assertEqual(index.keychains_with_hash('CCCC', [login, build]), [])
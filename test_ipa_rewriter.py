@@ -0,0 +1,82 @@
+import os
+import pathlib
+import tempfile
+import unittest
+import zipfile
+
+from archive_writer import Compression
+from ipa_rewriter import IpaRewriter
+
+
+class TestIpaRewriter (unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmpdir.name)
+        self.source = self.root.joinpath('source.ipa')
+        with zipfile.ZipFile(self.source, 'w') as z:
+            z.writestr('Payload/', b'')
+            z.writestr('Payload/Example.app/', b'')
+            z.writestr('Payload/Example.app/Example', b'\xcf\xfa\xed\xfe' + b'\x00' * 4096)
+            z.writestr('Payload/Example.app/Assets.car', os.urandom(8192), compress_type=zipfile.ZIP_STORED)
+            z.writestr('Payload/Example.app/Info.plist', b'<plist/>' * 512, compress_type=zipfile.ZIP_DEFLATED)
+            z.writestr('Payload/Example.app/_CodeSignature/CodeResources', b'old seal')
+        self.staged = self.root.joinpath('staged')
+        self.output = self.root.joinpath('output.ipa')
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_rewrite_passes_through_unchanged_entries(self):
+        rewriter = IpaRewriter(self.source)
+        rewriter.extract(self.staged)
+
+        app = self.staged.joinpath('Payload', 'Example.app')
+        app.joinpath('_CodeSignature', 'CodeResources').unlink()
+        app.joinpath('Example').write_bytes(b'\xcf\xfa\xed\xfe' + b'\x01' * 5000)
+        app.joinpath('embedded.mobileprovision').write_bytes(b'profile')
+
+        staged_paths = sorted(self.staged.glob('**/*'))
+        passed_through, rewritten = rewriter.rewrite(self.staged, self.output, staged_paths)
+
+        with zipfile.ZipFile(self.source) as source, zipfile.ZipFile(self.output) as output:
+            self.assertIsNone(output.testzip())
+            names = output.namelist()
+            self.assertNotIn('Payload/Example.app/_CodeSignature/CodeResources', names)
+            self.assertEqual(output.read('Payload/Example.app/embedded.mobileprovision'), b'profile')
+            self.assertEqual(output.read('Payload/Example.app/Example'), b'\xcf\xfa\xed\xfe' + b'\x01' * 5000)
+            for name in ['Payload/Example.app/Assets.car', 'Payload/Example.app/Info.plist']:
+                self.assertEqual(output.getinfo(name).compress_size, source.getinfo(name).compress_size)
+                self.assertEqual(output.getinfo(name).compress_type, source.getinfo(name).compress_type)
+                self.assertEqual(output.read(name), source.read(name))
+            self.assertIn('Payload/Example.app/_CodeSignature/', names)
+
+        self.assertEqual(passed_through, 4)
+        self.assertEqual(rewritten, 3)
+
+    def test_rewrite_deflates_new_entries_in_parallel_and_stores_media(self):
+        rewriter = IpaRewriter(self.source)
+        rewriter.extract(self.staged)
+
+        app = self.staged.joinpath('Payload', 'Example.app')
+        for i in range(8):
+            app.joinpath('file{}.txt'.format(i)).write_bytes('text {} '.format(i).encode('ascii') * 4096)
+        app.joinpath('Icon.png').write_bytes(b'png ' * 4096)
+
+        staged_paths = sorted(self.staged.glob('**/*'))
+        compression = Compression(level=9, store_media=True, workers=4)
+        rewriter.rewrite(self.staged, self.output, staged_paths, compression=compression)
+
+        with zipfile.ZipFile(self.output) as output:
+            self.assertIsNone(output.testzip())
+            names = output.namelist()
+            self.assertEqual(names[:6], ['Payload/', 'Payload/Example.app/', 'Payload/Example.app/Example',
+                                         'Payload/Example.app/Assets.car', 'Payload/Example.app/Info.plist',
+                                         'Payload/Example.app/_CodeSignature/CodeResources'])
+            self.assertEqual(output.getinfo('Payload/Example.app/Icon.png').compress_type, zipfile.ZIP_STORED)
+            for i in range(8):
+                info = output.getinfo('Payload/Example.app/file{}.txt'.format(i))
+                self.assertEqual(info.compress_type, zipfile.ZIP_DEFLATED)
+                self.assertLess(info.compress_size, info.file_size)
+                self.assertEqual(output.read(info), 'text {} '.format(i).encode('ascii') * 4096)
+            offsets = [info.header_offset for info in output.infolist()]
+            self.assertEqual(offsets, sorted(offsets))
@@ -0,0 +1,88 @@
+import datetime
+import pathlib
+import plistlib
+import subprocess
+import sys
+import tempfile
+import unittest
+import zipfile
+
+import iresign
+import macho
+from test_cms import signed_data
+from test_native_signer import identity, unsigned_macho, x509
+
+
+@unittest.skipIf(x509 is None, 'cryptography is not installed')
+class TestResignApi (unittest.TestCase):
+    def setUp(self) -> None:
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.serialization import pkcs12
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmpdir.name)
+        self.p12 = identity(self.root)
+        _, certificate, _ = pkcs12.load_key_and_certificates(self.p12.read_bytes(), b'secret')
+
+        self.profile = self.root.joinpath('Example.mobileprovision')
+        self.profile.write_bytes(signed_data(plistlib.dumps({
+            'UUID': 'example',
+            'TeamIdentifier': ['ABCDE12345'],
+            'ExpirationDate': datetime.datetime.now() + datetime.timedelta(days=1),
+            'DeveloperCertificates': [certificate.public_bytes(serialization.Encoding.DER)],
+            'Entitlements': {'application-identifier': 'ABCDE12345.com.example.app'},
+        })))
+
+        self.ipa = self.root.joinpath('Example.ipa')
+        with zipfile.ZipFile(self.ipa, 'w') as z:
+            z.writestr('Payload/Example.app/Example', unsigned_macho())
+            z.writestr('Payload/Example.app/Info.plist', plistlib.dumps({'CFBundleExecutable': 'Example',
+                                                                         'CFBundleIdentifier': 'com.example.app'}))
+            z.writestr('Payload/Example.app/Frameworks/libExample.dylib', unsigned_macho(text_size=0x2000))
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_resign_returns_result_and_reuses_session_state(self):
+        session = iresign.Session()
+        output = self.root.joinpath('Resigned.ipa')
+        result = session.resign(self.ipa, self.profile, output, jobs=2, backend='native', p12=self.p12,
+                                p12_password='secret')
+
+        self.assertEqual(result.output_path, output)
+        self.assertEqual(result.backend, 'native')
+        self.assertEqual(sorted(result.signed), ['Payload/Example.app',
+                                                'Payload/Example.app/Frameworks/libExample.dylib'])
+        with zipfile.ZipFile(output) as z:
+            self.assertIsNotNone(macho.MachO(z.read('Payload/Example.app/Example')).code_signature)
+            self.assertIn('Payload/Example.app/_CodeSignature/CodeResources', z.namelist())
+            self.assertEqual(z.read('Payload/Example.app/embedded.mobileprovision'), self.profile.read_bytes())
+
+        signer = session.signer('native', self.p12, 'secret', jobs=2)
+        mobileprovision = session.mobileprovision(self.profile)
+        session.resign(self.ipa, self.profile, output, jobs=2, backend='native', p12=self.p12, p12_password='secret')
+        self.assertIs(session.signer('native', self.p12, 'secret', jobs=2), signer)
+        self.assertIs(session.mobileprovision(self.profile), mobileprovision)
+
+    def test_resign_app_bundle_signs_main_bundle(self):
+        app = self.root.joinpath('Example.app')
+        with zipfile.ZipFile(self.ipa) as z:
+            for name in z.namelist():
+                target = app.joinpath(name[len('Payload/Example.app/'):])
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_bytes(z.read(name))
+
+        output = self.root.joinpath('Resigned.app')
+        result = iresign.Session().resign(app, self.profile, output, jobs=2, backend='native', p12=self.p12,
+                                          p12_password='secret')
+
+        self.assertEqual(sorted(result.signed), ['Example.app', 'Example.app/Frameworks/libExample.dylib'])
+        self.assertIsNotNone(macho.MachO(output.joinpath('Example').read_bytes()).code_signature)
+        self.assertTrue(output.joinpath('_CodeSignature', 'CodeResources').is_file())
+        self.assertEqual(output.joinpath('embedded.mobileprovision').read_bytes(), self.profile.read_bytes())
+
+    def test_import_stays_lazy(self):
+        code = 'import sys, iresign; print(" ".join(m for m in ["zipfile", "plistlib", "keychains", "batch"] ' \
+               'if m in sys.modules))'
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=pathlib.Path(iresign.__file__).parent)
+        self.assertEqual(output.strip(), b'')
@@ -4,7 +4,9 @@ import tempfile
 import unittest
 
 from collections import Counter
-from keychains import Keychain, Keychains, TemporaryKeychain
+from unittest import mock
+from keychains import CertificateImport, IdentityIndex, Keychain, Keychains, KeychainSearchList, TemporaryKeychain
+from misc import pkcs12_signer_hashes
 
 
 class TestKeychain (unittest.TestCase):
@@ -56,6 +58,12 @@ class TestKeychain (unittest.TestCase):
             shasum = tk.get_codesign_identities()[0][1]
             self.assertEqual(shasum, 'D14B0D8B333BE0451C9CF1E88F14D99087435623')
 
+    def test_p12_signer_hashes_match_imported_identity(self):
+        hashes = pkcs12_signer_hashes('./TestCertificate.p12', 'test')
+        if hashes is None:
+            self.skipTest('cryptography is not installed')
+        self.assertEqual(hashes, {'D14B0D8B333BE0451C9CF1E88F14D99087435623'})
+
     def test_adding_keychain_to_search_list_adds_it_exactly_once(self):
         deadend = Keychain('DeadEnd.keychain')
         deadend.add_to_keychain_search()
@@ -65,6 +73,49 @@ class TestKeychain (unittest.TestCase):
         count = Counter(paths)
         self.assertEqual(count[deadend.path], 1)
 
+    def test_search_list_reads_once_and_writes_once(self):
+        login = pathlib.Path('/Users/example/Library/Keychains/login.keychain-db')
+        system = pathlib.Path('/Library/Keychains/System.keychain')
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch.object(Keychains, 'list_keychain_paths', return_value=[login, system, login]) as read, \
+                mock.patch.object(Keychains, 'rewrite_keychain_search') as write:
+            with KeychainSearchList(lock_path=pathlib.Path(tmpdir).joinpath('lock')) as search:
+                first = Keychain(pathlib.Path(tmpdir).joinpath('first.keychain-db'))
+                second = Keychain(pathlib.Path(tmpdir).joinpath('second.keychain-db'))
+                first.add_to_keychain_search(search)
+                second.add_to_keychain_search(search)
+                first.add_to_keychain_search(search)
+                search.remove(system)
+            read.assert_called_once_with()
+            write.assert_called_once_with([second.path, first.path, login])
+
+    def test_batch_import_skips_present_certificates_and_sets_partition_list_once(self):
+        hashes = {'present.p12': {'AAAA'}, 'first.p12': {'BBBB'}, 'again.p12': {'BBBB'}, 'second.p12': {'CCCC'}}
+
+        def p12_hashes(path, password):
+            if path.name == 'broken.p12':
+                raise ValueError('Invalid password or PKCS12 data')
+            return hashes[path.name]
+
+        index = mock.Mock(spec=IdentityIndex)
+        index.identity_hashes.return_value = {'AAAA'}
+        keychain = Keychain(pathlib.Path('/tmp/batch.keychain-db'))
+        with mock.patch.object(IdentityIndex, 'default', return_value=index), \
+                mock.patch.object(Keychain, 'p12_hashes', side_effect=p12_hashes), \
+                mock.patch.object(Keychain, 'import_codesign_certificate') as import_certificate, \
+                mock.patch.object(Keychain, 'set_apple_tool_partition_list') as set_partition_list:
+            results = keychain.import_codesign_certificates(
+                [(pathlib.Path(name), 'secret') for name in ['present.p12', 'first.p12', 'broken.p12', 'again.p12',
+                                                             'second.p12']])
+
+        self.assertEqual([result.status for result in results],
+                         [CertificateImport.PRESENT, CertificateImport.IMPORTED, CertificateImport.FAILED,
+                          CertificateImport.PRESENT, CertificateImport.IMPORTED])
+        self.assertEqual([c.args[0].name for c in import_certificate.call_args_list], ['first.p12', 'second.p12'])
+        self.assertTrue(all(c.kwargs['set_partition_list'] is False for c in import_certificate.call_args_list))
+        set_partition_list.assert_called_once_with()
+        index.invalidate.assert_called_once_with(keychain)
+
     @staticmethod
     def random_keychain_name():
         return 'TemporaryKeychain-' + str(random.randrange(0x1000000000))
@@ -0,0 +1,153 @@
+import os
+import pathlib
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from keychains import Keychain, KeychainPool
+
+
+class TestKeychainPool (unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.keychain_dir = pathlib.Path(self.tmpdir.name)
+        self.created = []
+        self.deleted = []
+        self.wiped = []
+
+        def create(keychain):
+            keychain.path.write_bytes(b'keychain')
+            self.created.append(keychain.path)
+
+        def delete(keychain):
+            keychain.path.unlink(missing_ok=True)
+            self.deleted.append(keychain.path)
+
+        patches = [
+            mock.patch.object(KeychainPool, 'keychain_dir', return_value=self.keychain_dir),
+            mock.patch.object(Keychain, 'create', autospec=True, side_effect=create),
+            mock.patch.object(Keychain, 'delete', autospec=True, side_effect=delete),
+            mock.patch.object(Keychain, 'unlock'),
+            mock.patch.object(Keychain, 'set_unlock_no_timeout'),
+            mock.patch.object(KeychainPool, 'wipe', side_effect=lambda keychain: self.wiped.append(keychain.path)),
+            mock.patch.object(KeychainPool, 'create_keychain', autospec=True, side_effect=self.create_keychain),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def create_keychain(self, pool):
+        keychain = Keychain(self.keychain_dir.joinpath('{}{}-{}.keychain-db'.format(
+            KeychainPool.PREFIX, os.getpid(), len(self.created))))
+        keychain.create()
+        return keychain
+
+    def test_warmed_keychains_are_leased_without_creating_more(self):
+        pool = KeychainPool(size=2)
+        pool.warm()
+        self.assertEqual(len(self.created), 2)
+        with pool.lease() as first, pool.lease() as second:
+            self.assertNotEqual(first.path, second.path)
+        self.assertEqual(len(self.created), 2)
+        self.assertEqual(self.wiped, [])
+
+    def test_returned_keychains_are_wiped_only_when_reused(self):
+        pool = KeychainPool(size=1)
+        with pool.lease() as keychain:
+            pass
+        self.assertEqual(self.wiped, [])
+        with pool.lease() as reused:
+            self.assertEqual(reused.path, keychain.path)
+        self.assertEqual(self.wiped, [keychain.path])
+
+        pool.close()
+        self.assertEqual(self.deleted, [keychain.path])
+
+    def test_leases_are_bounded(self):
+        pool = KeychainPool(size=1)
+        first = pool.acquire()
+        acquired = threading.Event()
+
+        def lease_second():
+            pool.release(pool.acquire())
+            acquired.set()
+
+        thread = threading.Thread(target=lease_second)
+        thread.start()
+        self.assertFalse(acquired.wait(0.2))
+        pool.release(first)
+        self.assertTrue(acquired.wait(5))
+        thread.join(5)
+        self.assertEqual(len(self.created), 1)
+
+    def test_idle_keychains_are_evicted(self):
+        pool = KeychainPool(size=2, idle_timeout=60)
+        pool.warm(1)
+        idle = self.created[0]
+        later = time.monotonic() + 120
+        with mock.patch('time.monotonic', return_value=later), pool.lease() as keychain:
+            self.assertNotEqual(keychain.path, idle)
+        self.assertEqual(self.deleted, [idle])
+        pool.close()
+
+    def test_idle_keychains_are_evicted_without_further_leases(self):
+        pool = KeychainPool(size=2, idle_timeout=0.05)
+        with pool.lease() as keychain:
+            pass
+        deadline = time.monotonic() + 5
+        while not self.deleted and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.deleted, [keychain.path])
+        self.assertEqual(pool.idle, [])
+
+    def test_default_pool_is_created_once(self):
+        created = []
+        cleanup_leaked = KeychainPool.cleanup_leaked
+
+        def slow_cleanup():
+            created.append(threading.get_ident())
+            time.sleep(0.05)
+            cleanup_leaked()
+
+        with mock.patch.object(KeychainPool, '_default', None), \
+                mock.patch.object(KeychainPool, 'cleanup_leaked', side_effect=slow_cleanup), \
+                mock.patch('atexit.register') as register:
+            pools = []
+            threads = [threading.Thread(target=lambda: pools.append(KeychainPool.default())) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(5)
+        self.assertEqual(len(created), 1)
+        self.assertEqual(len({id(pool) for pool in pools}), 1)
+        register.assert_called_once()
+
+    def test_keychains_leaked_by_dead_processes_are_deleted(self):
+        dead = self.keychain_dir.joinpath('{}999999-0-1.keychain-db'.format(KeychainPool.PREFIX))
+        alive = self.keychain_dir.joinpath('{}1-0-1.keychain-db'.format(KeychainPool.PREFIX))
+        own = self.keychain_dir.joinpath('{}{}-0-1.keychain-db'.format(KeychainPool.PREFIX, os.getpid()))
+        other = self.keychain_dir.joinpath('login.keychain-db')
+        for path in (dead, alive, own, other):
+            path.write_bytes(b'keychain')
+
+        with mock.patch.object(KeychainPool, 'is_process_alive', side_effect=lambda pid: pid != 999999):
+            KeychainPool(size=1)
+        self.assertEqual(self.deleted, [dead])
+        self.assertEqual(sorted(p.name for p in self.keychain_dir.iterdir()),
+                         sorted(p.name for p in (alive, own, other)))
+
+    def test_batch_hashing_warms_the_pool_without_cryptography(self):
+        pool = KeychainPool(size=2)
+        certificates = [(pathlib.Path('{}.p12'.format(i)), 'secret') for i in range(3)]
+        with mock.patch.object(KeychainPool, 'default', return_value=pool), \
+                mock.patch('importlib.util.find_spec', return_value=None), \
+                mock.patch.object(pool, 'warm_in_background') as warm, \
+                mock.patch.object(Keychain, 'p12_hashes', side_effect=lambda path, password: {path.stem}):
+            hashes = Keychain.p12_hashes_many(certificates)
+        warm.assert_called_once_with(2)
+        self.assertEqual(hashes, [{'0'}, {'1'}, {'2'}])
@@ -0,0 +1,146 @@
+import datetime
+import hashlib
+import pathlib
+import plistlib
+import struct
+import tempfile
+import unittest
+
+import cms
+import macho
+
+try:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.hazmat.primitives.serialization import pkcs12
+except ImportError:
+    x509 = None
+
+
+def unsigned_macho(text_size=0x6000, linkedit_size=0x100):
+    # A minimal 64-bit executable: __TEXT covering the header, then __LINKEDIT.
+    commands = b''
+    commands += struct.pack('<2I16s4Q4I', macho.LC_SEGMENT_64, 72, b'__TEXT', 0x100000000, text_size, 0, text_size,
+                            5, 5, 0, 0)
+    commands += struct.pack('<2I16s4Q4I', macho.LC_SEGMENT_64, 72, b'__LINKEDIT', 0x100000000 + text_size, 0x4000,
+                            text_size, linkedit_size, 1, 1, 0, 0)
+    header = struct.pack('<7II', macho.MH_MAGIC_64, 0x0100000c, 0, macho.MH_EXECUTE, 2, len(commands), 0, 0)
+    body = header + commands
+    text = body + bytes(range(256)) * ((text_size - len(body)) // 256) + b'\x00' * ((text_size - len(body)) % 256)
+    return text + b'\xab' * linkedit_size
+
+
+def identity(directory):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([
+        x509.NameAttribute(x509.NameOID.COMMON_NAME, 'Apple Development: Example (ABCDE12345)'),
+        x509.NameAttribute(x509.NameOID.ORGANIZATIONAL_UNIT_NAME, 'ABCDE12345'),
+    ])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key()) \
+        .serial_number(7).not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1)) \
+        .sign(key, hashes.SHA256())
+    p12_path = directory.joinpath('identity.p12')
+    p12_path.write_bytes(pkcs12.serialize_key_and_certificates(
+        b'example', key, certificate, None, serialization.BestAvailableEncryption(b'secret')))
+    return p12_path
+
+
+@unittest.skipIf(x509 is None, 'cryptography is not installed')
+class TestNativeSigner (unittest.TestCase):
+    def setUp(self) -> None:
+        from native_signer import NativeSigner
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmpdir.name)
+        self.signer = NativeSigner(identity(self.root), 'secret', workers=2)
+        self.app = self.root.joinpath('Example.app')
+        self.app.mkdir()
+        self.app.joinpath('Example').write_bytes(unsigned_macho())
+        self.info_plist = plistlib.dumps({'CFBundleExecutable': 'Example', 'CFBundleIdentifier': 'com.example.app'})
+        self.app.joinpath('Info.plist').write_bytes(self.info_plist)
+        self.entitlements_path = self.root.joinpath('entitlements.plist')
+        self.entitlements_path.write_bytes(plistlib.dumps({'get-task-allow': True,
+                                                           'application-identifier': 'ABCDE12345.com.example.app'}))
+
+    def tearDown(self) -> None:
+        self.signer.close()
+        self.tmpdir.cleanup()
+
+    def test_signs_bundle_executable_with_page_hashes_and_cms(self):
+        self.signer.sign(self.app, entitlements_path=self.entitlements_path)
+
+        data = self.app.joinpath('Example').read_bytes()
+        image = macho.MachO(data)
+        code_limit = image.code_signature.dataoff
+        self.assertEqual(code_limit, 0x6100)
+        self.assertEqual(image.segments['__LINKEDIT'].fileoff + image.segments['__LINKEDIT'].filesize, len(data))
+
+        blobs = macho.parse_superblob(image.embedded_signature())
+        self.assertEqual(sorted(blobs), [0, 2, 5, 7, 0x1000, 0x10000])
+        code_directory = macho.best_code_directory(blobs)
+        self.assertEqual(macho.code_directory_hash_type(code_directory), macho.CS_HASHTYPE_SHA256)
+
+        hash_offset, ident_offset, special_count, code_count = struct.unpack_from('>4I', code_directory, 16)
+        self.assertEqual(code_directory[ident_offset:code_directory.index(b'\0', ident_offset)], b'com.example.app')
+        self.assertEqual(code_count, 7)
+        for page in range(code_count):
+            expected = hashlib.sha256(data[page * 4096:min((page + 1) * 4096, code_limit)]).digest()
+            self.assertEqual(code_directory[hash_offset + page * 32:hash_offset + (page + 1) * 32], expected)
+        info_slot = hash_offset - 32
+        self.assertEqual(code_directory[info_slot:hash_offset], hashlib.sha256(self.info_plist).digest())
+        entitlements_slot = hash_offset - 5 * 32
+        self.assertEqual(code_directory[entitlements_slot:entitlements_slot + 32], hashlib.sha256(blobs[5]).digest())
+        exec_flags = struct.unpack_from('>Q', code_directory, 80)[0]
+        self.assertEqual(exec_flags, 0x11)
+
+        signature = cms.SignedData(macho.blob_payload(blobs[0x10000]))
+        signature.verify(detached_content=blobs[0])
+
+    def test_resigning_reuses_existing_signature_slot(self):
+        self.signer.sign(self.app)
+        first = macho.MachO(self.app.joinpath('Example').read_bytes()).code_signature
+        self.signer.sign(self.app)
+        second = macho.MachO(self.app.joinpath('Example').read_bytes()).code_signature
+        self.assertEqual(first.dataoff, second.dataoff)
+        self.assertEqual(first.command_offset, second.command_offset)
+
+    def test_rejects_identity_that_does_not_match_profile(self):
+        from native_signer import NativeSigningError
+        with self.assertRaises(NativeSigningError):
+            self.signer.sign(self.app, signer_hash='0' * 40)
+
+    def test_rejects_bundle_without_executable(self):
+        from native_signer import NativeSigningError
+        bundle = self.app.joinpath('PlugIns', 'Resources.bundle')
+        bundle.mkdir(parents=True)
+        bundle.joinpath('Info.plist').write_bytes(plistlib.dumps({'CFBundleIdentifier': 'com.example.resources'}))
+        with self.assertRaisesRegex(NativeSigningError, 'Resources.bundle has no CFBundleExecutable'):
+            self.signer.sign(bundle)
+
+    def test_bundle_seal_lists_nested_code_file_by_file(self):
+        framework = self.app.joinpath('Frameworks', 'Lib.framework')
+        framework.mkdir(parents=True)
+        framework.joinpath('Lib').write_bytes(unsigned_macho(text_size=0x2000))
+        framework.joinpath('Info.plist').write_bytes(plistlib.dumps({'CFBundleExecutable': 'Lib',
+                                                                     'CFBundleIdentifier': 'com.example.lib'}))
+        resources = self.app.joinpath('PlugIns', 'Resources.bundle')
+        resources.mkdir(parents=True)
+        resources.joinpath('Info.plist').write_bytes(plistlib.dumps({'CFBundleIdentifier': 'com.example.resources'}))
+        self.signer.sign(framework)
+        self.signer.sign(self.app)
+
+        code_resources = self.app.joinpath('_CodeSignature', 'CodeResources').read_bytes()
+        files2 = plistlib.loads(code_resources)['files2']
+        self.assertNotIn('Frameworks/Lib.framework', files2)
+        lib = framework.joinpath('Lib').read_bytes()
+        self.assertEqual(files2['Frameworks/Lib.framework/Lib']['hash2'], hashlib.sha256(lib).digest())
+        self.assertIn('Frameworks/Lib.framework/_CodeSignature/CodeResources', files2)
+        self.assertIn('PlugIns/Resources.bundle/Info.plist', files2)
+        self.assertIn('Frameworks/Lib.framework/Lib', plistlib.loads(code_resources)['files'])
+
+        app_blobs = macho.parse_superblob(macho.MachO(self.app.joinpath('Example').read_bytes()).embedded_signature())
+        code_directory = macho.best_code_directory(app_blobs)
+        hash_offset = struct.unpack_from('>I', code_directory, 16)[0]
+        resources_slot = hash_offset - 3 * 32
+        self.assertEqual(code_directory[resources_slot:resources_slot + 32], hashlib.sha256(code_resources).digest())
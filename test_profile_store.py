@@ -0,0 +1,100 @@
+import datetime
+import pathlib
+import plistlib
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from misc import signer_hash
+from profile_store import ProfileStore, ProfileStoreError, bundle_identifier
+from test_cms import signed_data
+
+
+class TestProfileStore (unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmpdir.name)
+        self.profiles = self.root.joinpath('Provisioning Profiles')
+        self.profiles.mkdir()
+        self.index = self.root.joinpath('profiles.json')
+        self.now = datetime.datetime(2026, 1, 1)
+
+        self.write_profile('wildcard', 'ABCDE12345.com.example.*', b'certificate')
+        self.write_profile('exact', 'ABCDE12345.com.example.app', b'certificate')
+        self.write_profile('expired', 'ABCDE12345.com.example.app', b'certificate', days=-1)
+        self.write_profile('other-certificate', 'ABCDE12345.com.example.app.widget', b'other certificate')
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def write_profile(self, name, app_id, certificate, days=30):
+        plist = {
+            'UUID': name,
+            'Name': name,
+            'TeamIdentifier': ['ABCDE12345'],
+            'ExpirationDate': self.now + datetime.timedelta(days=days),
+            'DeveloperCertificates': [certificate],
+            'Entitlements': {'application-identifier': app_id},
+        }
+        self.profiles.joinpath(name + '.mobileprovision').write_bytes(signed_data(plistlib.dumps(plist)))
+
+    def select(self, store, bundle_id, **kwargs):
+        return store.select(bundle_id, now=self.now.replace(tzinfo=datetime.timezone.utc).timestamp(), **kwargs)
+
+    def test_selects_most_specific_unexpired_profile(self):
+        store = ProfileStore(self.profiles, cache_path=self.index)
+        self.assertEqual(self.select(store, 'com.example.app').plist()['UUID'], 'exact')
+        self.assertEqual(self.select(store, 'com.example.other').plist()['UUID'], 'wildcard')
+        self.assertEqual(self.select(store, 'com.example.app.widget').plist()['UUID'], 'other-certificate')
+        with self.assertRaises(ProfileStoreError):
+            self.select(store, 'org.example.app')
+
+    def test_filters_profiles_by_available_certificate(self):
+        store = ProfileStore(self.profiles, cache_path=self.index)
+        mobileprovision = self.select(store, 'com.example.app.widget', signer_hashes={signer_hash(b'certificate')})
+        self.assertEqual(mobileprovision.plist()['UUID'], 'wildcard')
+
+    def test_index_is_reused_until_profiles_change(self):
+        ProfileStore(self.profiles, cache_path=self.index).scan()
+        with mock.patch.object(ProfileStore, 'describe', side_effect=AssertionError('decoded again')):
+            store = ProfileStore(self.profiles, cache_path=self.index)
+            self.assertEqual(len(store.profiles()), 4)
+
+        self.profiles.joinpath('wildcard.mobileprovision').unlink()
+        self.write_profile('new', 'ABCDE12345.org.example.app', b'certificate')
+        store = ProfileStore(self.profiles, cache_path=self.index)
+        self.assertEqual(sorted(entry['uuid'] for entry in store.profiles().values()),
+                         ['exact', 'expired', 'new', 'other-certificate'])
+
+    def test_unreadable_profiles_are_reported_when_nothing_matches(self):
+        self.profiles.joinpath('broken.mobileprovision').write_bytes(b'not a CMS envelope')
+        store = ProfileStore(self.profiles, cache_path=self.index)
+        with self.assertRaisesRegex(ProfileStoreError, r'broken\.mobileprovision \(CmsError: '):
+            self.select(store, 'org.example.app')
+        self.assertEqual(list(store.skipped), [self.profiles.joinpath('broken.mobileprovision').as_posix()])
+
+        with mock.patch.object(ProfileStore, 'describe', side_effect=RuntimeError('bug')):
+            with self.assertRaises(RuntimeError):
+                ProfileStore(self.profiles, cache_path=None).scan()
+
+    def test_accepts_string_expiration_dates(self):
+        plist = {
+            'UUID': 'string-date',
+            'TeamIdentifier': ['ABCDE12345'],
+            'ExpirationDate': '2099-01-01T00:00:00Z',
+            'Entitlements': {'application-identifier': 'ABCDE12345.org.example.app'},
+        }
+        self.profiles.joinpath('string-date.mobileprovision').write_bytes(signed_data(plistlib.dumps(plist)))
+        store = ProfileStore(self.profiles, cache_path=self.index)
+        self.assertEqual(self.select(store, 'org.example.app').plist()['UUID'], 'string-date')
+        self.assertEqual(store.profiles()[self.profiles.joinpath('string-date.mobileprovision').as_posix()]['expires'],
+                         datetime.datetime(2099, 1, 1, tzinfo=datetime.timezone.utc).timestamp())
+
+    def test_reads_bundle_identifier_from_ipa(self):
+        ipa = self.root.joinpath('Example.ipa')
+        with zipfile.ZipFile(ipa, 'w') as z:
+            z.writestr('Payload/Example.app/PlugIns/Widget.appex/Info.plist',
+                       plistlib.dumps({'CFBundleIdentifier': 'com.example.app.widget'}))
+            z.writestr('Payload/Example.app/Info.plist', plistlib.dumps({'CFBundleIdentifier': 'com.example.app'}))
+        self.assertEqual(bundle_identifier(ipa), 'com.example.app')
@@ -0,0 +1,115 @@
+import pathlib
+import plistlib
+import tempfile
+import threading
+import unittest
+import zipfile
+
+import iresign
+import macho
+from resign_server import ResignServer, ResignServerError, request, submit_job
+import test_iresign
+from test_native_signer import x509
+
+
+class BlockingSession:
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.order = []
+        self.options = []
+
+    def resign(self, input_path, profile=None, output=None, **options):
+        self.started.set()
+        self.release.wait(10)
+        self.order.append((input_path, options['jobs']))
+        self.options.append(options)
+        raise RuntimeError('not signed')
+
+
+class TestResignServerQueue (unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.session = BlockingSession()
+        self.server = ResignServer(pathlib.Path(self.tmpdir.name).joinpath('iresign.sock'), workers=1, max_jobs=2,
+                                   session=self.session)
+        self.server.start()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self) -> None:
+        self.session.release.set()
+        self.server.shutdown()
+        self.thread.join(10)
+        self.tmpdir.cleanup()
+
+    def test_runs_higher_priority_jobs_first_with_capped_concurrency(self):
+        blocker = self.server.submit({'input': 'blocker'})
+        self.assertTrue(self.session.started.wait(10))
+        low = self.server.submit({'input': 'low', 'priority': 0, 'jobs': 1})
+        high = self.server.submit({'input': 'high', 'priority': 5, 'jobs': 16})
+        self.assertEqual(self.server.status()['queued'], 2)
+        self.session.release.set()
+
+        for job in (blocker, low, high):
+            while True:
+                event = job.events.get(timeout=10)
+                if event['event'] in ('done', 'failed'):
+                    break
+            self.assertEqual(event['event'], 'failed')
+            self.assertIn('not signed', event['error'])
+        self.assertEqual(self.session.order, [('blocker', 2), ('high', 2), ('low', 1)])
+
+    def test_accepts_inline_entitlements_or_a_plist_path(self):
+        self.session.release.set()
+        entitlements = {'application-identifier': 'ABCDE12345.com.example.app', 'get-task-allow': True}
+        entitlements_path = pathlib.Path(self.tmpdir.name).joinpath('entitlements.plist')
+        entitlements_path.write_bytes(plistlib.dumps(entitlements))
+
+        submit_job(self.server.socket_path, {'input': 'inline', 'entitlements': entitlements})
+        submit_job(self.server.socket_path, {'input': 'path', 'entitlements': str(entitlements_path)})
+        self.assertEqual([options['entitlements'] for options in self.session.options], [entitlements, entitlements])
+
+        event = submit_job(self.server.socket_path, {'input': 'missing', 'entitlements': 'missing.plist'})
+        self.assertEqual(event['event'], 'failed')
+        self.assertIn('missing.plist', event['error'])
+
+    def test_rejects_bad_requests(self):
+        with self.assertRaises(ResignServerError):
+            request(self.server.socket_path, {'op': 'submit', 'job': {}})
+        with self.assertRaises(ResignServerError):
+            request(self.server.socket_path, {'op': 'unknown'})
+        self.assertEqual(request(self.server.socket_path, {'op': 'status'})['workers'], 1)
+
+
+@unittest.skipIf(x509 is None, 'cryptography is not installed')
+class TestResignServer (unittest.TestCase):
+    setUp = test_iresign.TestResignApi.setUp
+    tearDown = test_iresign.TestResignApi.tearDown
+
+    def test_streams_stages_and_result(self):
+        session = iresign.Session()
+        server = ResignServer(self.root.joinpath('iresign.sock'), workers=2, session=session).start()
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            output = self.root.joinpath('Resigned.ipa')
+            job = {'input': self.ipa, 'profile': self.profile, 'output': output, 'backend': 'native', 'p12': self.p12,
+                   'p12_password': 'secret'}
+            events = []
+            event = submit_job(server.socket_path, {k: str(v) for k, v in job.items()}, on_event=events.append)
+
+            self.assertEqual(event['event'], 'done', event.get('traceback'))
+            self.assertEqual([e['event'] for e in events[:2]], ['queued', 'started'])
+            self.assertIn('sign element', [e['name'] for e in events if e['event'] == 'stage'])
+            self.assertEqual(event['result']['output'], output.as_posix())
+            with zipfile.ZipFile(output) as z:
+                self.assertIsNotNone(macho.MachO(z.read('Payload/Example.app/Example')).code_signature)
+
+            signer = session.signer('native', self.p12, 'secret', jobs=server.max_jobs)
+            self.assertEqual(submit_job(server.socket_path, {k: str(v) for k, v in job.items()})['event'], 'done')
+            self.assertIs(session.signer('native', self.p12, 'secret', jobs=server.max_jobs), signer)
+        finally:
+            server.shutdown()
+            thread.join(10)
+        self.assertFalse(server.socket_path.exists())
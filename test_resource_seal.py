@@ -0,0 +1,69 @@
+import hashlib
+import os
+import pathlib
+import plistlib
+import tempfile
+import unittest
+from unittest import mock
+
+import resource_seal
+from resource_seal import ResourceSealer, digest_scope
+
+
+class TestResourceSeal (unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmpdir.name)
+        self.app = self.root.joinpath('Example.app')
+        self.app.joinpath('en.lproj').mkdir(parents=True)
+        self.app.joinpath('_CodeSignature').mkdir()
+        self.app.joinpath('Example').write_bytes(b'executable')
+        self.app.joinpath('Info.plist').write_bytes(b'<plist/>')
+        self.app.joinpath('Assets.car').write_bytes(b'assets' * 1000)
+        self.app.joinpath('en.lproj', 'Localizable.strings').write_bytes(b'"a" = "b";')
+        self.app.joinpath('en.lproj', 'locversion.plist').write_bytes(b'<plist/>')
+        self.app.joinpath('.DS_Store').write_bytes(b'finder')
+        os.link(self.app.joinpath('Assets.car'), self.app.joinpath('Copy.car'))
+        os.symlink('Assets.car', self.app.joinpath('Alias.car'))
+        self.sealer = ResourceSealer(workers=2)
+
+    def tearDown(self) -> None:
+        self.sealer.close()
+        self.tmpdir.cleanup()
+
+    def test_seal_applies_standard_rules(self):
+        seal = plistlib.loads(self.sealer.seal(self.app, 'Example'))
+        self.assertEqual(seal, plistlib.loads(self.app.joinpath('_CodeSignature', 'CodeResources').read_bytes()))
+        files, files2 = seal['files'], seal['files2']
+
+        assets = self.app.joinpath('Assets.car').read_bytes()
+        self.assertEqual(files['Assets.car'], hashlib.sha1(assets).digest())
+        self.assertEqual(files2['Assets.car'], {'hash': hashlib.sha1(assets).digest(),
+                                                'hash2': hashlib.sha256(assets).digest()})
+        self.assertEqual(files['en.lproj/Localizable.strings']['optional'], True)
+        self.assertEqual(files2['en.lproj/Localizable.strings']['optional'], True)
+        self.assertEqual(files2['Alias.car'], {'symlink': 'Assets.car'})
+
+        self.assertIn('Info.plist', files)
+        self.assertNotIn('Info.plist', files2)
+        for omitted in ['Example', 'en.lproj/locversion.plist']:
+            self.assertNotIn(omitted, files)
+            self.assertNotIn(omitted, files2)
+        self.assertNotIn('.DS_Store', files2)
+        self.assertFalse(any(name.startswith('_CodeSignature') for name in files))
+
+    def test_hard_linked_files_are_hashed_once(self):
+        with digest_scope() as cache:
+            self.sealer.seal(self.app, 'Example')
+            self.assertEqual(cache.hits, 1)
+            self.sealer.seal(self.app, 'Example')
+            self.assertEqual(cache.hits, 1 + 5)
+
+    def test_digests_do_not_outlive_their_scope(self):
+        with mock.patch.object(resource_seal, 'file_digests', wraps=resource_seal.file_digests) as file_digests:
+            self.sealer.seal(self.app, 'Example')
+            self.sealer.seal(self.app, 'Example')
+            self.assertEqual(file_digests.call_count, 2 * 4)
+            with digest_scope():
+                self.sealer.seal(self.app, 'Example')
+            self.assertEqual(file_digests.call_count, 3 * 4)
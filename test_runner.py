@@ -0,0 +1,35 @@
+import sys
+import unittest
+
+import runner
+
+
+class TestRunner (unittest.TestCase):
+    def test_commands_are_attributed_to_stages_and_redacted(self):
+        profiler = runner.Profiler()
+        with profiler.activate(), runner.stage('sign element'):
+            output = runner.check_output([sys.executable, '-c', 'print("hello")', 'secret-password'],
+                                         secrets=['secret-password'])
+
+        self.assertEqual(output.strip(), b'hello')
+        self.assertEqual(len(profiler.commands), 1)
+        record = profiler.commands[0]
+        self.assertEqual(record.stage, 'sign element')
+        self.assertEqual(record.returncode, 0)
+        self.assertEqual(record.argv[-1], runner.REDACTED)
+        self.assertGreater(record.output_bytes, 0)
+        self.assertEqual(profiler.summary()['sign element']['commands'], 1)
+
+    def test_failed_commands_are_recorded(self):
+        profiler = runner.Profiler()
+        with profiler.activate(), self.assertRaises(Exception):
+            runner.run([sys.executable, '-c', 'raise SystemExit(3)'], check=True)
+        self.assertEqual(profiler.commands[0].returncode, 3)
+        self.assertEqual(profiler.commands[0].stage, None)
+
+    def test_chrome_trace_contains_stages_and_commands(self):
+        profiler = runner.Profiler()
+        with profiler.activate(), runner.stage('repack'):
+            runner.run([sys.executable, '-c', 'pass'], check=True)
+        categories = {event['cat'] for event in profiler.chrome_trace()['traceEvents']}
+        self.assertEqual(categories, {'stage', 'command'})
@@ -0,0 +1,104 @@
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from signing_cache import SigningCache
+
+
+class TestSigningCache (unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmpdir.name)
+        self.framework = self.root.joinpath('Example.framework')
+        self.framework.mkdir()
+        self.framework.joinpath('Example').write_bytes(b'unsigned binary')
+        self.framework.joinpath('Info.plist').write_bytes(b'<plist/>')
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_key_depends_on_contents_signer_and_entitlements(self):
+        key = SigningCache.key(self.framework, 'AAAA')
+        self.assertEqual(key, SigningCache.key(self.framework, 'AAAA'))
+        self.assertNotEqual(key, SigningCache.key(self.framework, 'BBBB'))
+        self.assertNotEqual(key, SigningCache.key(self.framework, 'AAAA', entitlements=b'<dict/>'))
+        self.framework.joinpath('Example').write_bytes(b'other binary')
+        self.assertNotEqual(key, SigningCache.key(self.framework, 'AAAA'))
+
+    def test_restore_replaces_element_with_signed_copy(self):
+        cache = SigningCache(self.root.joinpath('cache'))
+        key = SigningCache.key(self.framework, 'AAAA')
+        self.assertFalse(cache.restore(key, self.framework))
+
+        self.framework.joinpath('Example').write_bytes(b'signed binary')
+        cache.store(key, self.framework)
+        self.framework.joinpath('Example').write_bytes(b'unsigned binary')
+
+        self.assertTrue(cache.restore(key, self.framework))
+        self.assertEqual(self.framework.joinpath('Example').read_bytes(), b'signed binary')
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1})
+
+    def test_evicts_least_recently_used_entries(self):
+        cache = SigningCache(self.root.joinpath('cache'), max_bytes=40)
+        dylibs = []
+        for i in range(3):
+            dylib = self.root.joinpath('lib{}.dylib'.format(i))
+            dylib.write_bytes(bytes([i]) * 20)
+            dylibs.append(dylib)
+            cache.store(SigningCache.key(dylib, 'AAAA'), dylib)
+            entry = cache.entry_path(SigningCache.key(dylib, 'AAAA'))
+            os.utime(entry, (1000 + i, 1000 + i))
+
+        cache.evict()
+        self.assertFalse(cache.entry_path(SigningCache.key(dylibs[0], 'AAAA')).exists())
+        self.assertTrue(cache.entry_path(SigningCache.key(dylibs[2], 'AAAA')).exists())
+
+    def test_entries_being_restored_are_not_evicted(self):
+        cache = SigningCache(self.root.joinpath('cache'), max_bytes=0)
+        key = SigningCache.key(self.framework, 'AAAA')
+        with mock.patch.object(cache, 'evict'):
+            cache.store(key, self.framework)
+
+        copying = threading.Event()
+        evicted = threading.Event()
+        copytree = shutil.copytree
+
+        def slow_copytree(*args, **kwargs):
+            copying.set()
+            self.assertTrue(evicted.wait(5))
+            return copytree(*args, **kwargs)
+
+        def evict():
+            self.assertTrue(copying.wait(5))
+            cache.evict()
+            evicted.set()
+
+        thread = threading.Thread(target=evict)
+        thread.start()
+        with mock.patch('shutil.copytree', side_effect=slow_copytree):
+            self.assertTrue(cache.restore(key, self.framework))
+        thread.join(5)
+        self.assertTrue(cache.entry_path(key).exists())
+
+        cache.evict()
+        self.assertFalse(cache.entry_path(key).exists())
+
+    def test_entry_removed_during_restore_is_a_miss(self):
+        cache = SigningCache(self.root.joinpath('cache'))
+        key = SigningCache.key(self.framework, 'AAAA')
+        cache.store(key, self.framework)
+
+        def evicted_by_other_process(source, destination, **kwargs):
+            os.mkdir(destination)
+            shutil.rmtree(source)
+            raise shutil.Error([(source, destination, 'No such file or directory')])
+
+        with mock.patch('shutil.copytree', side_effect=evicted_by_other_process):
+            self.assertFalse(cache.restore(key, self.framework))
+        self.assertEqual(self.framework.joinpath('Example').read_bytes(), b'unsigned binary')
+        self.assertEqual([p.name for p in self.root.iterdir() if p.name.startswith('.restore-')], [])
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 1})
@@ -0,0 +1,56 @@
+import pathlib
+import threading
+import time
+import unittest
+
+from signing_scheduler import SigningScheduler
+
+
+class TestSigningScheduler (unittest.TestCase):
+    def setUp(self) -> None:
+        root = pathlib.Path('/tmp/Payload/Example.app')
+        self.app = root
+        self.framework = root.joinpath('Frameworks', 'Example.framework')
+        self.framework_dylib = self.framework.joinpath('libs', 'libnested.dylib')
+        self.dylib = root.joinpath('Frameworks', 'libswiftCore.dylib')
+        self.appex = root.joinpath('PlugIns', 'Widget.appex')
+        self.appex_framework = self.appex.joinpath('Frameworks', 'WidgetKit.framework')
+        self.paths = [self.app, self.framework, self.framework_dylib, self.dylib, self.appex, self.appex_framework]
+
+    def test_order_signs_children_before_containers(self):
+        scheduler = SigningScheduler(jobs=1)
+        scheduler.extend(self.paths)
+        order = scheduler.order()
+        self.assertEqual(len(order), len(self.paths))
+        self.assertLess(order.index(self.framework_dylib), order.index(self.framework))
+        self.assertLess(order.index(self.appex_framework), order.index(self.appex))
+        self.assertEqual(order[-1], self.app)
+
+    def test_parallel_run_waits_for_children(self):
+        scheduler = SigningScheduler(jobs=4)
+        scheduler.extend(self.paths)
+        lock = threading.Lock()
+        finished = set()
+
+        def sign(path):
+            time.sleep(0.01)
+            for child in self.paths:
+                if child != path and path in child.parents:
+                    self.assertIn(child, finished)
+            with lock:
+                finished.add(path)
+
+        signed = scheduler.run(sign)
+        self.assertEqual(set(signed), set(self.paths))
+        self.assertEqual(signed[-1], self.app)
+
+    def test_top_level_apps_are_signed_last(self):
+        standalone = pathlib.Path('/tmp/Payload/Standalone.framework')
+        scheduler = SigningScheduler(jobs=4)
+        scheduler.extend([self.app, self.dylib, standalone])
+        signed = scheduler.run(lambda path: time.sleep(0.01 if path == standalone else 0))
+        self.assertEqual(signed[-1], self.app)
+
+    def test_rejects_zero_workers(self):
+        with self.assertRaises(Exception):
+            SigningScheduler(jobs=0)
@@ -0,0 +1,38 @@
+import os
+import pathlib
+import tempfile
+import unittest
+
+import staging
+
+
+class TestStaging (unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmpdir.name)
+        self.app = self.root.joinpath('Example.app')
+        self.app.joinpath('Frameworks').mkdir(parents=True)
+        self.app.joinpath('Example').write_bytes(b'\xcf\xfa\xed\xfe' + b'\x00' * 64)
+        self.app.joinpath('Frameworks', 'libswiftCore.dylib').write_bytes(b'\xcf\xfa\xed\xfe')
+        self.app.joinpath('Assets.car').write_bytes(b'assets')
+        os.symlink('Assets.car', self.app.joinpath('Alias.car'))
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_stage_tree_links_resources_and_clones_binaries(self):
+        destination = self.root.joinpath('Resigned.app')
+        staged = staging.staging_dir_beside(destination).joinpath('app')
+        staging.stage_tree(self.app, staged)
+
+        self.assertTrue(os.path.samefile(staged.joinpath('Assets.car'), self.app.joinpath('Assets.car')))
+        self.assertFalse(os.path.samefile(staged.joinpath('Example'), self.app.joinpath('Example')))
+        self.assertFalse(os.path.samefile(staged.joinpath('Frameworks', 'libswiftCore.dylib'),
+                                          self.app.joinpath('Frameworks', 'libswiftCore.dylib')))
+        self.assertEqual(os.readlink(staged.joinpath('Alias.car')), 'Assets.car')
+
+        staged.joinpath('Example').write_bytes(b'signed')
+        self.assertEqual(self.app.joinpath('Example').read_bytes()[:4], b'\xcf\xfa\xed\xfe')
+
+        staging.commit(staged, destination)
+        self.assertEqual(destination.joinpath('Example').read_bytes(), b'signed')
@@ -0,0 +1,82 @@
+import os
+import pathlib
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from toolchain import Toolchain
+
+FAKE_XCRUN = '''#!{python}
+import pathlib, sys
+root = pathlib.Path({root!r})
+with open(root.joinpath('xcrun.log'), 'a') as log:
+    log.write(' '.join(sys.argv[1:]) + '\\n')
+print(root.joinpath('bin', sys.argv[-1]))
+'''
+
+
+class TestToolchain (unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.tmpdir.name)
+        self.root.joinpath('bin').mkdir()
+        self.root.joinpath('bin', 'codesign').write_text('codesign')
+        self.xcrun = self.root.joinpath('xcrun')
+        self.xcrun.write_text(FAKE_XCRUN.format(python=sys.executable, root=self.root.as_posix()))
+        self.xcrun.chmod(0o755)
+        self.cache_path = self.root.joinpath('toolchain.json')
+
+        environment = {key: value for key, value in os.environ.items()
+                       if not key.startswith('IRESIGN_TOOL_') and key != 'DEVELOPER_DIR'}
+        environment['IRESIGN_TOOL_XCRUN'] = self.xcrun.as_posix()
+        environment['IRESIGN_TOOLCHAIN_CACHE'] = ''
+        patches = [mock.patch.dict(os.environ, environment, clear=True),
+                   mock.patch.object(Toolchain, 'xcode_select_path', return_value='')]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def xcrun_calls(self):
+        log = self.root.joinpath('xcrun.log')
+        return log.read_text().splitlines() if log.is_file() else []
+
+    def test_override_beats_environment_beats_xcrun(self):
+        codesign = self.root.joinpath('bin', 'codesign').as_posix()
+        toolchain = Toolchain(cache_path=self.cache_path)
+        self.assertEqual(toolchain.find('codesign'), codesign)
+
+        os.environ['IRESIGN_TOOL_CODESIGN'] = '/env/codesign'
+        self.assertEqual(Toolchain(cache_path=self.cache_path).find('codesign'), '/env/codesign')
+
+        toolchain = Toolchain(cache_path=self.cache_path)
+        toolchain.override_from_spec('codesign=/override/codesign')
+        self.assertEqual(toolchain.find('codesign'), '/override/codesign')
+        self.assertEqual(self.xcrun_calls(), ['--find codesign'])
+
+    def test_resolved_paths_are_cached_in_process_and_on_disk(self):
+        Toolchain().find('codesign')
+        toolchain = Toolchain()
+        toolchain.find('codesign')
+        toolchain.find('codesign')
+        self.assertEqual(len(self.xcrun_calls()), 2)
+
+        Toolchain(cache_path=self.cache_path).find('codesign')
+        Toolchain(cache_path=self.cache_path).find('codesign')
+        self.assertEqual(len(self.xcrun_calls()), 3)
+
+    def test_disk_cache_is_keyed_by_developer_dir(self):
+        Toolchain(cache_path=self.cache_path).find('codesign')
+        os.environ['DEVELOPER_DIR'] = '/Applications/Xcode-beta.app/Contents/Developer'
+        Toolchain(cache_path=self.cache_path).find('codesign')
+        Toolchain(cache_path=self.cache_path).find('codesign')
+        self.assertEqual(len(self.xcrun_calls()), 2)
+
+    def test_stale_cached_paths_are_resolved_again(self):
+        Toolchain(cache_path=self.cache_path).find('codesign')
+        self.root.joinpath('bin', 'codesign').unlink()
+        Toolchain(cache_path=self.cache_path).find('codesign')
+        self.assertEqual(len(self.xcrun_calls()), 2)
@@ -0,0 +1,134 @@
+import json
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+import threading
+
+import runner
+
+
+class Toolchain:
+    XCODE_SELECT_LINK = '/var/db/xcode_select_link'
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, overrides=None, cache_path=None):
+        self.overrides = dict(overrides or {})
+        if cache_path is None:
+            cache_path = Toolchain.default_cache_path()
+        self.cache_path = pathlib.Path(cache_path) if cache_path else None
+        self.resolved = {}
+        self.lock = threading.Lock()
+        self._cache_key = None
+
+    @staticmethod
+    def default():
+        with Toolchain._default_lock:
+            if Toolchain._default is None:
+                Toolchain._default = Toolchain()
+            return Toolchain._default
+
+    @staticmethod
+    def default_cache_path():
+        cache_path = os.environ.get('IRESIGN_TOOLCHAIN_CACHE')
+        if cache_path is not None:
+            return cache_path
+        cache_home = os.environ.get('XDG_CACHE_HOME') or pathlib.Path.home().joinpath('.cache')
+        return pathlib.Path(cache_home).joinpath('iresign', 'toolchain.json')
+
+    @staticmethod
+    def environment_variable(tool):
+        return 'IRESIGN_TOOL_' + tool.upper().replace('-', '_')
+
+    def override(self, tool, path):
+        with self.lock:
+            self.overrides[tool] = str(path)
+            self.resolved.pop(tool, None)
+
+    def override_from_spec(self, spec):
+        tool, separator, path = spec.partition('=')
+        if not separator or not tool or not path:
+            raise Exception('Tool override {} is not of the form NAME=PATH'.format(spec))
+        self.override(tool, path)
+
+    def xcrun(self):
+        return self.explicit_path('xcrun') or 'xcrun'
+
+    def explicit_path(self, tool):
+        if tool in self.overrides:
+            return self.overrides[tool]
+        return os.environ.get(Toolchain.environment_variable(tool))
+
+    def xcode_select_path(self):
+        try:
+            return os.readlink(Toolchain.XCODE_SELECT_LINK)
+        except OSError:
+            pass
+        if shutil.which('xcode-select'):
+            return runner.check_output(['xcode-select', '-p']).decode(sys.stdout.encoding).strip()
+        return ''
+
+    def cache_key(self):
+        if self._cache_key is None:
+            developer_dir = os.environ.get('DEVELOPER_DIR', '')
+            self._cache_key = developer_dir + ':' + self.xcode_select_path()
+        return self._cache_key
+
+    def load_cache(self):
+        if not self.cache_path or not self.cache_path.is_file():
+            return {}
+        try:
+            with open(self.cache_path, 'r') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return cache if isinstance(cache, dict) else {}
+
+    def store_cache(self, name, value):
+        if not self.cache_path:
+            return
+        cache = self.load_cache()
+        cache.setdefault(self.cache_key(), {})[name] = value
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(prefix='.toolchain-', dir=self.cache_path.parent)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(cache, f, indent=2, sort_keys=True)
+            os.replace(temp_path, self.cache_path)
+        except OSError:
+            pass
+
+    def lookup(self, name, resolve):
+        with self.lock:
+            if name in self.resolved:
+                return self.resolved[name]
+
+            cached = self.load_cache().get(self.cache_key(), {}).get(name)
+            if cached and os.path.exists(cached):
+                value = cached
+            else:
+                value = resolve()
+                self.store_cache(name, value)
+
+            self.resolved[name] = value
+            return value
+
+    def find(self, tool):
+        explicit = self.explicit_path(tool)
+        if explicit:
+            return explicit
+
+        def resolve():
+            return runner.check_output([self.xcrun(), '--find', tool]).decode(sys.stdout.encoding).strip()
+
+        return self.lookup(tool, resolve)
+
+    def sdk_platform_path(self, platform):
+        def resolve():
+            sdk_cmd = [self.xcrun(), '--sdk', platform, '--show-sdk-platform-path']
+            return runner.check_output(sdk_cmd).decode(sys.stdout.encoding).strip()
+
+        return self.lookup('sdk-platform-path:' + platform, resolve)